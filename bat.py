@@ -1,5 +1,7 @@
 import cadquery as cq
 from math import atan2, degrees, radians
+from cache import memoize
+from booleans import union_all
 
 def make_battery(type='10280', xOffset=0, yOffset=0, zOffset=0):
     battery_types = {
@@ -81,6 +83,7 @@ def make_battery_clip():
 
 #show_object(make_battery_clip(), name='clip')
 
+@memoize(disk=True)
 def make_battery_holder(with_battery=True):
     clips = make_battery_clip()
     clips = (clips.union(
@@ -92,13 +95,13 @@ def make_battery_holder(with_battery=True):
         # PCB
         .rect(5.5, 37).extrude(0.6)
     )
-    clips = clips.union(pcb)
+    parts = [pcb]
     if with_battery:
         battery = (make_battery('10280')
             .translate((-14,0,6.55 + 0.6))
             .rotate((0,0,0),(0,0,1),90)
         )
-        clips = clips.union(battery)
-    return clips
+        parts.append(battery)
+    return union_all(clips, parts)
 
 #show_object(make_battery_holder(), name='battery-holder')
@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Regeneration benchmark for the case parts.
+#
+# Each repetition builds a script in a fresh process, either "cold" (with
+# an empty build cache, as on a clean checkout) or "warm" (with the cache
+# left over from a previous run), and records the build time and face
+# count of each part plus the peak RSS of the process.  Results are
+# written as JSON and compared against a stored baseline, so a slow
+# geometry change shows up as a number.  A script which fails to build (eg
+# gotchi.py without Watchy.step) is reported with the end of its error
+# output, and the others are still benchmarked.
+#
+#   python bench.py -n 5                  # compare with bench_baseline.json
+#   python bench.py -n 5 --save-baseline  # ...or replace it
+
+ERROR_LINES = 5 # of a failed build's stderr, to say why
+
+# script -> parts we care about
+PARTS = {
+    'casemod.py': ['top', 'bottom'],
+    'gotchi.py': ['case2', 'top_plate'],
+    'button.py': ['button'],
+    'mag.py': ['mag'],
+}
+
+def child(script):
+    # runs in the benchmark subprocess; report on the last line of stdout
+    import resource
+    start = time.perf_counter()
+    import cadquery as cq
+    import build
+    from cache import as_shape
+    import_time = time.perf_counter() - start
+    parts = {}
+    for name, obj, seconds in build.run_script(script):
+        # every shape shown, not just the first of a Workplane's
+        shape = as_shape(obj)
+        faces = len(shape.Faces()) if isinstance(shape, cq.Shape) else 0
+        parts[name] = {'seconds': seconds, 'faces': faces}
+    print(json.dumps({
+        'import_seconds': import_time,
+        'total_seconds': time.perf_counter() - start,
+        'peak_rss_mb': resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'parts': parts,
+    }))
+
+def run_child(script, cache_dir):
+    # the child's report, or None (having said why) if the build failed
+    env = dict(os.environ, WATCHY_CACHE_DIR=cache_dir)
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child',
+         os.path.abspath(script)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if out.returncode == 0:
+        try:
+            return json.loads(out.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            pass
+    print('FAILED %s (exit status %d)' % (script, out.returncode),
+          file=sys.stderr)
+    for line in out.stderr.strip().splitlines()[-ERROR_LINES:]:
+        print('    %s' % line, file=sys.stderr)
+    return None
+
+def percentile(values, p):
+    # nearest rank, which is all a handful of repetitions can support
+    values = sorted(values)
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+def summarize(runs, key):
+    values = [key(r) for r in runs]
+    return {'median': percentile(values, 50), 'p95': percentile(values, 95),
+            'min': min(values), 'max': max(values)}
+
+def bench(scripts, reps):
+    # results, and the scripts which failed to build
+    results = {}
+    failed = []
+    for script in scripts:
+        runs = {'cold': [], 'warm': []}
+        with tempfile.TemporaryDirectory() as warm_dir:
+            # fill the warm cache; if that fails, so would every run
+            if run_child(script, warm_dir) is None:
+                failed.append(script)
+                continue
+            for i in range(reps):
+                with tempfile.TemporaryDirectory() as cold_dir:
+                    runs['cold'].append(run_child(script, cold_dir))
+                runs['warm'].append(run_child(script, warm_dir))
+        for mode, mode_runs in runs.items():
+            mode_runs = [r for r in mode_runs if r is not None]
+            if not mode_runs:
+                failed.append('%s (%s)' % (script, mode))
+                continue
+            entry = {
+                'total_seconds': summarize(
+                    mode_runs, lambda r: r['total_seconds']),
+                'peak_rss_mb': summarize(
+                    mode_runs, lambda r: r['peak_rss_mb']),
+                'parts': {},
+            }
+            for part in PARTS.get(os.path.basename(script), []):
+                if part not in mode_runs[-1]['parts']:
+                    continue
+                entry['parts'][part] = {
+                    'seconds': summarize(
+                        mode_runs, lambda r: r['parts'][part]['seconds']),
+                    'faces': mode_runs[-1]['parts'][part]['faces'],
+                }
+            results['%s:%s' % (os.path.basename(script), mode)] = entry
+    return results, failed
+
+def compare(results, baseline, threshold, min_delta):
+    # returns a list of regressions (slower by more than threshold and by
+    # at least min_delta seconds, a changed face count, or a part no longer
+    # built) against the baseline
+    problems = []
+    for run, entry in results.items():
+        old = baseline.get(run)
+        if old is None:
+            continue
+        items = [('total', entry['total_seconds'], old['total_seconds'],
+                  None, None)]
+        for part, p in entry['parts'].items():
+            if part in old['parts']:
+                o = old['parts'][part]
+                items.append((part, p['seconds'], o['seconds'],
+                              p['faces'], o['faces']))
+        for part in old['parts']:
+            if part not in entry['parts']:
+                problems.append('%s %s: not built' % (run, part))
+        for name, new, prev, faces, old_faces in items:
+            ratio = new['median'] / max(prev['median'], 1e-6)
+            if ratio > 1 + threshold and \
+               new['median'] - prev['median'] >= min_delta:
+                problems.append('%s %s: %.2fs -> %.2fs (%+.0f%%)' % (
+                    run, name, prev['median'], new['median'],
+                    100 * (ratio - 1)))
+            if faces != old_faces:
+                problems.append('%s %s: %d -> %d faces' % (
+                    run, name, old_faces, faces))
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark cold and warm regeneration of the case parts.')
+    parser.add_argument('scripts', nargs='*', metavar='script.py',
+                        help='scripts to benchmark (default: %s)'
+                        % ' '.join(PARTS))
+    parser.add_argument('-n', '--reps', type=int, default=3,
+                        help='repetitions per mode (default: 3)')
+    parser.add_argument('-o', '--output', default='build/bench.json',
+                        help='where to write results (default: build/bench.json)')
+    parser.add_argument('--baseline', default='bench_baseline.json',
+                        help='baseline to compare against '
+                        '(default: bench_baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown before flagging a regression '
+                        '(default: 0.2, ie 20%%)')
+    parser.add_argument('--min-delta', type=float, default=0.1,
+                        help='ignore slowdowns smaller than this many '
+                        'seconds (default: 0.1)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return child(args.child)
+
+    results, failed = bench(args.scripts or list(PARTS), args.reps)
+    for run, entry in results.items():
+        t = entry['total_seconds']
+        print('%-20s %7.2fs median %7.2fs p95 %7.0f MB peak' % (
+            run, t['median'], t['p95'], entry['peak_rss_mb']['max']))
+        for part, p in entry['parts'].items():
+            print('  %-18s %7.2fs median %7.2fs p95 %7d faces' % (
+                part, p['seconds']['median'], p['seconds']['p95'],
+                p['faces']))
+    for script in failed:
+        print('FAILED', script)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        return 1 if failed else 0
+    if not os.path.exists(args.baseline):
+        print('no baseline in %s; use --save-baseline to create one'
+              % args.baseline)
+        return 1 if failed else 0
+    with open(args.baseline) as f:
+        problems = compare(results, json.load(f), args.threshold,
+                           args.min_delta)
+    for p in problems:
+        print('REGRESSION', p)
+    return 1 if problems or failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
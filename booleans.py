@@ -0,0 +1,119 @@
+import cadquery as cq
+import os
+import sys
+import time
+
+# Batched booleans.
+#
+# A chain of .cut(a).cut(b).cut(c) runs one boolean per tool, and each of
+# them intersects every face of the target (hundreds, by the last cuts of
+# a case) with its tool.  cut_all() cuts a Workplane's solid with all the
+# tools at once, as one multi-argument boolean: the target's faces are
+# only split once, and OCCT intersects the pairs of shapes in parallel
+# (cadquery turns its parallel mode on for every boolean).  union_all()
+# does the same for a chain of unions.  Tools whose faces nearly, but not
+# exactly, meet the target's can be given a fuzzy tolerance.  Both return
+# a Workplane, so a chain can carry on from them.
+#
+#   case2 = cut_all(case2, [aux_pcbs, pcb_cutout, screw_holes])
+#
+# The tools are intersected with each other as well, so batch tools which
+# are apart: the magnet and the clearance shell around it share all their
+# faces, and cutting both at once is slower than one after the other.
+# Cuts made from the chain's own sketches (cutBlind, cutThruAll) have to
+# be extruded as tools first to join a batch; see thru_all().
+#
+# With WATCHY_BOOLEANS=compare in the environment (or `build.py
+# --booleans`) each batched boolean also runs the sequential chain it
+# replaces, and report() shows the time saved and that both give the
+# same volume.
+
+COMPARE = os.environ.get('WATCHY_BOOLEANS', '') not in ('', '0')
+
+records = [] # (op, line, tools, seconds, chain seconds, volume difference)
+
+def _caller():
+    # script line the batched boolean was called from
+    f = sys._getframe(1)
+    while f is not None and f.f_globals.get('__name__') == __name__:
+        f = f.f_back
+    if f is None:
+        return '?'
+    return '%s:%s:%d' % (f.f_code.co_filename.rsplit('/', 1)[-1],
+                         f.f_code.co_name, f.f_lineno)
+
+def _batch(op, target, tools, clean, **kwargs):
+    # target op all of tools, as one boolean; with COMPARE, also as the
+    # chain of one boolean per tool it replaces
+    start = time.perf_counter()
+    result = getattr(target, op)(*tools, **kwargs)
+    if clean:
+        result = result.clean()
+    seconds = time.perf_counter() - start
+    if COMPARE:
+        start = time.perf_counter()
+        chain = target
+        for tool in tools:
+            chain = getattr(chain, op)(tool, **kwargs)
+            if clean:
+                chain = chain.clean()
+        records.append((op, _caller(), len(tools), seconds,
+                        time.perf_counter() - start,
+                        abs(result.Volume() - chain.Volume())))
+    return result
+
+def _shapes(objs, solids):
+    # the shapes of a list of Workplanes and shapes; just the solids of
+    # the Workplanes, if solids
+    shapes = []
+    for obj in objs:
+        if isinstance(obj, cq.Workplane):
+            obj = obj.solids() if solids else obj
+            shapes += [v for v in obj.vals() if isinstance(v, cq.Shape)]
+        else:
+            shapes.append(obj)
+    return shapes
+
+def cut_all(wp, tools, clean=True, tol=None):
+    # wp's solid with every one of tools (Workplanes or shapes) cut out
+    solid = wp.findSolid(searchStack=True, searchParents=True)
+    tools = _shapes(tools, False)
+    if not tools:
+        return wp.newObject([solid])
+    return wp.newObject([_batch('cut', solid, tools, clean, tol=tol)])
+
+def union_all(wp, tools, clean=True, glue=False, tol=None):
+    # wp's solid joined with the solids of every one of tools
+    solid = wp.findSolid(searchStack=True, searchParents=True)
+    tools = _shapes(tools, True)
+    if not tools:
+        return wp.newObject([solid])
+    return wp.newObject([_batch('fuse', solid, tools, clean, glue=glue,
+                                tol=tol)])
+
+def thru_all(obj):
+    # extrude distance which goes right through obj from a workplane on
+    # it, for tools that replace cutThruAll(): extrude(both=True) that far
+    return obj.findSolid().BoundingBox().DiagonalLength
+
+def report():
+    # one line per call site, most time saved first
+    totals = {}
+    for op, line, tools, seconds, chain, dvol in records:
+        t = totals.setdefault((op, line), [0, tools, 0.0, 0.0, 0.0])
+        t[0] += 1
+        t[2] += seconds
+        t[3] += chain
+        t[4] = max(t[4], dvol)
+    lines = ['%5s %5s %8s %8s %8s %9s  %-4s %s' % (
+        'calls', 'tools', 'batched', 'chain', 'saved', 'dvolume', 'op', 'line')]
+    for (op, line), (calls, tools, seconds, chain, dvol) in sorted(
+            totals.items(), key=lambda kv: kv[1][2] - kv[1][3]):
+        lines.append('%5d %5d %8.3f %8.3f %8.3f %9.2g  %-4s %s' % (
+            calls, tools, seconds, chain, chain - seconds, dvol, op, line))
+    seconds = sum(r[3] for r in records)
+    chain = sum(r[4] for r in records)
+    lines.append('%11s %8.3f %8.3f %8.3f  (%.0f%%)' % (
+        '', seconds, chain, chain - seconds,
+        100 * (chain - seconds) / (chain or 1)))
+    return '\n'.join(lines)
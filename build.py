@@ -0,0 +1,410 @@
+import argparse
+import ast
+import ctypes
+import gc
+import multiprocessing
+import os
+import resource
+import runpy
+import sys
+import time
+
+from quality import DEFAULT_QUALITY, QUALITY
+
+# Headless build driver.  The design scripts are written for CQ-editor,
+# which provides a global show_object(); here we run them with a
+# show_object() that just collects the named objects, then export each
+# one.  All scripts named on the command line run in this one process,
+# so cadquery is only imported once and STEP models shared between
+# scripts are only loaded once (see cache.import_step).
+#
+#   python build.py casemod.py gotchi.py -o build -f step,stl,3mf
+#
+# Scripts which define a `parts` table (name -> function building it)
+# can also be built in parallel with -j: the script is run once as a
+# plain module, which computes the reference values all the parts share,
+# and then each part is built in a forked worker which sends the result
+# back as a BREP.
+#
+# With --compact, each part is kept as a bare shape as soon as it's shown,
+# without the Workplane chain it came out of (every intermediate and tag
+# along the way), and once a script's parts are exported everything it
+# built is let go: its globals, the graph's intermediates, memoized parts
+# and the imported STEP models.  Many scripts (or variants of one) can then
+# be built in one process with the memory of building one.  It only saves
+# memory: the parts come out the same either way.
+#
+# Exports of parts whose geometry is the same as last time are left alone
+# (see fingerprints.py), and parts which changed are listed with how;
+# --check only compares, and --force writes everything.
+
+EXPORT_FORMATS = ['step', 'stl', '3mf']
+MESH_FORMATS = ['stl', '3mf'] # tessellated, see tessellate.py
+
+class Collector:
+    def __init__(self, compact=False):
+        self.objects = [] # (name, object, seconds spent building it)
+        self.script = {} # globals of the script, once it has run
+        self.compact = compact
+        self.changed = {} # part -> how it changed since the last build
+        self.last = time.perf_counter()
+
+    def show_object(self, obj, name=None, options=None, **kwargs):
+        now = time.perf_counter()
+        if name is None:
+            name = 'object%d' % (len(self.objects) + 1)
+        if self.compact:
+            # keep the bare shape, not the Workplane chain (with all its
+            # tagged intermediates) it came out of
+            from cache import as_shape
+            obj = as_shape(obj)
+        # the geometry was built by the script just before show_object
+        # was called, so charge the time since the previous call to it
+        self.objects.append((name, obj, now - self.last))
+        self.last = now
+
+    def debug(self, obj, name=None, **kwargs):
+        self.last = time.perf_counter()
+
+class script_dir:
+    # scripts open their STEP files and import their helpers relative
+    # to their own directory
+    def __init__(self, path):
+        self.dir = os.path.dirname(os.path.abspath(path))
+
+    def __enter__(self):
+        self.old_cwd = os.getcwd()
+        os.chdir(self.dir)
+        sys.path.insert(0, self.dir)
+
+    def __exit__(self, *exc):
+        sys.path.remove(self.dir)
+        os.chdir(self.old_cwd)
+
+def memory():
+    # (current, peak) resident size of this process in MB; current is None
+    # where /proc isn't there to ask
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak /= 2**20 if sys.platform == 'darwin' else 2**10
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        current /= 2**20
+    except OSError:
+        current = None
+    return current, peak
+
+def release(collector):
+    # let go of everything a script built once its parts are exported
+    import cache
+    graph = collector.script.get('graph')
+    if graph is not None:
+        graph.release()
+    collector.script = {k: collector.script[k] for k in ('colors', 'graph')
+                        if k in collector.script}
+    collector.objects = []
+    cache.release()
+    gc.collect()
+    try:
+        # glibc holds on to freed memory unless asked to hand it back
+        ctypes.CDLL(None).malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def run_script(path, collector=None):
+    if collector is None:
+        collector = Collector()
+    path = os.path.abspath(path)
+    with script_dir(path):
+        collector.last = time.perf_counter()
+        collector.script = runpy.run_path(
+            path, run_name='__cq_main__', init_globals={
+                'show_object': collector.show_object,
+                'debug': collector.debug,
+            })
+    return collector.objects
+
+def load_script(path):
+    # run the script without a show_object, so it only sets things up
+    path = os.path.abspath(path)
+    with script_dir(path):
+        return runpy.run_path(
+            path, run_name=os.path.splitext(os.path.basename(path))[0])
+
+def defines_parts(path):
+    # whether the script has a `parts` table, found without running it: a
+    # plain CQ-editor script calls show_object() as it goes, which only
+    # run_script() provides
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        targets = node.targets if isinstance(node, ast.Assign) else \
+            [node.target] if isinstance(node, ast.AnnAssign) else []
+        if any(isinstance(t, ast.Name) and t.id == 'parts' for t in targets):
+            return True
+    return False
+
+_parts = None # part table of the script being built, inherited by workers
+
+def _build_part(name):
+    from cache import to_brep
+    start = time.perf_counter()
+    obj = _parts[name]()
+    return name, to_brep(obj), time.perf_counter() - start
+
+def build_parallel(path, jobs, collector=None):
+    global _parts
+    import cadquery as cq
+    from cache import from_brep
+    path = os.path.abspath(path)
+    if not defines_parts(path):
+        return run_script(path, collector)
+    script = load_script(path)
+    if collector is not None:
+        collector.script = script
+    _parts = script['parts']
+    built = {}
+    with script_dir(path):
+        # workers must be forked so they share the parent's reference values
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(min(jobs, len(_parts))) as pool:
+            for name, data, seconds in pool.imap_unordered(
+                    _build_part, list(_parts)):
+                built[name] = (cq.Workplane(from_brep(data)), seconds)
+    _parts = None
+    return [(name,) + built[name] for name in script['parts']]
+
+def export(obj, outdir, name, formats, quality=None, arrays=None):
+    # returns {format: (seconds, triangles or None)}; arrays is the
+    # tessellated obj, if that's been done already
+    import cadquery as cq
+    import tessellate
+    results = {}
+    for fmt in formats:
+        fname = os.path.join(outdir, '%s.%s' % (name, fmt))
+        # written under another name and then renamed, so that a viewer
+        # reloading the file never sees half of it
+        tmp = os.path.join(outdir, '.%s.%d.%s' % (name, os.getpid(), fmt))
+        start = time.perf_counter()
+        triangles = None
+        if fmt in MESH_FORMATS:
+            triangles = tessellate.export(
+                obj, tmp, quality or DEFAULT_QUALITY, arrays)
+        else:
+            cq.exporters.export(obj, tmp, exportType=fmt.upper())
+        os.replace(tmp, fname)
+        results[fmt] = (time.perf_counter() - start, triangles)
+    return results
+
+def add_options(parser):
+    # what to build and export, shared with watch.py
+    parser.add_argument('-o', '--outdir', default='build',
+                        help='directory for exported parts (default: build)')
+    parser.add_argument('-f', '--formats', default='step,stl',
+                        help='comma separated list of %s (default: step,stl)'
+                        % ','.join(EXPORT_FORMATS))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='build parts in this many worker processes')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show which cached intermediates were rebuilt')
+    parser.add_argument('--assembly', action='store_true',
+                        help='also write all the parts of each script, named '
+                        'and coloured, to one 3mf file (and one step file, '
+                        'if step is one of the formats)')
+    parser.add_argument('-q', '--quality', default=DEFAULT_QUALITY,
+                        choices=list(QUALITY),
+                        help='mesh quality for stl and 3mf (default: %s)'
+                        % DEFAULT_QUALITY)
+    parser.add_argument('--preview', action='store_true',
+                        help='skip cosmetic details and load reference '
+                        'models as boxes, for a quick look (see preview.py)')
+    parser.add_argument('--compact', action='store_true',
+                        help='keep parts as bare shapes, and free what each '
+                        'script built once it is exported, to save memory')
+    parser.add_argument('--force', action='store_true',
+                        help='export every part, even those whose geometry '
+                        'is the same as last time (see fingerprints.py)')
+    parser.add_argument('--check', action='store_true',
+                        help='export nothing, only report which parts '
+                        'changed since the last build (and fail if any did)')
+
+def check_options(parser, args):
+    # turns args.formats into a list; must be done before the scripts run
+    args.formats = [f for f in args.formats.lower().split(',') if f]
+    for fmt in args.formats:
+        if fmt not in EXPORT_FORMATS:
+            parser.error('unknown export format: %s' % fmt)
+    if args.preview:
+        # read by preview.py when the scripts import it
+        os.environ['WATCHY_PREVIEW'] = '1'
+
+def export_settings(fmt, quality):
+    # what an export depends on besides the geometry
+    return [fmt, quality if fmt in MESH_FORMATS else None]
+
+def build_script(script, args):
+    # build one script and export its parts, as set up by add_options()
+    import fingerprints
+    from cache import as_shape
+    formats = args.formats
+    prefix = os.path.splitext(os.path.basename(script))[0]
+    outdir = os.path.join(args.outdir, prefix)
+    os.makedirs(outdir, exist_ok=True)
+    script_start = time.perf_counter()
+    collector = Collector(args.compact)
+    if args.jobs > 1:
+        objects = build_parallel(script, args.jobs, collector)
+    else:
+        objects = run_script(script, collector)
+    # which exports are out of date: those of parts whose fingerprint
+    # changed, and any which were deleted or written differently
+    record = fingerprints.load(outdir)
+    plans = [] # (formats to write, fingerprint, part unchanged)
+    for name, obj, build_time in objects:
+        prints = fingerprints.fingerprint(as_shape(obj))
+        old = record['parts'].get(name)
+        if old is not None:
+            diff = fingerprints.changes(old, prints)
+            if diff:
+                collector.changed[name] = diff
+        same = old is not None and name not in collector.changed
+        todo = [] if args.check else [
+            fmt for fmt in formats if args.force or not same or
+            not fingerprints.fresh(
+                record, os.path.join(outdir, '%s.%s' % (name, fmt)),
+                export_settings(fmt, args.quality))]
+        plans.append((todo, prints, same))
+    meshes = [None] * len(objects)
+    wanted = [i for i, (todo, prints, same) in enumerate(plans)
+              if set(todo) & set(MESH_FORMATS)]
+    if args.jobs > 1 and wanted:
+        import tessellate
+        mesh_start = time.perf_counter()
+        for i, arrays in zip(wanted, tessellate.tessellate_many(
+                [objects[i][1] for i in wanted], args.quality, args.jobs)):
+            meshes[i] = arrays
+        print('%-10s %-14s %7.2fs tessellate' % (
+            prefix, '', time.perf_counter() - mesh_start))
+    for (name, obj, build_time), arrays, (todo, prints, same) in zip(
+            objects, meshes, plans):
+        results = export(obj, outdir, name, todo, args.quality, arrays)
+        print('%-10s %-14s %7.2fs build  %s' % (
+            prefix, name, build_time, '  '.join(
+                ('%6s %s' % ('same' if same else 'stale', f)
+                 if f not in results else
+                 '%6.2fs %s' % (results[f][0], f) +
+                 ('' if results[f][1] is None else
+                  ' (%d triangles)' % results[f][1]))
+                for f in formats)))
+        if name in collector.changed:
+            print('%-10s %-14s %7s CHANGED: %s' % (
+                prefix, name, '', ', '.join(collector.changed[name])))
+        if not same:
+            record['parts'][name] = prints
+            # its files in other formats (and the assemblies) are out of
+            # date too, even when they weren't asked for this time
+            for fname in ['%s.%s' % (name, fmt) for fmt in EXPORT_FORMATS] + \
+                    ['%s.step' % prefix, '%s.3mf' % prefix]:
+                record['files'].pop(fname, None)
+        for fmt in todo:
+            record['files']['%s.%s' % (name, fmt)] = fingerprints.stamp(
+                os.path.join(outdir, '%s.%s' % (name, fmt)),
+                export_settings(fmt, args.quality))
+    if args.assembly and not args.check:
+        import export3mf
+        import placement
+        colors = collector.script.get('colors', {})
+        # rewritten if any part, or how they're named and coloured, changed
+        unchanged = not args.force and all(same for todo, prints, same
+                                           in plans)
+        settings = [[name for name, obj, build_time in objects],
+                    [[name, str(c)] for name, c in sorted(colors.items())]]
+        assy = placement.assembly(
+            prefix, [(name, obj) for name, obj, build_time in objects],
+            colors)
+        fname = os.path.join(outdir, '%s.step' % prefix)
+        if 'step' in formats:
+            if unchanged and fingerprints.fresh(
+                    record, fname, export_settings('step', None) + settings):
+                print('%-10s %-14s %7s step assembly' % (prefix, '', 'same'))
+            else:
+                start = time.perf_counter()
+                assy.export(fname)
+                record['files'][os.path.basename(fname)] = \
+                    fingerprints.stamp(fname, export_settings('step', None) +
+                                       settings)
+                print('%-10s %-14s %7.2fs step assembly' % (
+                    prefix, '', time.perf_counter() - start))
+        fname = os.path.join(outdir, '%s.3mf' % prefix)
+        if unchanged and fingerprints.fresh(
+                record, fname, export_settings('3mf', args.quality) +
+                settings):
+            print('%-10s %-14s %7s 3mf assembly' % (prefix, '', 'same'))
+        else:
+            summary = export3mf.write(
+                fname, placement.leaves(assy), args.quality, args.jobs)
+            record['files'][os.path.basename(fname)] = fingerprints.stamp(
+                fname, export_settings('3mf', args.quality) + settings)
+            print('%-10s %-14s %7.2fs 3mf assembly (%d parts, %d meshes, '
+                  '%d triangles)' % (prefix, '', summary['seconds'],
+                  summary['parts'], summary['meshes'], summary['triangles']))
+    if not args.check:
+        fingerprints.save(outdir, record)
+    print('%-10s %-14s %7.2fs total' % (
+        prefix, '', time.perf_counter() - script_start))
+    graph = collector.script.get('graph')
+    if args.verbose and graph is not None and graph.log:
+        print(graph.report())
+    return collector
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build the case scripts without CQ-editor.')
+    parser.add_argument('scripts', nargs='+', metavar='script.py')
+    add_options(parser)
+    parser.add_argument('--profile', action='store_true',
+                        help='time each cadquery operation; writes '
+                        'profile.folded (for flamegraph.pl) to the outdir')
+    parser.add_argument('--booleans', action='store_true',
+                        help='also run each batched boolean as the chain it '
+                        'replaces, and show the time saved (see booleans.py)')
+    args = parser.parse_args(argv)
+    check_options(parser, args)
+    if args.profile and args.jobs > 1:
+        parser.error('--profile only works for single process builds')
+    if args.booleans and args.jobs > 1:
+        parser.error('--booleans only works for single process builds')
+    if args.booleans:
+        # read by booleans.py when the scripts import it
+        os.environ['WATCHY_BOOLEANS'] = 'compare'
+    if args.profile:
+        import cqprofile
+        cqprofile.enable()
+
+    start = time.perf_counter()
+    changed = False
+    for script in args.scripts:
+        collector = build_script(script, args)
+        changed = changed or bool(collector.changed)
+        if args.compact:
+            before = memory()[0]
+            release(collector)
+            after = memory()[0]
+            if after is not None:
+                print('%-10s %-14s %7s released %d MB (%d MB left)' % (
+                    os.path.splitext(os.path.basename(script))[0], '', '',
+                    before - after, after))
+    print('all scripts: %.2fs, peak memory %d MB' % (
+        time.perf_counter() - start, memory()[1]))
+    if args.booleans:
+        import booleans
+        print(booleans.report())
+    if args.profile:
+        cqprofile.disable()
+        print(cqprofile.report())
+        os.makedirs(args.outdir, exist_ok=True)
+        cqprofile.write_trace(os.path.join(args.outdir, 'profile.folded'))
+    return 1 if args.check and changed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,463 @@
+import argparse
+import io
+import time
+
+import numpy as np
+
+import stlio
+from store import cache_file, file_hash, read_entry, write_atomic
+
+# Bounding volume hierarchy over a triangle mesh, as flat NumPy arrays.
+#
+# Each node is split where the surface area heuristic says, that is to
+# keep the boxes of the two halves small as well as the number of
+# triangles in them: CAD meshes have long thin triangles, and halving
+# those at the median gives boxes which overlap so much that a ray ends
+# up visiting most of the tree.  Queries are answered for a batch at a
+# time, one level of the tree at a time: every (query, node) pair still
+# alive is tested against its box at once, pairs whose box is beyond the
+# best answer so far are dropped, and the pairs which reach a leaf are
+# expanded to (query, triangle) pairs and measured all together, so there
+# is no Python loop per query.
+#
+# A batch has no "nearest first" order to prune with, so rays are first
+# traced only a short way, and those which haven't hit anything are traced
+# again eight times as far, and so on: most rays (like the wall thickness
+# ones in thickness.py) stop in the first round after touching only a few
+# boxes near their origin.  Closest point queries start from the leaf
+# each point is in (or nearest to) instead.
+#
+#   tree = BVH(stlio.read('Watchy.stl')['vertices'])
+#   t, tri = tree.ray_cast(origins, directions)
+#   points, distances, tri = tree.closest(points)
+#   distances = tree.signed_distance(points) # negative inside
+#
+# The trees for the reference meshes are kept on disk (in the build
+# cache, keyed by a hash of the STL file), so they're only built once:
+#
+#   tree = index('Watchy_Battery.stl')
+#   python bvh.py Watchy.stl Watchy_Battery.stl \
+#       Sensirion_CO2_Sensors_SCD4x_STEP_file.stl
+#   python bvh.py build/casemod/top.stl --near build/casemod/scd40.stl
+
+LEAF_SIZE = 8 # triangles per leaf
+SAH_SIZE = 16 # smaller nodes are just split in half along their longest axis
+RAY_BATCH = 1 << 16 # rays traced at a time, to bound memory
+FIRST_REACH = 1 / 256 # of the mesh's size, for the first round of rays
+
+# not quite along any axis or diagonal, so counting crossings along it
+# doesn't hit the edges of axis aligned triangles exactly
+INSIDE_RAY = np.array([0.5212, 0.6418, 0.5627])
+
+# bump this if the saved arrays change
+INDEX_VERSION = 1
+ARRAYS = ['tris', 'order', 'lo', 'hi', 'first', 'count']
+
+def cross(a, b):
+    # np.cross, without its overhead on big arrays of 3-vectors
+    return np.stack([a[:, 1] * b[:, 2] - a[:, 2] * b[:, 1],
+                     a[:, 2] * b[:, 0] - a[:, 0] * b[:, 2],
+                     a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]], axis=1)
+
+def dot(a, b):
+    return np.einsum('ij,ij->i', a, b)
+
+def half_area(lo, hi):
+    e = hi - lo
+    return e[:, 0] * e[:, 1] + e[:, 1] * e[:, 2] + e[:, 2] * e[:, 0]
+
+def sah_split(lo, hi):
+    # cost of putting the first k boxes (for every k) in one child and the
+    # rest in the other
+    n = len(lo)
+    left = half_area(np.minimum.accumulate(lo)[:-1],
+                     np.maximum.accumulate(hi)[:-1])
+    right = half_area(np.minimum.accumulate(lo[::-1])[::-1][1:],
+                      np.maximum.accumulate(hi[::-1])[::-1][1:])
+    k = np.arange(1, n)
+    cost = left * k + right * (n - k)
+    i = np.argmin(cost)
+    return cost[i], i + 1
+
+def intersect(origins, directions, tris, eps=1e-12):
+    # Moller-Trumbore, pairwise; distance along each ray to its triangle,
+    # or inf where it misses
+    v0 = tris[:, 0]
+    e1 = tris[:, 1] - v0
+    e2 = tris[:, 2] - v0
+    p = cross(directions, e2)
+    det = dot(e1, p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv = 1 / det
+        s = origins - v0
+        u = dot(s, p) * inv
+        q = cross(s, e1)
+        v = dot(directions, q) * inv
+        t = dot(e2, q) * inv
+        hit = ((np.abs(det) > eps) & (u >= 0) & (v >= 0) & (u + v <= 1) &
+               (t >= 0))
+    return np.where(hit, t, np.inf)
+
+def closest_on_triangles(points, tris):
+    # pairwise closest point on each triangle to each point (Ericson's
+    # Real-Time Collision Detection 5.1.5, with each region as a mask
+    # rather than a branch; the later ones take precedence)
+    a, b, c = tris[:, 0], tris[:, 1], tris[:, 2]
+    ab, ac = b - a, c - a
+    ap, bp, cp = points - a, points - b, points - c
+    d1, d2 = dot(ab, ap), dot(ac, ap)
+    d3, d4 = dot(ab, bp), dot(ac, bp)
+    d5, d6 = dot(ab, cp), dot(ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = va + vb + vc
+        result = a + ab * (vb / denom)[:, None] + ac * (vc / denom)[:, None]
+        regions = [
+            ((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),
+             lambda: b + (c - b) * ((d4 - d3) /
+                                    ((d4 - d3) + (d5 - d6)))[:, None]),
+            ((vb <= 0) & (d2 >= 0) & (d6 <= 0),
+             lambda: a + ac * (d2 / (d2 - d6))[:, None]),
+            ((d6 >= 0) & (d5 <= d6), lambda: c),
+            ((vc <= 0) & (d1 >= 0) & (d3 <= 0),
+             lambda: a + ab * (d1 / (d1 - d3))[:, None]),
+            ((d3 >= 0) & (d4 <= d3), lambda: b),
+            ((d1 <= 0) & (d2 <= 0), lambda: a),
+        ]
+        for mask, point in regions:
+            if mask.any():
+                result = np.where(mask[:, None], point(), result)
+    return result
+
+class BVH:
+    def __init__(self, tris, leaf_size=LEAF_SIZE):
+        tris = np.asarray(tris, np.float64).reshape(-1, 3, 3)
+        tri_lo = tris.min(axis=1)
+        tri_hi = tris.max(axis=1)
+        centers = (tri_lo + tri_hi) / 2
+        # the triangles sorted by centre along each axis; each node covers
+        # the same range of all three, and splitting a node partitions its
+        # range of each so they stay sorted
+        order = [np.argsort(centers[:, axis], kind='stable')
+                 for axis in range(3)]
+        left = np.zeros(len(tris), bool)
+        lo, hi, first, count = [None], [None], [0], [0]
+        stack = [(0, 0, len(tris))] # node, range of order it covers
+        while stack:
+            node, start, end = stack.pop()
+            idx = order[0][start:end]
+            if len(idx):
+                lo[node] = tri_lo[idx].min(axis=0)
+                hi[node] = tri_hi[idx].max(axis=0)
+            else:
+                lo[node] = hi[node] = np.zeros(3)
+            if end - start <= leaf_size:
+                first[node], count[node] = start, end - start
+                continue
+            if end - start > SAH_SIZE:
+                cost, mid, axis = min(
+                    sah_split(tri_lo[order[a][start:end]],
+                              tri_hi[order[a][start:end]]) + (a,)
+                    for a in range(3))
+            else:
+                axis = np.argmax(hi[node] - lo[node])
+                mid = (end - start) // 2
+            left[order[axis][start:start + mid]] = True
+            for a in range(3):
+                if a != axis:
+                    idx = order[a][start:end]
+                    order[a][start:end] = np.concatenate(
+                        [idx[left[idx]], idx[~left[idx]]])
+            left[idx] = False
+            mid += start
+            # the two children are always next to each other
+            child = len(lo)
+            first[node], count[node] = child, 0
+            lo += [None, None]
+            hi += [None, None]
+            first += [0, 0]
+            count += [0, 0]
+            stack.append((child, start, mid))
+            stack.append((child + 1, mid, end))
+        order = order[0]
+        self.tris = tris[order] # so each leaf's triangles are contiguous
+        self.order = order # index in the original mesh of each of them
+        self.lo = np.array(lo)
+        self.hi = np.array(hi)
+        self.first = np.array(first) # first triangle, or left child
+        self.count = np.array(count) # triangles in a leaf, 0 otherwise
+        self._setup()
+
+    def _setup(self):
+        self.lo_axes = np.ascontiguousarray(self.lo.T)
+        self.hi_axes = np.ascontiguousarray(self.hi.T)
+        self.normals = stlio.normals(self.tris)
+
+    def __len__(self):
+        return len(self.tris)
+
+    def save(self, fname):
+        np.savez(fname, **{name: getattr(self, name) for name in ARRAYS})
+
+    @classmethod
+    def load(cls, fname):
+        tree = cls.__new__(cls)
+        with np.load(fname) as data:
+            for name in ARRAYS:
+                setattr(tree, name, data[name])
+        tree._setup()
+        return tree
+
+    def _leaf_pairs(self, queries, nodes):
+        # the (query, triangle) pairs for some (query, leaf) pairs
+        counts = self.count[nodes]
+        q = np.repeat(queries, counts)
+        tri = np.repeat(self.first[nodes], counts) + (
+            np.arange(counts.sum()) -
+            np.repeat(np.cumsum(counts) - counts, counts))
+        return q, tri
+
+    def _children(self, queries, nodes):
+        queries = np.repeat(queries, 2)
+        nodes = np.repeat(self.first[nodes], 2)
+        nodes[1::2] += 1
+        return queries, nodes
+
+    def _box_distance2(self, columns, queries, nodes):
+        # squared distance from points to boxes, per pair
+        d2 = np.zeros(len(queries))
+        for k in range(3):
+            p = columns[k][queries]
+            d = np.maximum(self.lo_axes[k][nodes] - p,
+                           p - self.hi_axes[k][nodes])
+            d2 += np.maximum(d, 0) ** 2
+        return d2
+
+    def _box_hits(self, origins, inv, rays, nodes, best):
+        # which (ray, node) pairs enter the node's box before best[ray];
+        # everything is a column per axis, as reducing along rows of three
+        # is slow
+        near = np.zeros(len(rays))
+        far = best[rays]
+        for k in range(3):
+            o = origins[k][rays]
+            t0 = (self.lo_axes[k][nodes] - o) * inv[k][rays]
+            t1 = (self.hi_axes[k][nodes] - o) * inv[k][rays]
+            near = np.maximum(near, np.minimum(t0, t1))
+            far = np.minimum(far, np.maximum(t0, t1))
+        return near <= far
+
+    def _trace(self, origins, directions, max_dist):
+        # one round: the nearest hit within max_dist (per ray) of each
+        n = len(origins)
+        best = np.array(max_dist, np.float64)
+        hit = np.full(n, -1)
+        # a zero component would give 0 * inf = nan in the slab test
+        safe = np.where(directions == 0, 1e-300, directions)
+        inv = np.ascontiguousarray((1 / safe).T)
+        columns = np.ascontiguousarray(origins.T)
+        rays = np.arange(n)
+        nodes = np.zeros(n, np.int64)
+        while len(rays):
+            keep = self._box_hits(columns, inv, rays, nodes, best)
+            rays, nodes = rays[keep], nodes[keep]
+            leaf = self.count[nodes] > 0
+            if leaf.any():
+                r, tri = self._leaf_pairs(rays[leaf], nodes[leaf])
+                t = intersect(origins[r], directions[r], self.tris[tri])
+                closer = t < best[r]
+                r, tri, t = r[closer], tri[closer], t[closer]
+                np.minimum.at(best, r, t)
+                won = t == best[r]
+                hit[r[won]] = tri[won]
+            rays, nodes = self._children(rays[~leaf], nodes[~leaf])
+        return np.where(hit >= 0, best, np.inf), hit
+
+    def _ray_cast(self, origins, directions, max_dist):
+        t = np.full(len(origins), np.inf)
+        hit = np.full(len(origins), -1)
+        length = np.linalg.norm(directions, axis=1)
+        size = np.linalg.norm(self.hi[0] - self.lo[0])
+        # beyond this no ray can hit anything
+        reach = np.linalg.norm(origins - (self.lo[0] + self.hi[0]) / 2,
+                               axis=1) + size / 2
+        limit = max(size * FIRST_REACH, 1e-9)
+        todo = np.nonzero(length > 0)[0]
+        while len(todo):
+            rt, rhit = self._trace(origins[todo], directions[todo],
+                                   np.minimum(limit / length[todo], max_dist))
+            t[todo], hit[todo] = rt, rhit
+            todo = todo[(rhit < 0) & (limit < reach[todo]) &
+                        (limit / length[todo] < max_dist)]
+            limit *= 8
+        return t, hit
+
+    def ray_cast(self, origins, directions, max_dist=np.inf):
+        # distance to the nearest triangle along each ray (directions need
+        # not be unit length; distances are in multiples of them), and the
+        # index of that triangle in the original mesh; inf and -1 for a miss
+        origins = np.asarray(origins, np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, np.float64).reshape(-1, 3)
+        t = np.empty(len(origins))
+        tri = np.empty(len(origins), np.int64)
+        if not len(self.tris):
+            t[:], tri[:] = np.inf, -1
+            return t, tri
+        for start in range(0, len(origins), RAY_BATCH):
+            end = start + RAY_BATCH
+            t[start:end], hit = self._ray_cast(
+                origins[start:end], directions[start:end], max_dist)
+            tri[start:end] = np.where(hit >= 0, self.order[hit], -1)
+        return t, tri
+
+    def _measure(self, points, queries, nodes, best, found):
+        # closest points on the triangles of some (query, leaf) pairs, where
+        # they're closer than best so far
+        q, tri = self._leaf_pairs(queries, nodes)
+        c = closest_on_triangles(points[q], self.tris[tri])
+        d2 = ((points[q] - c) ** 2).sum(axis=1)
+        closer = d2 < best[q]
+        q, tri, d2 = q[closer], tri[closer], d2[closer]
+        np.minimum.at(best, q, d2)
+        won = d2 == best[q]
+        found[q[won]] = tri[won]
+
+    def _closest(self, points):
+        n = len(points)
+        columns = np.ascontiguousarray(points.T)
+        best = np.full(n, np.inf)
+        found = np.full(n, -1)
+        # a first guess from the leaf each point falls in, going down the
+        # nearer child every time
+        queries = np.arange(n)
+        nodes = np.zeros(n, np.int64)
+        inner = self.count[nodes] == 0
+        while inner.any():
+            a, b = self._children(queries[inner], nodes[inner])
+            da = self._box_distance2(columns, a[::2], b[::2])
+            db = self._box_distance2(columns, a[1::2], b[1::2])
+            nodes[inner] = np.where(da <= db, b[::2], b[1::2])
+            inner = self.count[nodes] == 0
+        self._measure(points, queries, nodes, best, found)
+        # then everything which could still be closer than that
+        nodes = np.zeros(n, np.int64)
+        while len(queries):
+            keep = self._box_distance2(columns, queries, nodes) < best[queries]
+            queries, nodes = queries[keep], nodes[keep]
+            leaf = self.count[nodes] > 0
+            if leaf.any():
+                self._measure(points, queries[leaf], nodes[leaf], best, found)
+            queries, nodes = self._children(queries[~leaf], nodes[~leaf])
+        return found
+
+    def closest(self, points):
+        # the closest point on the mesh to each point, how far away it is,
+        # and which triangle of the original mesh it's on
+        points = np.asarray(points, np.float64).reshape(-1, 3)
+        tri = np.full(len(points), -1)
+        if len(self.tris):
+            for start in range(0, len(points), RAY_BATCH):
+                end = start + RAY_BATCH
+                tri[start:end] = self._closest(points[start:end])
+        on = closest_on_triangles(points, self.tris[tri])
+        distance = np.linalg.norm(points - on, axis=1)
+        if not len(self.tris):
+            on[:], distance[:] = np.nan, np.inf
+        return on, distance, np.where(tri >= 0, self.order[tri], -1)
+
+    def _winding(self, origins):
+        # how many times more each ray along INSIDE_RAY leaves the mesh
+        # than it enters: 1 (or more, where closed parts of it overlap)
+        # inside, 0 outside
+        n = len(origins)
+        columns = np.ascontiguousarray(origins.T)
+        directions = np.broadcast_to(INSIDE_RAY, (n, 3))
+        inv = np.repeat(1 / INSIDE_RAY[:, None], n, axis=1)
+        best = np.full(n, np.inf)
+        winding = np.zeros(n, np.int64)
+        rays = np.arange(n)
+        nodes = np.zeros(n, np.int64)
+        while len(rays):
+            keep = self._box_hits(columns, inv, rays, nodes, best)
+            rays, nodes = rays[keep], nodes[keep]
+            leaf = self.count[nodes] > 0
+            if leaf.any():
+                r, tri = self._leaf_pairs(rays[leaf], nodes[leaf])
+                t = intersect(origins[r], directions[r], self.tris[tri])
+                crossed = np.isfinite(t)
+                r, tri = r[crossed], tri[crossed]
+                np.add.at(winding, r, np.sign(self.normals[tri] @ INSIDE_RAY)
+                          .astype(np.int64))
+            rays, nodes = self._children(rays[~leaf], nodes[~leaf])
+        return winding
+
+    def inside(self, points):
+        # which points are inside the (closed, outward facing) mesh
+        points = np.asarray(points, np.float64).reshape(-1, 3)
+        result = np.zeros(len(points), bool)
+        if len(self.tris):
+            for start in range(0, len(points), RAY_BATCH):
+                end = start + RAY_BATCH
+                result[start:end] = self._winding(points[start:end]) > 0
+        return result
+
+    def signed_distance(self, points):
+        # distance to the mesh, negative inside it
+        on, distance, tri = self.closest(points)
+        return np.where(self.inside(points), -distance, distance)
+
+def index(fname):
+    # the BVH of an STL file, from the cache if it's been built before
+    entry = cache_file('bvh', '%s-%d' % (file_hash(fname), INDEX_VERSION),
+                       '.npz')
+    data = read_entry(entry)
+    if data is not None:
+        return BVH.load(io.BytesIO(data))
+    tree = BVH(stlio.read(fname)['vertices'])
+    buf = io.BytesIO()
+    tree.save(buf)
+    write_atomic(entry, buf.getvalue())
+    return tree
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build (or load) the BVH of some STL meshes, and time '
+        'queries against them.')
+    parser.add_argument('meshes', nargs='+', metavar='mesh.stl')
+    parser.add_argument('--near', metavar='other.stl',
+                        help='report how close the vertices of this mesh '
+                        'come to each of the others (negative: inside)')
+    parser.add_argument('-n', type=int, default=100000,
+                        help='random queries to time (default: 100000)')
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(0)
+    for fname in args.meshes:
+        start = time.perf_counter()
+        tree = index(fname)
+        load_time = time.perf_counter() - start
+        lo, hi = tree.lo[0], tree.hi[0]
+        points = rng.uniform(lo, hi, (args.n, 3))
+        directions = rng.normal(size=(args.n, 3))
+        times = []
+        for query in (lambda: tree.closest(points),
+                      lambda: tree.ray_cast(points, directions),
+                      lambda: tree.signed_distance(points)):
+            start = time.perf_counter()
+            query()
+            times.append((time.perf_counter() - start) / args.n * 1e6)
+        print('%-45s %7d triangles %6.3fs load  per query: %5.1fus '
+              'closest %5.1fus ray %5.1fus signed' % (
+              fname, len(tree), load_time, *times))
+        if args.near:
+            other = stlio.read(args.near)['vertices'].reshape(-1, 3)
+            other = np.unique(other, axis=0)
+            distance = tree.signed_distance(other)
+            i = np.argmin(distance)
+            print('    %s comes within %.3f mm, at %s' % (
+                args.near, distance[i],
+                ' '.join('%.2f' % x for x in other[i])))
+
+if __name__ == '__main__':
+    main()
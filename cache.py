@@ -0,0 +1,276 @@
+import cadquery as cq
+import functools
+import hashlib
+import inspect
+import json
+import os
+import types
+import weakref
+from collections import OrderedDict
+from io import BytesIO
+from OCP.Bnd import Bnd_Box
+from OCP.BRepBuilderAPI import BRepBuilderAPI_Copy
+
+from store import cache_file, evict, file_hash, read_entry, write_atomic
+
+# Shared on-disk cache for the build scripts.
+#
+# Parsing STEP files dominates a cold build, so the first import of each
+# file is written out as an OCCT binary BREP keyed by a hash of the file
+# contents (editing or replacing the STEP file changes the key).  Later
+# imports, in this process or any other, just read the BREP back.  The
+# cache is capped in size; least recently used entries are evicted first.
+#
+# The same cache also backs @memoize, for part factories which are called
+# over and over with the same arguments.  The files themselves are kept by
+# store.py.
+
+# bump this if the format of cached entries changes
+CACHE_VERSION = 1
+
+# build-wide settings (eg preview mode) which change the geometry the
+# scripts make without showing up in their code; part of every key
+settings = {}
+
+_imports = {} # cache key -> list of shapes
+_memos = weakref.WeakSet() # every @memoize function, for release()
+
+def to_brep(obj):
+    buf = BytesIO()
+    as_shape(obj).exportBin(buf)
+    return buf.getvalue()
+
+def from_brep(data):
+    return cq.Shape.importBin(BytesIO(data))
+
+def copy_shape(shape):
+    # a copy of shape's topology, sharing its curves and surfaces (so it's
+    # cheap).  The shapes kept here (imported models, memoized parts) are
+    # handed out again and again, and cadquery changes the shapes it's
+    # given in place: the clean after every union and cut rewrites the
+    # edges and wires its result shares with them, and booleans widen the
+    # tolerances of their arguments' edges.  A second build of the casemod
+    # top from the same imported case came out a quarter of its volume.
+    # So every caller gets a copy of its own to change.
+    return shape.__class__(
+        BRepBuilderAPI_Copy(shape.wrapped, False, False).Shape())
+
+def import_step(fileName, unit='MM'):
+    # drop-in replacement for cq.importers.importStep
+    key = '%s-%s-v%d' % (file_hash(fileName), unit, CACHE_VERSION)
+    shapes = _imports.get(key)
+    if shapes is None:
+        fname = cache_file('step', key)
+        data = read_entry(fname)
+        if data is not None:
+            # importStep returns one shape per STEP root, so those were
+            # stored as the children of a single compound
+            shapes = list(from_brep(data))
+        else:
+            shapes = cq.importers.importStep(fileName, unit).vals()
+            write_atomic(fname, to_brep(cq.Compound.makeCompound(shapes)))
+            evict()
+        _imports[key] = shapes
+    return cq.Workplane("XY").newObject([copy_shape(s) for s in shapes])
+
+class LazyModel:
+    # stands in for the Workplane import_step() returns, but only imports
+    # the model the first time something is done with it (it's shown,
+    # exported or measured), so scripts can name all their reference
+    # models up front without paying for the ones a build doesn't use
+    def __init__(self, load):
+        self._load = load
+        self._model = None
+
+    def model(self):
+        if self._model is None:
+            self._model = self._load()
+        return self._model
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.model(), name)
+
+def lazy_import_step(fileName, unit='MM'):
+    return LazyModel(lambda: import_step(fileName, unit))
+
+def bound_box(xmin, ymin, zmin, xmax, ymax, zmax):
+    bb = Bnd_Box()
+    bb.Update(xmin, ymin, zmin, xmax, ymax, zmax)
+    return cq.BoundBox(bb)
+
+def step_bounds(fileName, unit='MM'):
+    # bounding box of a STEP model, without loading it more than once ever
+    key = '%s-%s-v%d' % (file_hash(fileName), unit, CACHE_VERSION)
+    fname = cache_file('step', key, '.bounds.json')
+    data = read_entry(fname)
+    if data is None:
+        bb = cq.Compound.makeCompound(
+            import_step(fileName, unit).vals()).BoundingBox()
+        data = json.dumps([bb.xmin, bb.ymin, bb.zmin,
+                           bb.xmax, bb.ymax, bb.zmax]).encode()
+        write_atomic(fname, data)
+    return bound_box(*json.loads(data))
+
+# Measurements of reference models.  The datums a script takes from a
+# STEP model (face centers, bounding boxes, distances) are found by a
+# function of the model, whose result is stored as JSON keyed by the
+# STEP file and the code of that function (see code_key below); as long
+# as neither changes, the model isn't even loaded.
+
+def encode_value(v):
+    if isinstance(v, cq.Vector):
+        return {'Vector': list(v.toTuple())}
+    if isinstance(v, cq.BoundBox):
+        return {'BoundBox': [v.xmin, v.ymin, v.zmin, v.xmax, v.ymax, v.zmax]}
+    if isinstance(v, (tuple, list)):
+        return [encode_value(x) for x in v]
+    if isinstance(v, (bool, int, float, str)):
+        return v
+    raise TypeError("can't store a %s measurement" % type(v).__name__)
+
+def decode_value(v):
+    if isinstance(v, dict) and 'Vector' in v:
+        return cq.Vector(*v['Vector'])
+    if isinstance(v, dict) and 'BoundBox' in v:
+        return bound_box(*v['BoundBox'])
+    if isinstance(v, list):
+        return tuple(decode_value(x) for x in v)
+    return v
+
+def measure(fileName, fn, unit='MM'):
+    # fn(model) -> {name: value}, for the model imported from fileName
+    key = hashlib.sha256(('%s-%s-v%d-%s' % (
+        file_hash(fileName), unit, CACHE_VERSION, code_key(fn))).encode()
+    ).hexdigest()
+    fname = cache_file('measure', key, '.json')
+    data = read_entry(fname)
+    if data is None:
+        values = fn(import_step(fileName, unit))
+        data = json.dumps({k: encode_value(v) for k, v in values.items()},
+                          indent=1, sort_keys=True).encode()
+        write_atomic(fname, data)
+    return {k: decode_value(v) for k, v in json.loads(data).items()}
+
+# Memoization of part factories.  A call is keyed on the function's code,
+# its (default-filled) arguments, and the module-level dimensions that it
+# or any helper from the same directory reads, so changing a dimension at
+# the top of a script invalidates every factory that depends on it.
+
+def value_key(v):
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return repr(v)
+    if isinstance(v, (tuple, list)):
+        keys = [value_key(x) for x in v]
+        if None in keys:
+            return None
+        return '(%s)' % ','.join(keys)
+    if isinstance(v, cq.Vector):
+        return 'Vector%r' % (v.toTuple(),)
+    if isinstance(v, cq.BoundBox):
+        return 'BoundBox%r' % ((v.xmin, v.ymin, v.zmin, v.xmax, v.ymax, v.zmax),)
+    if isinstance(v, cq.Location):
+        return 'Location%r' % (v.toTuple(),)
+    return None # not a dimension, can't be part of a key
+
+def dependencies(fn):
+    # returns a hash of the code of fn (and of the helpers it calls), the
+    # module-level dimensions it reads as {name: key}, and the names of
+    # any other module-level values it reads which can't be keyed
+    fn = getattr(fn, '__wrapped__', fn)
+    h = hashlib.sha256()
+    root = os.path.dirname(fn.__code__.co_filename)
+    seen = set()
+    params = {}
+    unkeyed = set()
+    def visit_code(code, env):
+        h.update(code.co_code)
+        for c in code.co_consts:
+            if isinstance(c, types.CodeType):
+                visit_code(c, env)
+            else:
+                h.update(repr(c).encode())
+        for name in code.co_names:
+            if name not in env:
+                continue # attribute, or a builtin
+            v = env[name]
+            v = getattr(v, '__wrapped__', v)
+            if isinstance(v, types.FunctionType):
+                if os.path.dirname(v.__code__.co_filename) == root:
+                    visit(v)
+                continue
+            k = value_key(v)
+            if k is not None:
+                params[name] = k
+            elif isinstance(v, (cq.Workplane, cq.Shape, LazyModel)):
+                unkeyed.add(name)
+    def visit(f):
+        if f in seen:
+            return
+        seen.add(f)
+        h.update(('%s(%s)' % (f.__qualname__,
+                               value_key(f.__defaults__))).encode())
+        visit_code(f.__code__, f.__globals__)
+    visit(fn)
+    return h.hexdigest(), params, unkeyed
+
+def code_key(fn):
+    digest, params, unkeyed = dependencies(fn)
+    params = dict(params, **{'settings.' + k: value_key(v)
+                             for k, v in settings.items()})
+    return hashlib.sha256((digest + ''.join(
+        '%s=%s;' % kv for kv in sorted(params.items()))).encode()).hexdigest()
+
+def as_shape(obj):
+    if isinstance(obj, LazyModel):
+        obj = obj.model()
+    if isinstance(obj, cq.Workplane):
+        vals = [v for v in obj.vals() if isinstance(v, cq.Shape)]
+        return vals[0] if len(vals) == 1 else cq.Compound.makeCompound(vals)
+    return obj
+
+def memoize(maxsize=64, disk=False):
+    # Returns a fresh Workplane around a copy of the kept shape on every
+    # call (see copy_shape).
+    def decorate(fn):
+        sig = inspect.signature(fn)
+        lru = OrderedDict()
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arg_key = value_key(list(bound.arguments.items()))
+            if arg_key is None:
+                return fn(*args, **kwargs)
+            key = hashlib.sha256(
+                (code_key(fn) + arg_key).encode()).hexdigest()
+            shape = lru.get(key)
+            if shape is not None:
+                lru.move_to_end(key)
+            else:
+                fname = cache_file('memo', key) if disk else None
+                data = read_entry(fname) if disk else None
+                if data is not None:
+                    shape = from_brep(data)
+                else:
+                    shape = as_shape(fn(*args, **kwargs))
+                    if disk:
+                        write_atomic(fname, to_brep(shape))
+                        evict()
+                lru[key] = shape
+                if len(lru) > maxsize:
+                    lru.popitem(last=False)
+            return cq.Workplane("XY").newObject([copy_shape(shape)])
+        wrapper.cache_clear = lru.clear
+        _memos.add(wrapper)
+        return wrapper
+    return decorate
+
+def release():
+    # forget the shapes kept in memory between calls (imported models and
+    # memoized parts); if they're wanted again they are read back from the
+    # disk cache
+    _imports.clear()
+    for fn in list(_memos):
+        fn.cache_clear()
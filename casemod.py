@@ -1,5 +1,7 @@
 import cadquery as cq
 import numpy as np
+from cache import import_step, measure
+from preview import PREVIEW, import_model
 
 watchy_board_width = 33.8
 shelf_height = 1.00
@@ -8,6 +10,7 @@ air_space = 0.75
 grill_thick = 1
 grill_strut_width=1.5
 grill_space_width=1.1
+grill_style = 1 # 1: ring with a cross, 2: vertical slots, 3: horizontal slots
 scd40_offset_adj = -0.5
 bump_ysize=14.05
 bump_xsize=14
@@ -15,7 +18,7 @@ bump_xsize=14
 
 # import Armadillonium model
 case_parts = (
-    cq.importers.importStep('Armadillonium_Model.step')
+    import_step('Armadillonium_Model.step')
     .findSolid().Solids()
 )
 case_top = cq.Workplane(case_parts[1])
@@ -25,47 +28,70 @@ buttons = cq.Workplane(cq.Compound.makeCompound([
 ]))
 
 # import SCD40 model
-scd40 = cq.importers.importStep('Sensirion_CO2_Sensors_SCD4x_STEP_file.step')
+scd40 = import_model('Sensirion_CO2_Sensors_SCD4x_STEP_file.step')
 
 # import PCB model
-pcb = cq.importers.importStep('pcb.step')
+pcb = import_model('pcb.step')
 
 # import Watchy model
-watchy = cq.importers.importStep('Watchy_Battery.step')
+watchy = import_model('Watchy_Battery.step')
 
 # for some reason computing the center of the bound box of the
 # actual case_bottom_plane doesn't work (offset oddly to the left)
 # so we compute the center of the outermost face and then project
 # that back when we make our *actual* work plane
-outermost_center = (case_bottom
-    .faces("-Z").faces("<Z")
-    .workplane(centerOption='CenterOfBoundBox').val()
-)
-case_bottom = (case_bottom
-    .faces("-Z").faces("<Z[-2]")
-    .tag("bottom_faces")
-    .workplane(centerOption='ProjectedOrigin', origin=outermost_center)
-    .tag("bottom_plane")
-    .rect(26, 40, forConstruction=True).vertices()
-    .tag("bottom_screws")
-)
-# compute screw_boss_radius
-screw_boss_radius = (
-    # max screw
-    case_bottom.vertices(">X and >Y", tag="bottom_screws")
-    .val().Center().toPnt()
-).Distance(
-    # corner of topmost edge
-    case_bottom.edges(">Y", tag="bottom_faces").vertices(">X and >Y")
-    .val().Center().toPnt()
-)
-# tag the shelf bottom
-case_bottom = (case_bottom
-    .faces("+Z", tag="bottom").faces(">Z[-2]")
-    .tag("bottom_shelf")
-    .workplane(centerOption='ProjectedOrigin', origin=outermost_center)
-    .tag("bottom_shelf_plane")
-)
+def find_outermost_center(case_bottom):
+    return (case_bottom
+        .faces("-Z").faces("<Z")
+        .workplane(centerOption='CenterOfBoundBox').val()
+    )
+
+def tag_case_bottom(case_bottom, outermost_center):
+    return (case_bottom
+        .faces("-Z").faces("<Z[-2]")
+        .tag("bottom_faces")
+        .workplane(centerOption='ProjectedOrigin', origin=outermost_center)
+        .tag("bottom_plane")
+        .rect(26, 40, forConstruction=True).vertices()
+        .tag("bottom_screws")
+        # tag the shelf bottom
+        .faces("+Z", tag="bottom").faces(">Z[-2]")
+        .tag("bottom_shelf")
+        .workplane(centerOption='ProjectedOrigin', origin=outermost_center)
+        .tag("bottom_shelf_plane")
+    )
+
+# the reference values measured on the case bottom; these are cached
+# (see cache.measure), so the face selections only run when the model
+# changes
+def measure_case(model):
+    case_bottom = cq.Workplane(model.findSolid().Solids()[2]).tag("bottom")
+    outermost_center = find_outermost_center(case_bottom)
+    case_bottom = tag_case_bottom(case_bottom, outermost_center)
+    return {
+        'outermost_center': outermost_center,
+        'screw_boss_radius': (
+            # max screw
+            case_bottom.vertices(">X and >Y", tag="bottom_screws")
+            .val().Center().toPnt()
+        ).Distance(
+            # corner of topmost edge
+            case_bottom.edges(">Y", tag="bottom_faces").vertices(">X and >Y")
+            .val().Center().toPnt()
+        ),
+        # ok, here's the case extension
+        'bottom_thick': (
+            case_bottom.workplaneFromTagged("bottom_shelf_plane").val().z -
+            case_bottom.workplaneFromTagged("bottom_plane").val().z
+        ),
+    }
+
+case_datums = measure('Armadillonium_Model.step', measure_case)
+outermost_center = case_datums['outermost_center']
+screw_boss_radius = case_datums['screw_boss_radius']
+bottom_thick = case_datums['bottom_thick']
+case_bottom = tag_case_bottom(case_bottom, outermost_center)
+
 # compute scd40_offset (ie, center y position of scd40)
 scd40_offset = -(outermost_center.y - scd40_offset_adj)
 def do_scd40_translate(obj):
@@ -75,7 +101,8 @@ def do_scd40_translate(obj):
     .translate([0,scd40_offset,-shelf_height-wiring_space])
     )
 
-scd40 = do_scd40_translate(scd40.translate([0,0,.8]))
+def make_scd40():
+    return do_scd40_translate(scd40.translate([0,0,.8]))
 
 simple_scd40 = (cq.Workplane("XY")
     .rect(10.1, 10.1).extrude(0.8)
@@ -87,56 +114,6 @@ simple_scd40 = do_scd40_translate(simple_scd40)
 
 #show_object(simple_scd40, name="simple-scd40")
 
-# ok, here's the case extension
-bottom_thick = (
-    case_bottom.workplaneFromTagged("bottom_shelf_plane").val().z -
-    case_bottom.workplaneFromTagged("bottom_plane").val().z
-)
-case_bottom = (case_bottom
-    .workplaneFromTagged("bottom_shelf_plane")
-    .move(0,scd40_offset)
-    .rect(bump_xsize, bump_ysize, forConstruction=True)
-    .vertices("<Y").tag("bottom_edge")
-    .solids(tag="bottom")
-)
-pt1 = (case_bottom.vertices("<Y and >X", tag="bottom_screws")
-       .val().Center())
-pt2 = (case_bottom.vertices("<Y and >X", tag="bottom_edge")
-       .val().Center())
-def mk_bump(workplane, thickness):
-    d = np.hypot(pt1.x - pt2.x, pt1.y - pt2.y)
-    alpha = np.arctan2(pt1.x - pt2.x, pt1.y - pt2.y)
-    beta = np.arcsin(screw_boss_radius / d)
-    gamma = (np.pi/2) - (alpha + beta)
-    d2 = np.sqrt(d*d - screw_boss_radius*screw_boss_radius)
-    return (workplane
-            .move(0, scd40_offset-(bump_ysize/2)).hLine(bump_xsize/2)
-            .polarLine(d2, 90-np.degrees(alpha+beta))
-            #.line(0.5,1) # a bit of a cheat, but also breaks the chamfer
-            .hLineTo(0)
-            .mirrorY()
-            .extrude(thickness, combine=False)
-    )
-bottom_bump = (mk_bump(
-    cq.Workplane("XY").copyWorkplane(
-        case_bottom.workplaneFromTagged("bottom_shelf_plane")
-    ).workplane(offset=-bottom_thick), bottom_thick
-    )
-    .faces("+Z").edges("(not <Y) and (not >Y)").chamfer(2)
-    .faces("-Z").shell(-shelf_height)
-)
-pt3 = bottom_bump.faces(">Y").val().Center()
-case_bottom = (case_bottom
-    .union(bottom_bump)
-    .workplaneFromTagged("bottom_shelf_plane")
-    .workplane(offset=shelf_height, invert=True,
-               centerOption='ProjectedOrigin', origin=pt3)
-    .center(0,-10 + shelf_height)
-    .rect(20,20).cutBlind(10)
-)
-# drill screw holes all the way through so they are not a blind tap
-#case_bottom = case_bottom.vertices(tag="bottom_screws").hole(1.6)
-
 # ok, now the same thing for the top of the case
 case_top = (case_top
     .tag("top")
@@ -163,71 +140,140 @@ top_cut = (case_top
     .extrude(20, combine=False) # again, just "very tall"
 )
 
-top_bump = (mk_bump(
-    cq.Workplane("XY").copyWorkplane(
-        case_top.workplaneFromTagged("top_top_plane")
-    ).workplane(invert=True), top_thick
-    ).tag("top_bump")
-    .faces("+Y").workplane()
-    .faces("+Y", tag="top_bump").wires().toPending().extrude(2)
-    .faces("-Z").edges("not >Y").chamfer(1.6)
-    #.cut(top_cut) # done later on
-)
-case_top = (case_top
-    .union(top_bump).tag("top_with_bump")
-    .union(simple_scd40.faces("+Z").shell(air_space+grill_thick))
-    .cut(simple_scd40).cut(simple_scd40.shell(air_space))
-    .cut(top_cut)
-)
+# Everything above is the unmodified case and the reference values
+# measured from it.  The bump and the grill are built by the functions
+# below, which read the dimensions at the top of this file when they are
+# called; sweep.py relies on that to try out variants.
+
+def mk_bump(workplane, thickness):
+    pt1 = (case_bottom.vertices("<Y and >X", tag="bottom_screws")
+           .val().Center())
+    pt2 = (case_bottom
+        .workplaneFromTagged("bottom_shelf_plane")
+        .move(0,scd40_offset)
+        .rect(bump_xsize, bump_ysize, forConstruction=True)
+        .vertices("<Y and >X")
+        .val().Center())
+    d = np.hypot(pt1.x - pt2.x, pt1.y - pt2.y)
+    alpha = np.arctan2(pt1.x - pt2.x, pt1.y - pt2.y)
+    beta = np.arcsin(screw_boss_radius / d)
+    gamma = (np.pi/2) - (alpha + beta)
+    d2 = np.sqrt(d*d - screw_boss_radius*screw_boss_radius)
+    return (workplane
+            .move(0, scd40_offset-(bump_ysize/2)).hLine(bump_xsize/2)
+            .polarLine(d2, 90-np.degrees(alpha+beta))
+            #.line(0.5,1) # a bit of a cheat, but also breaks the chamfer
+            .hLineTo(0)
+            .mirrorY()
+            .extrude(thickness, combine=False)
+    )
+
+def make_case_bottom():
+    bottom_bump = (mk_bump(
+        cq.Workplane("XY").copyWorkplane(
+            case_bottom.workplaneFromTagged("bottom_shelf_plane")
+        ).workplane(offset=-bottom_thick), bottom_thick
+        )
+        .faces("+Z").edges("(not <Y) and (not >Y)").chamfer(2)
+        .faces("-Z").shell(-shelf_height)
+    )
+    pt3 = bottom_bump.faces(">Y").val().Center()
+    return (case_bottom
+        .solids(tag="bottom")
+        .union(bottom_bump)
+        .workplaneFromTagged("bottom_shelf_plane")
+        .workplane(offset=shelf_height, invert=True,
+                   centerOption='ProjectedOrigin', origin=pt3)
+        .center(0,-10 + shelf_height)
+        .rect(20,20).cutBlind(10)
+    )
+# drill screw holes all the way through so they are not a blind tap
+#case_bottom = case_bottom.vertices(tag="bottom_screws").hole(1.6)
+
 # Grill
-grill = (simple_scd40
-    .faces("<<Z")
-    .workplane(centerOption='CenterOfBoundBox')
-    .tag("grill_plane")
-)
-if True:
-    # Grill option 1
-    grill = (grill
-    .circle(7.5/2).circle(3.5/2)
-    .extrude(air_space+grill_thick+1, combine=False)
-    .workplaneFromTagged("grill_plane")
-    .rect(grill_strut_width, 10).cutThruAll()
-    .workplaneFromTagged("grill_plane")
-    .rect(10, grill_strut_width).cutThruAll()
+def make_grill():
+    grill = (simple_scd40
+        .faces("<<Z")
+        .workplane(centerOption='CenterOfBoundBox')
+        .tag("grill_plane")
     )
-elif False:
-    # Grill option 2
+    if grill_style == 1:
+        # Grill option 1
+        return (grill
+        .circle(7.5/2).circle(3.5/2)
+        .extrude(air_space+grill_thick+1, combine=False)
+        .workplaneFromTagged("grill_plane")
+        .rect(grill_strut_width, 10).cutThruAll()
+        .workplaneFromTagged("grill_plane")
+        .rect(10, grill_strut_width).cutThruAll()
+        )
     sp = (grill_strut_width + grill_space_width)/2
-    grill = (grill
-    .pushPoints([(-3*sp,0),(-sp,0),(sp,0),(3*sp,0)])
-    .slot2D(7.5, grill_space_width, angle=90)
-    .extrude(air_space+grill_thick+1, combine=False)
-    )
-else:
+    if grill_style == 2:
+        # Grill option 2
+        return (grill
+        .pushPoints([(-3*sp,0),(-sp,0),(sp,0),(3*sp,0)])
+        .slot2D(7.5, grill_space_width, angle=90)
+        .extrude(air_space+grill_thick+1, combine=False)
+        )
     # Grill option 3
-    sp = (grill_strut_width + grill_space_width)/2
-    grill = (grill
+    return (grill
     .pushPoints([(0,-3*sp),(0,-sp),(0,sp),(0,3*sp)])
     .slot2D(7.5, grill_space_width, angle=0)
     .extrude(air_space+grill_thick+1, combine=False)
     )
-case_top = case_top.cut(grill)
 
+def make_case_top():
+    top_bump = (mk_bump(
+        cq.Workplane("XY").copyWorkplane(
+            case_top.workplaneFromTagged("top_top_plane")
+        ).workplane(invert=True), top_thick
+        ).tag("top_bump")
+        .faces("+Y").workplane()
+        .faces("+Y", tag="top_bump").wires().toPending().extrude(2)
+        .faces("-Z").edges("not >Y").chamfer(1.6)
+        #.cut(top_cut) # done later on
+    )
+    return (case_top
+        .union(top_bump).tag("top_with_bump")
+        .union(simple_scd40.faces("+Z").shell(air_space+grill_thick))
+        .cut(simple_scd40).cut(simple_scd40.shell(air_space))
+        .cut(top_cut)
+        .cut(make_grill())
+    )
+
+# remove a chunk from watchy
+def make_watchy():
+    return (watchy.transformed(offset=[watchy_board_width/2,0,0])
+            .rect(15,8).cutThruAll()
+    )
+
+# Everything we show, as name -> function which builds it
+parts = {}
 if True:
-    show_object(case_top, name='top')
+    parts['top'] = make_case_top
 if True:
-    show_object(case_bottom, name='bottom')
+    parts['bottom'] = make_case_bottom
 if True:
-    show_object(buttons, name='buttons')
+    parts['buttons'] = lambda: buttons
 if True:
-    show_object(scd40, name='scd40')
-#show_object(pcb, name='pcb')
-
-# remove a chunk from watchy
+    # simple_scd40 is a better stand-in than a bounding box
+    parts['scd40'] = lambda: simple_scd40 if PREVIEW else make_scd40()
+#parts['pcb'] = pcb.model
 if True: # can disable this for faster refresh
-    watchy = (watchy.transformed(offset=[watchy_board_width/2,0,0])
-              .rect(15,8).cutThruAll()
-    )
-    show_object(watchy, name='watchy')
+    parts['watchy'] = make_watchy
+
+# for CQ-editor, and for 3mf assemblies (build.py --assembly)
+colors = {
+    'top': '#303030',
+    'bottom': '#303030',
+    'buttons': '#a0a0a0',
+    'scd40': '#d0d0d0',
+    'watchy': '#1b6e2a',
+}
+
+if 'show_object' in globals():
+    for name, make_part in parts.items():
+        show_object(make_part(), name=name,
+                    options={'color': colors.get(name, '#808080')})
 
 #debug(case_bottom.vertices(tag="bottom_screws").circle(screw_boss_radius))
@@ -0,0 +1,237 @@
+import argparse
+import heapq
+import itertools
+import os
+import sys
+import time
+
+import cadquery as cq
+from OCP.StdFail import StdFail_NotDone
+
+import build
+from cache import as_shape
+
+# Clearance and interference checks between assembled parts.
+#
+# Runs a script, takes the parts it shows (plus the reference models
+# listed below, which aren't normally shown), and for every pair of parts
+# reports the minimum distance between them, the volume where they
+# overlap, and whether that meets the clearance the design asks for.
+#
+#   python clearance.py gotchi.py casemod.py
+#
+# The faces of each part are put in a bounding volume hierarchy, so only
+# the faces which could possibly be closest are ever measured; pairs of
+# parts whose bounding boxes are further apart than --horizon aren't
+# measured at all.
+
+# script -> extra parts (name -> function of the script's globals), and
+# required clearances as (part, part, name of a dimension in the script
+# or a number in mm, or None for parts which are joined anyway).  Pairs
+# not listed here only need to not overlap.
+CHECKS = {
+    'gotchi.py': {
+        'parts': {
+            'watchy': lambda g: g['make_watchy'](),
+            'magnetic_latch':
+                lambda g: g['place'](g['make_mag'](),
+                    g['translation'](g['mag_translate'])),
+        },
+        'clearances': [
+            ('case2', 'lugs', None),
+            ('case2', 'watchy', 'case_wall_bot_clear'),
+            ('top_plate', 'watchy', 'screen_clearance'),
+            ('case2', 'Switch_PCB_1', 'switch_pcb_thick_clearance'),
+            ('case2', 'magnetic_latch', 0.25), # see make_mag_clearance
+            ('top_plate', 'magnetic_latch', 0.25),
+        ],
+    },
+    'casemod.py': {
+        'parts': {},
+        'clearances': [
+            ('top', 'scd40', 'air_space'),
+        ],
+    },
+}
+
+LEAF_SIZE = 8 # faces per BVH leaf
+OVERLAP_TOL = 1e-3 # mm^3
+
+class Node:
+    # a box around some faces, and either two child nodes or the faces
+    def __init__(self, items):
+        self.lo = tuple(min(i[1][k] for i in items) for k in range(3))
+        self.hi = tuple(max(i[2][k] for i in items) for k in range(3))
+        self.children = []
+        self.faces = None
+        if len(items) <= LEAF_SIZE:
+            self.faces = cq.Compound.makeCompound([i[0] for i in items])
+            return
+        # split at the median along the longest axis
+        axis = max(range(3), key=lambda k: self.hi[k] - self.lo[k])
+        items = sorted(items, key=lambda i: i[1][axis] + i[2][axis])
+        half = len(items) // 2
+        self.children = [Node(items[:half]), Node(items[half:])]
+
+def leaf_item(face):
+    bb = face.BoundingBox()
+    return (face, (bb.xmin, bb.ymin, bb.zmin), (bb.xmax, bb.ymax, bb.zmax))
+
+def bvh(shape):
+    items = [leaf_item(face) for face in shape.Faces()]
+    return Node(items) if items else None
+
+def box_distance(a, b):
+    return sum(max(0, b.lo[k] - a.hi[k], a.lo[k] - b.hi[k]) ** 2
+               for k in range(3)) ** 0.5
+
+def leaf_distance(a, b):
+    try:
+        return a.distance(b)
+    except StdFail_NotDone:
+        pass
+    # extrema sometimes gives up on faces which coincide; measure them one
+    # at a time, and fall back to their boxes (which can only understate
+    # the distance) for the ones it still can't do
+    best = None
+    for fa in a.Faces():
+        for fb in b.Faces():
+            try:
+                d = fa.distance(fb)
+            except StdFail_NotDone:
+                d = box_distance(Node([leaf_item(fa)]), Node([leaf_item(fb)]))
+            best = d if best is None else min(best, d)
+    return best
+
+def min_distance(a, b, limit):
+    # branch and bound over pairs of nodes, nearest boxes first; returns
+    # limit if the faces are at least that far apart, and the number of
+    # pairs of leaves actually measured
+    best = limit
+    measured = 0
+    counter = itertools.count()
+    heap = [(box_distance(a, b), next(counter), a, b)]
+    while heap:
+        d, _, na, nb = heapq.heappop(heap)
+        if d >= best:
+            break
+        if na.faces is not None and nb.faces is not None:
+            best = min(best, leaf_distance(na.faces, nb.faces))
+            measured += 1
+            continue
+        # descend into the bigger of the two (or the one that isn't a leaf)
+        if nb.faces is not None or (na.faces is None and
+                sum(na.hi) - sum(na.lo) >= sum(nb.hi) - sum(nb.lo)):
+            pairs = [(c, nb) for c in na.children]
+        else:
+            pairs = [(na, c) for c in nb.children]
+        for ca, cb in pairs:
+            cd = box_distance(ca, cb)
+            if cd < best:
+                heapq.heappush(heap, (cd, next(counter), ca, cb))
+    return best, measured
+
+def solids(shape):
+    return cq.Compound.makeCompound(shape.Solids())
+
+def boxes_overlap(a, b):
+    a, b = a.BoundingBox(), b.BoundingBox()
+    return (a.xmin <= b.xmax and b.xmin <= a.xmax and a.ymin <= b.ymax and
+            b.ymin <= a.ymax and a.zmin <= b.zmax and b.zmin <= a.zmax)
+
+def overlap(a, b, distance, tol):
+    # volume shared by two parts; only worth a boolean if their surfaces
+    # touch, otherwise each solid of one is either entirely inside a solid
+    # of the other or clear of it (parts like the Watchy are many solids,
+    # only some of which may be nested)
+    sa, sb = solids(a), solids(b)
+    if not sa.Solids() or not sb.Solids():
+        return 0.0
+    if distance <= tol:
+        return sa.intersect(sb).Volume()
+    volume = 0.0
+    for s in sa.Solids():
+        for t in sb.Solids():
+            if not boxes_overlap(s, t):
+                continue
+            if t.isInside(s.Vertices()[0].Center()):
+                volume += s.Volume()
+            elif s.isInside(t.Vertices()[0].Center()):
+                volume += t.Volume()
+    return volume
+
+def required(value, script):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return script[value]
+    return value
+
+def check(path, horizon, tol=1e-4):
+    collector = build.Collector()
+    objects = build.run_script(path, collector)
+    script = collector.script
+    config = CHECKS.get(os.path.basename(path), {'parts': {}, 'clearances': []})
+    parts = {name: as_shape(obj) for name, obj, seconds in objects}
+    for name, make in config['parts'].items():
+        parts[name] = as_shape(make(script))
+    needs = {}
+    for a, b, value in config['clearances']:
+        needs[frozenset((a, b))] = required(value, script)
+
+    start = time.perf_counter()
+    trees = {name: bvh(shape) for name, shape in parts.items()}
+    results = [] # (a, b, distance, overlap, required, ok)
+    pruned = 0
+    for a, b in itertools.combinations(parts, 2):
+        ta, tb = trees[a], trees[b]
+        if ta is None or tb is None:
+            continue
+        need = needs.get(frozenset((a, b)), 0)
+        limit = max(horizon, need or 0)
+        if box_distance(ta, tb) >= limit:
+            pruned += 1
+            results.append((a, b, None, 0.0, need, True))
+            continue
+        distance, measured = min_distance(ta, tb, limit)
+        volume = overlap(parts[a], parts[b], distance, tol)
+        ok = need is None or (volume <= OVERLAP_TOL and
+                              distance >= need - tol)
+        results.append((a, b, None if distance >= limit else distance,
+                        volume, need, ok))
+    return results, pruned, time.perf_counter() - start
+
+def report(results, horizon):
+    lines = ['%-16s %-16s %9s %10s %8s' % (
+        'part', 'part', 'distance', 'overlap', 'needs')]
+    for a, b, distance, volume, need, ok in results:
+        if distance is None and ok:
+            continue # far apart
+        lines.append('%-16s %-16s %9s %10.3f %8s  %s' % (
+            a, b, '%.3f' % distance if distance is not None
+            else '>%.2f' % horizon, volume,
+            'joined' if need is None else '%.2f' % need,
+            'ok' if ok else 'FAIL'))
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check clearances between the parts of case scripts.')
+    parser.add_argument('scripts', nargs='+', metavar='script.py')
+    parser.add_argument('--horizon', type=float, default=5,
+                        help="don't measure parts further apart than this "
+                        'many mm (default: 5)')
+    args = parser.parse_args(argv)
+    failed = 0
+    for script in args.scripts:
+        results, pruned, seconds = check(script, args.horizon)
+        print(script)
+        print(report(results, args.horizon))
+        failed += sum(1 for r in results if not r[5])
+        print('%d pairs, %d pruned by bounding box, %d failed, '
+              'checked in %.2fs' % (len(results), pruned,
+              sum(1 for r in results if not r[5]), seconds))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
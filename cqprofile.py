@@ -0,0 +1,120 @@
+import cadquery as cq
+import sys
+import threading
+import time
+from collections import defaultdict
+
+# Opt-in per-operation profiler for the design scripts.
+#
+# enable() wraps the expensive Workplane operations (and STEP imports) so
+# each call records its wall time, the face/edge counts of the solid
+# before and after, and the script line the call came from -- within a
+# long fluent chain, the line of that particular .op().  Operations which
+# call other wrapped operations internally are only counted once, at
+# the outermost call.
+#
+#   python build.py --profile gotchi.py
+
+OPS = [
+    'union', 'cut', 'intersect', 'shell', 'fillet', 'chamfer', 'loft',
+    'extrude', 'revolve', 'sweep', 'cutBlind', 'cutThruAll', 'hole',
+    'cboreHole', 'cskHole', 'split', 'mirror', 'offset2D',
+]
+
+records = [] # (op, stack, seconds, (faces, edges) before, after)
+_originals = {}
+_state = threading.local()
+
+def _counts(obj):
+    if isinstance(obj, cq.Workplane):
+        try:
+            obj = obj.findSolid()
+        except ValueError:
+            return (0, 0)
+    if not isinstance(obj, cq.Shape):
+        return (0, 0)
+    return (len(obj.Faces()), len(obj.Edges()))
+
+def _stack():
+    # the script frames leading to this call, outermost first
+    frames = []
+    f = sys._getframe(2)
+    while f is not None:
+        module = f.f_globals.get('__name__', '')
+        fname = f.f_code.co_filename
+        if module != __name__ and not module.startswith('cadquery') \
+           and not fname.startswith('<frozen'):
+            frames.append('%s:%s:%d' % (
+                fname.rsplit('/', 1)[-1], f.f_code.co_name, f.f_lineno))
+        f = f.f_back
+    return tuple(reversed(frames))
+
+def _wrap(name, fn, is_method=True):
+    def wrapper(*args, **kwargs):
+        if getattr(_state, 'depth', 0):
+            return fn(*args, **kwargs)
+        before = _counts(args[0]) if is_method else (0, 0)
+        stack = _stack()
+        _state.depth = 1
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            _state.depth = 0
+        records.append((name, stack, seconds, before, _counts(result)))
+        return result
+    wrapper.__wrapped__ = fn
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+def enable():
+    import cache
+    if _originals:
+        return
+    for name in OPS:
+        _originals[(cq.Workplane, name)] = getattr(cq.Workplane, name)
+        setattr(cq.Workplane, name, _wrap(name, getattr(cq.Workplane, name)))
+    for module, name in [(cq.importers, 'importStep'),
+                         (cache, 'import_step')]:
+        _originals[(module, name)] = getattr(module, name)
+        setattr(module, name, _wrap(name, getattr(module, name), False))
+
+def disable():
+    for (owner, name), fn in _originals.items():
+        setattr(owner, name, fn)
+    _originals.clear()
+
+def report(limit=40):
+    # aggregate by operation and call site, most expensive first; faces
+    # and edges are counted on the resulting solid, with the change made
+    # by the operation summed over all its calls
+    totals = defaultdict(lambda: [0, 0.0, 0, 0, 0, 0])
+    for op, stack, seconds, before, after in records:
+        t = totals[(op, stack[-1] if stack else '?')]
+        t[0] += 1
+        t[1] += seconds
+        t[2] = max(t[2], after[0])
+        t[3] += after[0] - before[0]
+        t[4] = max(t[4], after[1])
+        t[5] += after[1] - before[1]
+    total = sum(r[2] for r in records) or 1
+    lines = ['%8s %6s %5s %6s %6s %6s %6s  %-12s %s' % (
+        'seconds', '%', 'calls', 'faces', '+', 'edges', '+', 'op', 'line')]
+    for (op, line), (calls, seconds, faces, dfaces, edges, dedges) in sorted(
+            totals.items(), key=lambda kv: -kv[1][1])[:limit]:
+        lines.append('%8.3f %5.1f%% %5d %6d %+6d %6d %+6d  %-12s %s' % (
+            seconds, 100 * seconds / total, calls,
+            faces, dfaces, edges, dedges, op, line))
+    return '\n'.join(lines)
+
+def write_trace(fname):
+    # "collapsed stack" format, as read by flamegraph.pl and speedscope;
+    # one line per stack, weighted by microseconds
+    weights = defaultdict(float)
+    for op, stack, seconds, before, after in records:
+        weights[';'.join(stack + (op,))] += seconds * 1e6
+    with open(fname, 'w') as f:
+        for stack, us in sorted(weights.items()):
+            f.write('%s %d\n' % (stack, round(us)))
@@ -0,0 +1,147 @@
+import numpy as np
+import time
+from xml.sax.saxutils import quoteattr
+
+import cadquery as cq
+
+import mesh
+import tessellate
+from cache import as_shape
+from placement import unlocated
+
+# Whole assemblies as one 3MF file.
+#
+# Every part becomes a named object with its colour, but geometry which
+# appears more than once (the same shape placed at several locations, like
+# the three switches in gotchi.py, or copies of a shape which were only
+# translated) is tessellated and stored once, as a mesh which each copy
+# refers to with a transform.
+#
+#   python build.py --assembly gotchi.py
+
+def hex_color(color):
+    # '#RRGGBBAA', from anything CQ-editor takes as a colour
+    if color is None:
+        return None
+    if isinstance(color, str) and color.startswith('#'):
+        return (color.upper() + 'FF')[:9]
+    if isinstance(color, str):
+        color = cq.Color(color).toTuple()
+    elif isinstance(color, cq.Color):
+        color = color.toTuple()
+    color = tuple(color) + (1.0,) * (4 - len(color))
+    if any(c > 1 for c in color):
+        color = tuple(c / 255 for c in color)
+    return '#' + ''.join('%02X' % round(255 * c) for c in color)
+
+def matrix(shape):
+    # 4x4 transform of shape's location
+    t = shape.wrapped.Location().Transformation()
+    m = np.identity(4)
+    for r in range(3):
+        for c in range(4):
+            m[r, c] = t.Value(r + 1, c + 1)
+    return m
+
+def fingerprint(shape):
+    # the same for copies of a shape which have only been moved (but also
+    # for some which have been turned, see same_corners).  No bounding
+    # box: an exact one of a shape which hasn't been meshed is slow.
+    return (len(shape.Faces()), len(shape.Edges()), len(shape.Vertices()),
+            round(shape.Volume(), 4), round(shape.Area(), 4))
+
+def corners(shape, offset=(0, 0, 0)):
+    points = np.array([v.toTuple() for v in shape.Vertices()]) - offset
+    return points[np.lexsort(np.round(points, 4).T[::-1])]
+
+def same_corners(a, b, offset, tol=1e-4):
+    # whether b is a with all its vertices moved by offset
+    return np.allclose(corners(a), corners(b, offset), atol=tol)
+
+def instances(parts):
+    # parts is [(name, shape, colour)]; returns the distinct meshes as
+    # [(shape, colour)], and for each part (name, mesh index, transform)
+    meshes = []
+    keys = {} # (fingerprint, colour) -> indices of meshes
+    shared = {} # (shape, colour) -> (index of mesh, transform onto it)
+    placed = []
+    for name, shape, color in parts:
+        base = unlocated(shape)
+        if (base, color) in shared:
+            # the same shape, placed somewhere else (see placement.py)
+            i, t = shared[base, color]
+            placed.append((name, i, matrix(shape) @ t))
+            continue
+        t = np.identity(4)
+        key = (fingerprint(base), color)
+        for i in keys.get(key, []):
+            offset = (base.BoundingBox().center -
+                      meshes[i][0].BoundingBox().center).toTuple()
+            if same_corners(meshes[i][0], base, offset):
+                # a moved copy: translate the stored mesh onto it
+                t[:3, 3] = offset
+                break
+        else:
+            i = len(meshes)
+            keys.setdefault(key, []).append(i)
+            meshes.append((base, color))
+        shared[base, color] = (i, t)
+        placed.append((name, i, matrix(shape) @ t))
+    return meshes, placed
+
+def transform_attr(m):
+    # 3MF wants the transposed 3x4, as "m00 m01 m02 m10 ... m32"
+    m = np.vstack([m[:3, :3].T, m[:3, 3]]).ravel()
+    m[abs(m) < 1e-12] = 0 # no -2.2e-16 noise
+    return ' '.join('%.9g' % x for x in m)
+
+def write(fname, parts, quality=tessellate.DEFAULT_QUALITY, jobs=1):
+    # parts is [(name, object, colour or None)]; returns a summary of what
+    # was written
+    start = time.perf_counter()
+    parts = [(name, as_shape(obj), hex_color(color))
+             for name, obj, color in parts]
+    meshes, placed = instances(parts)
+    shapes = [shape for shape, color in meshes]
+    if jobs > 1:
+        arrays = tessellate.tessellate_many(shapes, quality, jobs)
+    else:
+        arrays = [tessellate.tessellate(s, quality) for s in shapes]
+
+    # each colour is named after the first part which has it
+    colors, names = [], []
+    for name, shape, color in parts:
+        if color is not None and color not in colors:
+            colors.append(color)
+            names.append(name)
+    resources = []
+    if colors:
+        resources.append('<basematerials id="1">%s</basematerials>\n' % ''.join(
+            '<base name=%s displaycolor="%s"/>' % (quoteattr(n), c)
+            for n, c in zip(names, colors)))
+    next_id = 2
+    mesh_ids = []
+    triangles = 0
+    for (shape, color), (vertices, faces) in zip(meshes, arrays):
+        vertices, faces = mesh.weld(vertices[faces])
+        triangles += len(faces)
+        name = next(n for n, i, m in placed if i == len(mesh_ids))
+        props = '' if color is None else \
+            ' pid="1" pindex="%d"' % colors.index(color)
+        resources.append('<object id="%d" type="model" name=%s%s>%s'
+                         '</object>\n' % (next_id, quoteattr(name + ' mesh'),
+                                          props, mesh.mesh_xml(vertices, faces)))
+        mesh_ids.append(next_id)
+        next_id += 1
+    build = []
+    for name, i, m in placed:
+        resources.append(
+            '<object id="%d" type="model" name=%s><components>'
+            '<component objectid="%d" transform="%s"/></components>'
+            '</object>\n' % (next_id, quoteattr(name), mesh_ids[i],
+                              transform_attr(m)))
+        build.append('<item objectid="%d"/>\n' % next_id)
+        next_id += 1
+    mesh.write_3mf_model(fname, ''.join(resources), ''.join(build))
+    return {'parts': len(placed), 'meshes': len(meshes),
+            'triangles': triangles, 'seconds': time.perf_counter() - start}
@@ -0,0 +1,114 @@
+import cadquery as cq
+import hashlib
+import json
+import os
+import numpy as np
+from OCP.BRepGProp import BRepGProp
+from OCP.GProp import GProp_GProps
+
+from store import write_atomic
+
+# Geometric fingerprints of the exported parts.
+#
+# Writing a STEP file or tessellating a part for STL takes far longer than
+# measuring it, and most builds change one part of several.  build.py
+# keeps the fingerprint of every part it exports, next to the exports
+# (fingerprints.json), and on the next build only rewrites the files of
+# parts whose fingerprint changed; viewers watching the others don't
+# reload them either.  A part which did change is listed with what
+# changed, and `build.py --check` exports nothing and fails if anything
+# did, which catches an unintended geometry change without diffing STEP
+# text (which differs on every export anyway, by its timestamp).
+#
+# The fingerprint is the part's volume and surface area, its centre of
+# mass and inertia tensor (about that centre, for unit density), all
+# exact B-rep properties, and a hash of its vertices rounded to QUANTUM:
+# mass properties alone miss a feature moved to a symmetric spot.
+#
+#   old, new = record['parts'].get('top'), fingerprint(top)
+#   print(changes(old, new))   # [] if it's the same
+
+QUANTUM = 1e-3 # mm; vertex coordinates are rounded to this for the hash
+REL_TOL = 1e-6 # volume, area and inertia may differ by this fraction
+LENGTH_TOL = 1e-4 # mm; the centre of mass may move by this much
+
+RECORD = 'fingerprints.json'
+
+def vertex_hash(shape):
+    # order independent: the rounded corners are sorted before hashing
+    points = np.array([v.toTuple() for v in shape.Vertices()]).reshape(-1, 3)
+    keys = np.floor(points / QUANTUM + 0.5).astype(np.int64)
+    keys = keys[np.lexsort(keys.T[::-1])]
+    return hashlib.sha256(keys.tobytes()).hexdigest()[:16]
+
+def fingerprint(shape):
+    volume = GProp_GProps()
+    BRepGProp.VolumeProperties_s(shape.wrapped, volume)
+    surface = GProp_GProps()
+    BRepGProp.SurfaceProperties_s(shape.wrapped, surface)
+    # a shell or face has no volume, so weigh it by area instead
+    props = volume if abs(volume.Mass()) > 0 else surface
+    com = props.CentreOfMass()
+    inertia = props.MatrixOfInertia()
+    return {
+        'volume': volume.Mass(),
+        'area': surface.Mass(),
+        'centre': [com.X(), com.Y(), com.Z()],
+        'inertia': [[inertia.Value(i, j) for j in (1, 2, 3)]
+                    for i in (1, 2, 3)],
+        'vertices': vertex_hash(shape),
+    }
+
+def _close(a, b):
+    return abs(a - b) <= REL_TOL * max(abs(a), abs(b))
+
+def changes(old, new):
+    # how new differs from old, as a list of descriptions
+    found = []
+    if not _close(old['volume'], new['volume']):
+        found.append('volume %.2f -> %.2f mm^3' % (
+            old['volume'], new['volume']))
+    if not _close(old['area'], new['area']):
+        found.append('area %.2f -> %.2f mm^2' % (old['area'], new['area']))
+    moved = np.linalg.norm(np.subtract(new['centre'], old['centre']))
+    if moved > LENGTH_TOL:
+        found.append('centre of mass moved %.3f mm' % moved)
+    a, b = np.array(old['inertia']), np.array(new['inertia'])
+    scale = max(abs(a).max(), abs(b).max())
+    if abs(a - b).max() > REL_TOL * scale:
+        found.append('inertia changed by %.2g%%' % (
+            100 * abs(a - b).max() / scale))
+    if old['vertices'] != new['vertices']:
+        found.append('vertices moved')
+    return found
+
+def load(outdir):
+    # what the last build left in outdir: {'parts': {name: fingerprint},
+    # 'files': {file name: {'settings', 'size', 'mtime'}}}
+    try:
+        with open(os.path.join(outdir, RECORD)) as f:
+            record = json.load(f)
+    except (FileNotFoundError, ValueError):
+        record = {}
+    record.setdefault('parts', {})
+    record.setdefault('files', {})
+    return record
+
+def save(outdir, record):
+    write_atomic(os.path.join(outdir, RECORD),
+                 json.dumps(record, indent=1, sort_keys=True).encode())
+
+def stamp(fname, settings):
+    # what's recorded about a file once it's written
+    st = os.stat(fname)
+    return {'settings': settings, 'size': st.st_size,
+            'mtime': st.st_mtime_ns}
+
+def fresh(record, fname, settings):
+    # whether fname is still the file recorded, written with settings (and
+    # not deleted, or replaced by hand, since)
+    entry = record['files'].get(os.path.basename(fname))
+    try:
+        return entry == stamp(fname, settings)
+    except FileNotFoundError:
+        return False
@@ -3,6 +3,11 @@ import numpy as np
 from math import atan2, degrees, radians, cos, sin, tan, sqrt
 from watchy_sizes import *
 from bat import make_battery_holder
+from booleans import cut_all, thru_all, union_all
+from cache import import_step, measure, memoize
+from graph import Graph
+from placement import chain, place, rotation, translation
+from preview import PREVIEW, detail_cut, detail_fillet, import_model
 
 # To do:
 # 1. try harder to push mag connector down into the space below the watch
@@ -23,6 +28,17 @@ from bat import make_battery_holder
 
 watchy_board_width = 33.8
 
+# intermediate parts are cached, and only rebuilt when a dimension they
+# depend on changes (see graph.py)
+graph = Graph('gotchi')
+
+# parts are placed by location rather than copied (see placement.py);
+# parts drawn face up (giladaya's lugs, the switches and their PCBs) are
+# turned to match watchy orientation by
+watchy_orientation = chain(rotation((1,0,0), 180), rotation((0,0,1), 90))
+# and switch 4, in the side of the case, is turned on its side first
+sw4_orientation = chain(rotation((0,0,1), 90), rotation((1,0,0), -90))
+
 # watchy_pcb_bb: xlen=33.8 ylen=37.96
 case_wall_clear = 0.7
 case_wall_bot_clear = 0.5
@@ -84,47 +100,53 @@ switch_positions = [
 ]
 
 # import SCD40 model
-scd40 = cq.importers.importStep('Sensirion_CO2_Sensors_SCD4x_STEP_file.step')
-
-# import Watchy model
-watchy = cq.importers.importStep('Watchy.step').tag("watchy_untrimmed")
-
-# trim off the case mounting straps
-watchy = (watchy
-    .faces("+Y", tag="watchy_untrimmed").faces(">Y[-2]")
-    .tag("rightside")
-    .workplane().split(keepBottom=True)
-    .faces("-Y").faces("<Y[-2]")
-    .tag("leftside")
-    .workplane().split(keepBottom=True)
-    .tag("watchy")
-)
-
-# compute an "all-in" bounding box (mostly for z depth information)
-watchy_bb = watchy.solids().val().BoundingBox()
-
-# find the center of the screen
-watchy = (watchy
-    .faces("-Z", tag="watchy").faces("<<Z[-3]")
-    .tag("watchy_screen")
-)
-#debug(watchy, "watchy_screen_center")
-watchy_screen_center = watchy.val().Center()
+scd40 = import_model('Sensirion_CO2_Sensors_SCD4x_STEP_file.step')
+
+# import Watchy model, trimming off the case mounting straps
+def trim_watchy(watchy):
+    return (watchy.tag("watchy_untrimmed")
+        .faces("+Y", tag="watchy_untrimmed").faces(">Y[-2]")
+        .tag("rightside")
+        .workplane().split(keepBottom=True)
+        .faces("-Y").faces("<Y[-2]")
+        .tag("leftside")
+        .workplane().split(keepBottom=True)
+        .tag("watchy")
+    )
+
+def make_watchy():
+    return trim_watchy(import_step('Watchy.step')).solids(tag="watchy")
+
+# the datums the case is built around; these are cached (see
+# cache.measure), so the Watchy model is only loaded when it changes
+def measure_watchy(watchy):
+    watchy = trim_watchy(watchy)
+    return {
+        # an "all-in" bounding box (mostly for z depth information)
+        'watchy_bb': watchy.solids().val().BoundingBox(),
+        # the center of the screen
+        'watchy_screen_center': (watchy
+            .faces("-Z", tag="watchy").faces("<<Z[-3]")
+            .val().Center()),
+        # the top of the PCB
+        'watchy_pcb_top': (watchy
+            .faces("-Z", tag="watchy").faces("<<Z[-6]")
+            .val().Center()),
+        # the bottom of the PCB
+        'watchy_pcb_bb': (watchy
+            .faces("+Z", tag="watchy").faces("<<Z[-4]")
+            .val().BoundingBox()),
+        'watchy_pcb_bottom': (watchy
+            .faces("+Z", tag="watchy").faces("<<Z[-4]")
+            .val().Center()),
+    }
 
-# find the top of the PCB
-watchy = (watchy
-    .faces("-Z", tag="watchy").faces("<<Z[-6]")
-    .tag("watchy_pcb_top")
-)
-watchy_pcb_top = watchy.val().Center()
-
-# find the bottom of the PCB
-watchy = (watchy
-    .faces("+Z", tag="watchy").faces("<<Z[-4]")
-    .tag("watchy_pcb_bottom")
-)
-watchy_pcb_bb = watchy.val().BoundingBox()
-watchy_pcb_bottom = watchy.val().Center()
+watchy_datums = measure('Watchy.step', measure_watchy)
+watchy_bb = watchy_datums['watchy_bb']
+watchy_screen_center = watchy_datums['watchy_screen_center']
+watchy_pcb_top = watchy_datums['watchy_pcb_top']
+watchy_pcb_bb = watchy_datums['watchy_pcb_bb']
+watchy_pcb_bottom = watchy_datums['watchy_pcb_bottom']
 
 # battery stats
 def make_battery(type='10280', xOffset=0, yOffset=0, zOffset=0):
@@ -171,10 +193,10 @@ def make_lugs(p_outerLength=39, p_outerHeight=10, p_inset_depth=1, lugs_dia=5, l
         .close()
         .extrude(-lugs_th)
     )
-    lugs = (lugs
+    lugs = detail_fillet(lugs
         .faces("<X")
-        .edges("not(|(0,-1,1))")
-        .fillet(lugs_th/2.0)
+        .edges("not(|(0,-1,1))"), lugs_th/2.0)
+    lugs = (lugs
         .faces(">X")
         .workplane(
             origin=(0, -p_outerLength / 2.0 - p_outerHeight * 0.25 + 0.5, p_outerHeight * 0.25 - p_inset_depth + 0.5), 
@@ -184,15 +206,14 @@ def make_lugs(p_outerLength=39, p_outerHeight=10, p_inset_depth=1, lugs_dia=5, l
         #.extrude(p_strap_width + tbar_hole_depth * 2.0)
         .mirror("ZY", union=True)
         .mirror("XZ", union=True)
-        # rotate & translate giladaya's lugs to match our case orientation
-        .rotate((0,0,0),(1,0,0), 180)
-        .rotate((0,0,0),(0,0,1), 90)
     )
+    # rotate & translate giladaya's lugs to match our case orientation
     lugs_translate = (watchy_screen_center.x, watchy_screen_center.y, 0)
-    return lugs.translate(lugs_translate)
+    return place(lugs, watchy_orientation, translation(lugs_translate))
 
 # magnetic connector
 mag_translate = None # will be computed below
+@memoize()
 def make_mag(clearance=0, inner_clearance=None, extra=0):
     epsilon=.001 if clearance == 0 else 0
     if inner_clearance is None:
@@ -212,20 +233,28 @@ def make_mag(clearance=0, inner_clearance=None, extra=0):
         )
         prev = m.faces("+Z and >Z").workplane()
         l.append(m)
-    m = l.pop(0)
-    for m2 in l:
-        m = m.union(m2)
+    m = union_all(l[0], l[1:])
     # zero is "the bottom edge" and "the outside face"
-    return m.rotate((0,0,0), (1,0,0), -90).translate((0,0,-3.5))
+    return place(m, rotation((1,0,0), -90), translation((0,0,-3.5)))
+
+# clearance around the magnetic connector; shelling is slow, so this is
+# worth keeping around between builds (and skipped when previewing)
+@memoize(disk=True)
+def make_mag_clearance(extra=0):
+    if PREVIEW:
+        return make_mag(extra=extra)
+    return make_mag(extra=extra).shell(0.25)
 
 # pushbutton switch
+@memoize(disk=True)
 def make_sw(H=switch_height):
     sw = (cq.Workplane("XY").tag("base")
         .rect(3.35, 1).extrude(0.85)
         .workplaneFromTagged("base")
         .rect(2, 3.35).extrude(0.85)
         .faces(">Z").edges(">X or <X or >Y or <Y")
-        .fillet((3.35-3.1)/2)
+    )
+    sw = (detail_fillet(sw, (3.35-3.1)/2)
         .workplaneFromTagged("base")
         .pushPoints([(0,-1),(0,1)])
         .rect(3.95, 0.38).extrude(.15)
@@ -235,23 +264,18 @@ def make_sw(H=switch_height):
         .rect(3.1, 3.1).extrude(0.85, combine=False)
         .edges("|Z").chamfer(0.2)
     )
-    body_top = (sw
+    body_top = detail_fillet(sw
         .workplaneFromTagged("base").workplane(offset=0.8)
         .rect(3.1-0.4, 3.1-0.45).extrude(1.2 - 0.8, combine=False)
-        .faces(">Z").edges()
-        .fillet(0.35)
-    )
+        .faces(">Z").edges(), 0.35)
     plunger = (sw
         .workplaneFromTagged("base").workplane(offset=0.85)
         .circle(1.8/2).extrude(H-0.85)
     )
-    sw = sw.union(body_bottom).union(body_top).union(plunger)
-    # rotate to match watchy orientation
-    return (sw
-            .rotate((0,0,0), (1,0,0), 180)
-            .rotate((0,0,0), (0,0,1), 90)
-    )
+    sw = union_all(sw, [body_bottom, body_top, plunger])
+    return place(sw, watchy_orientation)
 
+@memoize()
 def make_sw_cutout(extra_depth=10, extra_length=2.5, H=switch_height):
     # pcb is 4x5, leave at least 0.5mm on all side (so 5x6); we're doing 4.75x7
     cheat=0.25 # trim the top clearance
@@ -262,38 +286,34 @@ def make_sw_cutout(extra_depth=10, extra_length=2.5, H=switch_height):
           .faces(">Z").workplane()
           .circle(2/2).extrude(H-1.2 + extra_depth)
     )
-    # rotate to match watchy orientation
-    return (sw
-            .rotate((0,0,0), (1,0,0), 180)
-            .rotate((0,0,0), (0,0,1), 90)
-    )
-    return sw
+    return place(sw, watchy_orientation)
 
-def sw4_translate(obj, perp_distance=(switch_proud - switch_height), par_distance=5.5):
+# where switch 4 (and its cutouts and PCB) go, once turned on their side
+def sw4_location(perp_distance=(switch_proud - switch_height), par_distance=5.5):
     desired_wall_thick = 1
     desired_pcb_clearance = 0.25
     total_pcb_clear = 4 + 2*desired_pcb_clearance + 2*desired_wall_thick
     case2_top_thick = 2.56346 # hack hack hack
 
     perp_distance += screw_inner_lug_radius
-    return (obj
-        .rotate((0,0,0),(0,0,1), mag_angle2)
-        .translate(watchy_screen_center +
+    return chain(
+        rotation((0,0,1), mag_angle2),
+        translation(watchy_screen_center +
                    cq.Vector(0,
                              -faceplate_center_shift,
                              -watchy_screen_center.z
-                             + mag_translate.z - 3.5))
-        .translate((screw_separation_h/2, -screw_separation_w/2, 0))
-        .translate((cos(radians(-90 + mag_angle2))*perp_distance,
-                    sin(radians(-90 + mag_angle2))*perp_distance, 0))
-        .translate((cos(radians(-180 + mag_angle2))*par_distance,
-                    sin(radians(-180 + mag_angle2))*par_distance, 0))
+                             + mag_translate.z - 3.5)),
+        translation((screw_separation_h/2, -screw_separation_w/2, 0)),
+        translation((cos(radians(-90 + mag_angle2))*perp_distance,
+                     sin(radians(-90 + mag_angle2))*perp_distance, 0)),
+        translation((cos(radians(-180 + mag_angle2))*par_distance,
+                     sin(radians(-180 + mag_angle2))*par_distance, 0)),
         ## "as high as it could go"
-        .translate((0,0,(total_pcb_clear/2) - case2_top_thick))
+        translation((0,0,(total_pcb_clear/2) - case2_top_thick)),
         ## centered between the top options
-        #.translate((0,0,(case2_thick + case2_top_thick)/2 - case2_top_thick))
+        #translation((0,0,(case2_thick + case2_top_thick)/2 - case2_top_thick)),
         ## "as low as it could go"
-        #.translate((0,0,case2_thick - (total_pcb_clear/2)))
+        #translation((0,0,case2_thick - (total_pcb_clear/2))),
     )
 
 case1_depth = watchy_bb.zmax - watchy_pcb_top.z + case_wall_clear
@@ -323,17 +343,17 @@ def make_switch_plate(wp):
     )
 
 case2_thick = watchy_bb.zmax + case_wall_bot_clear + case_wall_thick - watchy_pcb_bottom.z
-case2 = (cq.Workplane("XY")
+def case2_plane():
+    return (cq.Workplane("XY")
     .workplane(offset=watchy_pcb_bottom.z,
                centerOption='ProjectedOrigin',
                origin=watchy_screen_center + cq.Vector(0,-faceplate_center_shift,0))
-    .tag("case2_bottom_top")
-    .rect(screw_separation_h + 2*screw_inner_lug_radius,
-          screw_separation_w + 2*screw_inner_lug_radius)
-    .extrude(case2_thick, combine=False)
-    .faces("not(+Z or -Z)").edges("+Z or -Z")
-    .fillet(screw_inner_lug_radius)
-)
+    )
+
+# (re)attach a case2 solid to its reference plane, so that the
+# "case2_bottom_top" tag works even if the solid was built elsewhere
+def on_case2_plane(obj):
+    return case2_plane().tag("case2_bottom_top").newObject(obj.vals())
 
 # extrude a bit for the magnetic connector
 # have to do some math here to make edges tangent with screw_inner_lug
@@ -364,15 +384,16 @@ def make_mag_support(workplane):
     .extrude(case2_thick, combine=False)
     )
 
-mag_support = (make_mag_support(case2.workplaneFromTagged("case2_bottom_top"))
-    .faces("-Y and <<Y")
-)
 # find center of the Y face
 #mag_support_bb = mag_support.val().BoundingBox()
-mag_support_center = mag_support.val().Center()
-mag_support= (mag_support
-    .edges("+Z or -Z").fillet(2)
+mag_support_center = (make_mag_support(case2_plane())
+    .faces("-Y and <<Y").val().Center()
 )
+def make_filleted_mag_support():
+    return detail_fillet(make_mag_support(case2_plane())
+        .faces("-Y and <<Y")
+        .edges("+Z or -Z"), 2)
+graph.add('mag_support', make_filleted_mag_support)
 mag_translate = mag_support_center + cq.Vector(
     # "center of mag_support" is case2_thick; then move up to compensate for
     # bottom fillet, which is case_wall_thick
@@ -380,114 +401,135 @@ mag_translate = mag_support_center + cq.Vector(
     (0,0,-(case2_thick/2) + 3.5)
 )
 
-case2 = (case2
-    .union(mag_support)
-)
-
 # cutout2 for switch #4
-sw4_cutout = sw4_translate(make_sw_cutout()
-        .rotate((0,0,0),(0,0,1), 90)
-        .rotate((0,0,0),(1,0,0),-90)
-)
-sw4_cutout_short = sw4_translate(
-    make_sw_cutout(extra_depth=switch_pcb_thick + switch_pcb_thick_clearance)
-    .union(make_sw_cutout(extra_length=-1))
-        .rotate((0,0,0),(0,0,1), 90)
-        .rotate((0,0,0),(1,0,0),-90)
-)
+def make_sw4_cutout():
+    return place(make_sw_cutout(), sw4_orientation, sw4_location())
+graph.add('sw4_cutout', make_sw4_cutout)
+def make_sw4_cutout_short():
+    cutout = (make_sw_cutout(extra_depth=switch_pcb_thick + switch_pcb_thick_clearance)
+        .union(make_sw_cutout(extra_length=-1))
+    )
+    return place(cutout, sw4_orientation, sw4_location())
+graph.add('sw4_cutout_short', make_sw4_cutout_short)
+
+# the case2 body (before any cutouts) is shared by case2 and case2_top
+def make_case2_body(mag_support):
+    case2 = (case2_plane()
+        .tag("case2_bottom_top")
+        .rect(screw_separation_h + 2*screw_inner_lug_radius,
+              screw_separation_w + 2*screw_inner_lug_radius)
+        .extrude(case2_thick, combine=False)
+        .faces("not(+Z or -Z)").edges("+Z or -Z")
+        .fillet(screw_inner_lug_radius)
+    )
+    case2 = (case2
+        .union(mag_support)
+    )
+    # now add switch support
+    case2_switch = (make_switch_plate(
+        case2
+        .workplaneFromTagged("case2_bottom_top")
+        .center(0,faceplate_center_shift))
+        .extrude(case2_thick, combine=False)
+        .faces("+Z and >Z").edges("|Y").chamfer(case2_thick-bottom_fillet)
+        .faces("-X and <X").edges("|Y and >Z")
+    )
+    case2_switch = detail_fillet(detail_fillet(case2_switch, bottom_fillet)
+        .faces("<X").edges("|Z"), switch_plate_fillet)
+    return case2.union(case2_switch)
+graph.add('case2_body', make_case2_body, 'mag_support')
 
-# now add switch support
-case2_switch = (make_switch_plate(
-    case2
-    .workplaneFromTagged("case2_bottom_top")
-    .center(0,faceplate_center_shift))
-    .extrude(case2_thick, combine=False)
-    .faces("+Z and >Z").edges("|Y").chamfer(case2_thick-bottom_fillet)
-    .faces("-X and <X").edges("|Y and >Z").fillet(bottom_fillet)
-    .faces("<X").edges("|Z").fillet(switch_plate_fillet)
-)
-case2 = (case2
-    .union(case2_switch)
-    .tag("case2_body_prelim")
-    .faces("<Z").tag("case2_split_face")
-)
 case2_top_thick = (
     watchy_pcb_bottom.z - watchy_screen_center.z + screen_clearance
 )
-case2_top = (case2
-    .workplaneFromTagged("case2_bottom_top")
-    .faces(tag="case2_split_face").wires().toPending()
-    .extrude(-case2_top_thick, combine=False)
-)
-case2_mag_shield = (cq.Workplane("XY")
-    .copyWorkplane(case2.workplaneFromTagged("case2_bottom_top"))
-    .workplane(centerOption='ProjectedOrigin', origin=mag_translate, invert=True)
-    .center(0,-5)
-    .rect(23,10).extrude(3.5, combine=False) # should be 4.5
-    .faces("-Z").edges("|Y").fillet(3.25)
-)
-#debug(case2_mag_shield)
-case2_top = (case2_top
-    .union(case2_mag_shield)
-    # cut out space for auxilliary PCBs
-    .workplaneFromTagged("case2_bottom_top")
-    .workplane(centerOption='ProjectedOrigin', origin=watchy_screen_center)
-    .moveTo(pcb3_position[0], pcb3_position[1])
-    .rect(switch_pcb_width + pcb3_extra_width, switch_pcb_height)
-    .moveTo(pcb4_position[0], pcb4_position[1])
-    .rect(switch_pcb_width + pcb4_extra_width, switch_pcb_height)
-    .cutBlind(-(case2_top_thick - case_wall_thick))
-    # cut out space for the main PCB
-    .workplaneFromTagged("case2_bottom_top")
-    .workplane(centerOption='ProjectedOrigin', origin=watchy_pcb_bb.center)
-    .rect(watchy_pcb_bb.xlen + 2*case_wall_clear,
-          watchy_pcb_bb.ylen + 2*case_wall_clear)
-    .cutThruAll()
-)
-case2 = (case2
-    .workplaneFromTagged("case2_bottom_top")
-    .faces("+Z", tag="case2_body_prelim").edges().fillet(bottom_fillet)
-    .cut(make_mag(extra=10).translate(mag_translate))
-    .cut(make_mag(extra=10).translate(mag_translate).shell(0.25))
-    .cut(sw4_cutout)
-    # boss to support the switches
-    .workplaneFromTagged("case2_bottom_top")
-    .workplane(centerOption='ProjectedOrigin', origin=watchy_screen_center)
-    .center(switch_positions[1][0], switch_positions[1][1])
-    .rect(switch_pcb_height, switch_pcb_width)
-         # shrink rectangle to provide a bit of clearance
-         .offset2D(-0.25)
-    .extrude((watchy_screen_center.z + switch_positions[1][2] + switch_pcb_thick + switch_pcb_thick_clearance)
-             - watchy_pcb_bottom.z)
-    # cut out space for auxilliary PCBs
-    .workplaneFromTagged("case2_bottom_top")
-    .workplane(centerOption='ProjectedOrigin', origin=watchy_screen_center)
-    .moveTo(pcb3_position[0], pcb3_position[1])
-    .rect(switch_pcb_width + pcb3_extra_width, switch_pcb_height)
-    .moveTo(pcb4_position[0], pcb4_position[1])
-    .rect(switch_pcb_width + pcb4_extra_width, switch_pcb_height)
-    .cutBlind(case2_thick - case_wall_thick)
-    .tag("case2_body")
-    # cut out space for the PCB
-    .workplaneFromTagged("case2_bottom_top")
-    .workplane(centerOption='ProjectedOrigin', origin=watchy_pcb_bb.center)
-    .rect(watchy_pcb_bb.xlen + 2*case_wall_clear,
-          watchy_pcb_bb.ylen + 2*case_wall_clear)
-    .extrude(watchy_bb.zmax - watchy_pcb_bottom.z + case_wall_bot_clear,
-             both=True, combine=False).tag("pcb_cutout")
-    .edges("|Z", tag="pcb_cutout")
-    .chamfer(case_wall_clear + 2.7).tag("pcb_cutout2")
-)
-case2 = case2.solids(tag="case2_body").cut(case2.solids(tag="pcb_cutout2"))
-case2 = (case2
-    .workplaneFromTagged("case2_bottom_top")
-    .rect(screw_separation_h,
-          screw_separation_w, forConstruction=True)
-    .vertices().circle(m2_tap_diam/2).cutThruAll()
-)
-show_object(case2, name='case2')
-
-def make_top_plate(case2_top):
+def make_case2_top(case2_body):
+    case2_top = (on_case2_plane(case2_body)
+        .faces("<Z").wires().toPending()
+        .extrude(-case2_top_thick, combine=False)
+    )
+    case2_mag_shield = (cq.Workplane("XY")
+        .copyWorkplane(case2_plane())
+        .workplane(centerOption='ProjectedOrigin', origin=mag_translate, invert=True)
+        .center(0,-5)
+        .rect(23,10).extrude(3.5, combine=False) # should be 4.5
+        .faces("-Z").edges("|Y")
+    )
+    case2_mag_shield = detail_fillet(case2_mag_shield, 3.25)
+    #debug(case2_mag_shield)
+    return (case2_top
+        .union(case2_mag_shield)
+        # cut out space for auxilliary PCBs
+        .workplaneFromTagged("case2_bottom_top")
+        .workplane(centerOption='ProjectedOrigin', origin=watchy_screen_center)
+        .moveTo(pcb3_position[0], pcb3_position[1])
+        .rect(switch_pcb_width + pcb3_extra_width, switch_pcb_height)
+        .moveTo(pcb4_position[0], pcb4_position[1])
+        .rect(switch_pcb_width + pcb4_extra_width, switch_pcb_height)
+        .cutBlind(-(case2_top_thick - case_wall_thick))
+        # cut out space for the main PCB
+        .workplaneFromTagged("case2_bottom_top")
+        .workplane(centerOption='ProjectedOrigin', origin=watchy_pcb_bb.center)
+        .rect(watchy_pcb_bb.xlen + 2*case_wall_clear,
+              watchy_pcb_bb.ylen + 2*case_wall_clear)
+        .cutThruAll()
+    )
+graph.add('case2_top', make_case2_top, 'case2_body')
+
+# the outside of case2 is finished once the bottom edges are filleted;
+# the battery holder is positioned against it
+def make_case2_rough(case2_body):
+    return detail_fillet(on_case2_plane(case2_body)
+        .faces("+Z").edges(), bottom_fillet)
+graph.add('case2_rough', make_case2_rough, 'case2_body')
+
+def make_case2(case2_rough, sw4_cutout):
+    case2 = cut_all(on_case2_plane(case2_rough),
+        [place(make_mag(extra=10), translation(mag_translate)), sw4_cutout])
+    case2 = (detail_cut(case2,
+            place(make_mag_clearance(extra=10), translation(mag_translate)))
+        # boss to support the switches
+        .workplaneFromTagged("case2_bottom_top")
+        .workplane(centerOption='ProjectedOrigin', origin=watchy_screen_center)
+        .center(switch_positions[1][0], switch_positions[1][1])
+        .rect(switch_pcb_height, switch_pcb_width)
+             # shrink rectangle to provide a bit of clearance
+             .offset2D(-0.25)
+        .extrude((watchy_screen_center.z + switch_positions[1][2] + switch_pcb_thick + switch_pcb_thick_clearance)
+                 - watchy_pcb_bottom.z)
+    )
+    # the rest is all cut out at once
+    aux_pcbs = (case2
+        # space for auxilliary PCBs
+        .workplaneFromTagged("case2_bottom_top")
+        .workplane(centerOption='ProjectedOrigin', origin=watchy_screen_center)
+        .moveTo(pcb3_position[0], pcb3_position[1])
+        .rect(switch_pcb_width + pcb3_extra_width, switch_pcb_height)
+        .moveTo(pcb4_position[0], pcb4_position[1])
+        .rect(switch_pcb_width + pcb4_extra_width, switch_pcb_height)
+        .extrude(case2_thick - case_wall_thick, combine=False)
+    )
+    pcb_cutout = (case2
+        # space for the PCB
+        .workplaneFromTagged("case2_bottom_top")
+        .workplane(centerOption='ProjectedOrigin', origin=watchy_pcb_bb.center)
+        .rect(watchy_pcb_bb.xlen + 2*case_wall_clear,
+              watchy_pcb_bb.ylen + 2*case_wall_clear)
+        .extrude(watchy_bb.zmax - watchy_pcb_bottom.z + case_wall_bot_clear,
+                 both=True, combine=False)
+        .edges("|Z")
+        .chamfer(case_wall_clear + 2.7)
+    )
+    screw_holes = (case2
+        .workplaneFromTagged("case2_bottom_top")
+        .rect(screw_separation_h,
+              screw_separation_w, forConstruction=True)
+        .vertices().circle(m2_tap_diam/2)
+        .extrude(thru_all(case2), both=True, combine=False)
+    )
+    return cut_all(case2, [aux_pcbs, pcb_cutout, screw_holes])
+graph.add('case2', make_case2, 'case2_rough', 'sw4_cutout')
+
+def make_top_plate(case2_top, sw4_cutout_short):
     top_plate = (cq.Workplane("XY")
     # create workplane, centered on the top plate
     # (which is offset from the screen)
@@ -507,15 +549,14 @@ def make_top_plate(case2_top):
     .extrude(top_plate_thick)
     )
     # extrude switch plate.
-    top_plate = top_plate.union(make_switch_plate(
+    top_plate = top_plate.union(detail_fillet(make_switch_plate(
     top_plate
     .workplaneFromTagged("top_plate")
     .center(0,-faceplate_center_shift))
     .tag("switch_plate")
     .extrude(top_plate_thick)
-    .faces("not(+Z or -Z)").edges("+Z or -Z")
-    .fillet(switch_plate_fillet)
-    )
+    .faces("not(+Z or -Z)").edges("+Z or -Z"),
+    switch_plate_fillet))
     # final bits
     top_plate = (top_plate
     # cut out screen
@@ -524,35 +565,43 @@ def make_top_plate(case2_top):
     .rect(30,30).cutThruAll(taper=45) # taper is in degrees
     # add to other other part of top case
     .union(case2_top)
+    )
     # cut out mag connector
-    .cut(make_mag(extra=4).translate(mag_translate))
-    .cut(make_mag(extra=4).translate(mag_translate).shell(0.25))
-    .cut(sw4_cutout_short)
+    top_plate = cut_all(top_plate,
+        [place(make_mag(extra=4), translation(mag_translate)), sw4_cutout_short])
+    top_plate = (detail_cut(top_plate,
+        place(make_mag_clearance(extra=4), translation(mag_translate)))
     # countersink the screw holes
     .workplaneFromTagged("top_plate")
     .faces(tag="top_plate_top").workplane(centerOption='ProjectedOrigin')
     .rect(screw_separation_h, screw_separation_w, forConstruction=True)
     .vertices()
     .cboreHole(m2_clear_diam, m2_head_clear_diam, m2_head_thick)
+    )
     # holes for gotchi switches
+    switch_holes = (top_plate
     .workplaneFromTagged("top_plate")
     .faces(tag="top_plate_top").workplane(
         centerOption='ProjectedOrigin', origin=watchy_screen_center
     )
     .pushPoints(switch_positions)
-    .circle(2/2).cutThruAll()
+    .circle(2/2).extrude(thru_all(top_plate), both=True, combine=False)
+    )
     # pcb clearance for gotchi switches
+    switch_pcbs = (top_plate
     .faces("+Z and >Z").workplane(
         centerOption='ProjectedOrigin', origin=watchy_screen_center,
         invert=True
     ).center(switch_positions[1][0] + extra_switch_pcb_gap/2, switch_positions[1][1])
     .rect(switch_pcb_height + extra_switch_pcb_gap, switch_pcb_width)
-    .cutBlind(case2_top_thick + top_plate_thick - switch_plate_thick)
+    .extrude(case2_top_thick + top_plate_thick - switch_plate_thick,
+             combine=False)
     )
-    return top_plate
+    return cut_all(top_plate, [switch_holes, switch_pcbs])
+graph.add('top_plate', make_top_plate, 'case2_top', 'sw4_cutout_short')
 
-if True:
-    show_object(make_lugs(
+def make_case_lugs():
+    lugs = make_lugs(
         # length
         (screw_separation_h/2 + screw_inner_lug_radius) +
         (faceplate_height/2 + switch_plate_depth),
@@ -564,39 +613,30 @@ if True:
         3,
         # lug thickness
         2
-    ).translate((
+    )
+    return place(lugs, translation((
         # the switch plate makes our case not centered on watchy, so shift
         ((screw_separation_h/2 + screw_inner_lug_radius) -
          (faceplate_height/2 + switch_plate_depth))/2,
         0,
         # lugs zero is the bottom of the case, so make that match
         watchy_pcb_bottom.z + case2_thick
-    )), name='lugs')
-
-if False:
-    show_object(watchy.solids(tag="watchy"), name='watchy')
-
-if False:
-    show_object(make_case1(), name='case')
-
-if True:
-    show_object(make_top_plate(case2_top), name='top_plate')
-elif True:
-    show_object(case2_top, name='case2_top')
-
-if False:
-    show_object(make_mag().translate(mag_translate), name='magnetic_latch')
+    )))
+graph.add('lugs', make_case_lugs)
 
-if True:
+battery_holder_radius = 6.55 + 0.6 # clip offset + pcb thickness
+battery_holder_length = 37 # pcb length
+def battery_base_pos(case2_rough):
+    return (case2_rough.faces("+Y and >Y").val().Center()
+        + cq.Vector(0,battery_holder_radius,-0.8)
+    )
+def make_battery_assembly(case2_rough):
     #show_object(make_battery('10280', xOffset=3, yOffset=53, zOffset=1), name='10280')
-    battery_holder_radius = 6.55 + 0.6 # clip offset + pcb thickness
-    battery_holder_length = 37 # pcb length
-    battery_holder = (make_battery_holder()
+    battery_holder = place(make_battery_holder(),
         # rotate to match watchy orientation
-        .rotate((0,0,0),(0,0,1),90)
+        rotation((0,0,1), 90),
         # put center at the rotation axis of the battery
-        .translate((0,0,-battery_holder_radius))
-    )
+        translation((0,0,-battery_holder_radius)))
     # mock up some end caps (total length 37mm)
     # adjust radius to make battery_holder_radius the flat-to-flat distance
     cap_oct_radius = battery_holder_radius / cos(radians(45/2)) # about 7.7
@@ -615,113 +655,101 @@ if True:
         .cutBlind(cap_thick + chamfer_amt - cap_wall)
     )
     end_cap = end_cap.union(end_cap.mirror("YZ"))
-    # decorate it a bit
-    end_cap = (end_cap.faces("+X and >X").wires().toPending())
-    nominal_start_radius = (cap_oct_radius - chamfer_amt) * cos(radians(45/2))
-    start_angle = 45
-    cap_radius = nominal_start_radius / sin(radians(start_angle))
-    angle_increment = 9
-    last_z = cos(radians(start_angle))*cap_radius
-    for angle in range(start_angle-angle_increment, angle_increment, -angle_increment):
-        new_z = cos(radians(angle))*cap_radius
-        new_r = sin(radians(angle))*cap_radius
-        end_cap = end_cap.workplane(offset=new_z - last_z).circle(new_r)
-        last_z = new_z
-    end_cap = end_cap.loft(combine=True)
-    end_cap = (end_cap
-        # neck
-        .faces("-X and <X").workplane()
-        .circle(6.7/2).extrude(0.5)
-        # knurl
-        .faces("-X and <X").workplane()
-    )
-    knurl = (cq.Workplane("YZ").copyWorkplane(end_cap)
-        .circle(9.3/2).extrude(2.8)
-        .polygon(12, 9.3, forConstruction=True).vertices()
-        .circle(0.5).cutThruAll()
-    )
-    end_cap = (end_cap
-        .solids()
-        .union(knurl)
-        # second knurl (with diamonds)
-        .faces("-X and <X").workplane()
-    )
-    knurl2 = (cq.Workplane("YZ").copyWorkplane(end_cap)
-        .circle(6.8/2).extrude(0.8)
-    )
-    knurl2_center = knurl2.faces("-X and <X").val().Center()
-    divot = (knurl2
-        .faces("-X and <X").workplane()
-        .circle(5.5/2).workplane(offset=-.4).circle(2.0/2)
-        .loft(combine=False)
-    )
-    knurl2 = knurl2.cut(divot)
-    poker = (cq.Workplane("YZ").copyWorkplane(end_cap)
-        .center(0, (6.8 - 1.4 + 2*.3)/2)
-        .rect(1, 1.4).extrude(1.1)
-    )
-    num_pokers = 3
-    for i in range(num_pokers):
-        knurl2 = knurl2.union(poker.rotate(knurl2_center, knurl2_center + cq.Vector(1,0,0), 360*i/num_pokers))
-
-    end_cap = (end_cap.solids().union(knurl2))
+    # decorate it a bit (not worth the time when previewing)
+    if not PREVIEW:
+        end_cap = (end_cap.faces("+X and >X").wires().toPending())
+        nominal_start_radius = (cap_oct_radius - chamfer_amt) * cos(radians(45/2))
+        start_angle = 45
+        cap_radius = nominal_start_radius / sin(radians(start_angle))
+        angle_increment = 9
+        last_z = cos(radians(start_angle))*cap_radius
+        for angle in range(start_angle-angle_increment, angle_increment, -angle_increment):
+            new_z = cos(radians(angle))*cap_radius
+            new_r = sin(radians(angle))*cap_radius
+            end_cap = end_cap.workplane(offset=new_z - last_z).circle(new_r)
+            last_z = new_z
+        end_cap = end_cap.loft(combine=True)
+        end_cap = (end_cap
+            # neck
+            .faces("-X and <X").workplane()
+            .circle(6.7/2).extrude(0.5)
+            # knurl
+            .faces("-X and <X").workplane()
+        )
+        knurl = (cq.Workplane("YZ").copyWorkplane(end_cap)
+            .circle(9.3/2).extrude(2.8)
+            .polygon(12, 9.3, forConstruction=True).vertices()
+            .circle(0.5).cutThruAll()
+        )
+        end_cap = (end_cap
+            .solids()
+            .union(knurl)
+            # second knurl (with diamonds)
+            .faces("-X and <X").workplane()
+        )
+        knurl2 = (cq.Workplane("YZ").copyWorkplane(end_cap)
+            .circle(6.8/2).extrude(0.8)
+        )
+        knurl2_center = knurl2.faces("-X and <X").val().Center()
+        divot = (knurl2
+            .faces("-X and <X").workplane()
+            .circle(5.5/2).workplane(offset=-.4).circle(2.0/2)
+            .loft(combine=False)
+        )
+        knurl2 = knurl2.cut(divot)
+        poker = (cq.Workplane("YZ").copyWorkplane(end_cap)
+            .center(0, (6.8 - 1.4 + 2*.3)/2)
+            .rect(1, 1.4).extrude(1.1)
+        )
+        num_pokers = 3
+        knurl2 = union_all(knurl2, [
+            place(poker, rotation((1,0,0), 360*i/num_pokers, knurl2_center))
+            for i in range(num_pokers)])
+
+        end_cap = (end_cap.solids().union(knurl2))
     battery_holder = battery_holder.union(end_cap)
 
-    base_pos = (case2.faces("+Y and >Y").val().Center()
-        + cq.Vector(0,battery_holder_radius,-0.8)
-    )
     if False: # option 1 ("upside down")
-        pass
+        orientation = cq.Location()
     elif True: # option 2 ("in")
-        battery_holder = (battery_holder
-            .rotate((0,0,0),(1,0,0),90)
-        )
+        orientation = rotation((1,0,0), 90)
     elif False: # option 3 ("out")
-        battery_holder = (battery_holder
-            .rotate((0,0,0),(1,0,0),-90)
-        )
+        orientation = rotation((1,0,0), -90)
     else: # option 4 ("right side up")
-        battery_holder = (battery_holder
-            .rotate((0,0,0),(1,0,0),180)
-        )
-    battery_holder = battery_holder.translate(base_pos)
-    show_object(battery_holder, name='10280')
-
-if True:
-    cnt = 1
-    for pos in switch_positions:
-        show_object(make_sw().translate(watchy_screen_center).translate(pos),
-                    name = "Switch_"+str(cnt))
-        cnt += 1
-    # pcb for sw1-3
+        orientation = rotation((1,0,0), 180)
+    return place(battery_holder, orientation,
+                 translation(battery_base_pos(case2_rough)))
+graph.add('10280', make_battery_assembly, 'case2_rough')
+
+# the switches are all the one (cached) make_sw() shape, placed by
+# location, so they're not graph nodes of their own
+def make_switch(pos):
+    return place(make_sw(), translation(watchy_screen_center), translation(pos))
+
+# pcb for sw1-3
+def make_pcb1():
     pcb1 = (cq.Workplane("XY").workplane(invert=True)
             .center(0,-0.5).rect(22.5, 5).extrude(switch_pcb_thick)
-            # rotate to match watchy orientation
-            .rotate((0,0,0), (1,0,0), 180)
-            .rotate((0,0,0), (0,0,1), 90)
-    ).translate(watchy_screen_center).translate(switch_positions[1])
-    show_object(pcb1, name='Switch_PCB_1')
-
-    sw4 = sw4_translate(make_sw()
-        .rotate((0,0,0),(0,0,1), 90)
-        .rotate((0,0,0),(1,0,0),-90),
-        switch_proud - switch_height
-    )
-    show_object(sw4, name='Switch_4')
-    # pcb for sw4
+    )
+    return place(pcb1, watchy_orientation, translation(watchy_screen_center),
+                 translation(switch_positions[1]))
+graph.add('Switch_PCB_1', make_pcb1)
+
+def make_sw4():
+    return place(make_sw(), sw4_orientation,
+                 sw4_location(switch_proud - switch_height))
+
+# pcb for sw4
+def make_pcb2():
     pcb2 = (cq.Workplane("XY").workplane(invert=True)
             .rect(5,4).extrude(switch_pcb_thick)
-            # rotate to match watchy orientation
-            .rotate((0,0,0), (1,0,0), 180)
-            .rotate((0,0,0), (0,0,1), 90)
-    )
-    pcb2 = sw4_translate(pcb2
-        .rotate((0,0,0),(0,0,1), 90)
-        .rotate((0,0,0),(1,0,0),-90)
     )
-    show_object(pcb2, name='Switch_PCB_2')
-    # pcb3!
-    pcb3 = (cq.Workplane("XY")
+    return place(pcb2, watchy_orientation, sw4_orientation, sw4_location())
+graph.add('Switch_PCB_2', make_pcb2)
+
+# pcb3!
+def make_pcb3():
+    return (cq.Workplane("XY")
         .workplane(
             # "2" here is the thickness of the speaker (if it's on the bottom)
             offset=watchy_pcb_bottom.z + (case2_thick - case_wall_thick - 2),
@@ -731,4 +759,56 @@ if True:
         .center(pcb3_position[0], pcb3_position[1] + 1)
         .rect(22.5, 5).extrude(switch_pcb_thick)
     )
-    show_object(pcb3, name='Speaker_PCB')
+graph.add('Speaker_PCB', make_pcb3)
+
+# Everything we show, as name -> function which builds it.  The parts
+# only depend on the reference values computed above (and not on each
+# other) so they can be built in any order, or in parallel with
+# `python build.py -j 4 gotchi.py`.
+def part(name):
+    return lambda: graph[name]
+parts = {}
+parts['case2'] = part('case2')
+if True:
+    parts['lugs'] = part('lugs')
+if False:
+    parts['watchy'] = make_watchy
+if False:
+    parts['case'] = make_case1
+if True:
+    parts['top_plate'] = part('top_plate')
+elif True:
+    parts['case2_top'] = part('case2_top')
+if False:
+    parts['magnetic_latch'] = lambda: place(make_mag(), translation(mag_translate))
+if True:
+    parts['10280'] = part('10280')
+if True:
+    for i, pos in enumerate(switch_positions):
+        parts['Switch_%d' % (i+1)] = lambda pos=pos: make_switch(pos)
+    parts['Switch_PCB_1'] = part('Switch_PCB_1')
+    parts['Switch_4'] = make_sw4
+    parts['Switch_PCB_2'] = part('Switch_PCB_2')
+    parts['Speaker_PCB'] = part('Speaker_PCB')
+
+# for CQ-editor, and for 3mf assemblies (build.py --assembly)
+colors = {
+    'case2': '#303030',
+    'lugs': '#303030',
+    'top_plate': '#707070',
+    '10280': '#3060c0',
+    'Switch_1': '#202020',
+    'Switch_2': '#202020',
+    'Switch_3': '#202020',
+    'Switch_4': '#202020',
+    'Switch_PCB_1': '#1b6e2a',
+    'Switch_PCB_2': '#1b6e2a',
+    'Speaker_PCB': '#1b6e2a',
+}
+
+# show_object is only defined when run from CQ-editor (or build.py);
+# a plain `import gotchi` just defines the parts
+if 'show_object' in globals():
+    for name, make_part in parts.items():
+        show_object(make_part(), name=name,
+                    options={'color': colors.get(name, '#808080')})
@@ -0,0 +1,110 @@
+import cadquery as cq
+import hashlib
+import json
+import time
+
+from cache import (CACHE_VERSION, as_shape, cache_file, dependencies, evict,
+                   from_brep, read_entry, settings, to_brep, value_key,
+                   write_atomic)
+
+# Dependency-tracked build graph for incremental rebuilds.
+#
+# Each node is a function building one named intermediate from the
+# results of its upstream nodes.  A node's key covers its code, the
+# module-level dimensions it reads (found by looking at the code, see
+# cache.dependencies) and the keys of its upstream nodes, and its result
+# is stored as a BREP under that key.  After editing a dimension only the
+# nodes which read it, and everything downstream of them, get a new key
+# and are rebuilt; everything else is loaded from the cache.
+#
+#   graph = Graph('gotchi')
+#   graph.add('case2_body', make_case2_body, 'mag_support')
+#   case2_body = graph['case2_body']
+
+class Graph:
+    def __init__(self, name):
+        self.name = name
+        self.nodes = {} # name -> (fn, upstream node names, extra args)
+        self.values = {}
+        self.keys = {}
+        self.params = {} # name -> dimensions read by the node
+        self.log = [] # (node, 'built' or 'cached', seconds, changed params)
+
+    def add(self, name, fn, *deps, args=()):
+        self.nodes[name] = (fn, deps, tuple(args))
+        return fn
+
+    def key(self, name):
+        if name not in self.keys:
+            fn, deps, args = self.nodes[name]
+            digest, params, unkeyed = dependencies(fn)
+            params = dict(params, **{'settings.' + k: value_key(v)
+                                     for k, v in settings.items()})
+            if unkeyed:
+                # these would silently go stale; make them upstream nodes
+                raise ValueError('%s node %s reads %s, which are not nodes' % (
+                    self.name, name, ', '.join(sorted(unkeyed))))
+            h = hashlib.sha256(digest.encode())
+            for kv in sorted(params.items()):
+                h.update(('%s=%s;' % kv).encode())
+            h.update(str(value_key(args)).encode())
+            for dep in deps:
+                h.update(self.key(dep).encode())
+            h.update(b'v%d' % CACHE_VERSION)
+            self.keys[name] = h.hexdigest()
+            self.params[name] = params
+        return self.keys[name]
+
+    def _record(self, name):
+        return cache_file('graph', '%s.%s' % (self.name, name), '.json')
+
+    def changed_params(self, name):
+        # which dimensions differ from the last time this node was built
+        try:
+            with open(self._record(name)) as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            return None
+        new = self.params[name]
+        return sorted(k for k in set(old) | set(new)
+                      if old.get(k) != new.get(k))
+
+    def __getitem__(self, name):
+        if name in self.values:
+            return self.values[name]
+        fn, deps, args = self.nodes[name]
+        inputs = [self[dep] for dep in deps]
+        key = self.key(name)
+        start = time.perf_counter()
+        fname = cache_file('graph', key)
+        data = read_entry(fname)
+        if data is not None:
+            shape = from_brep(data)
+            self.log.append((name, 'cached', time.perf_counter() - start, []))
+        else:
+            shape = as_shape(fn(*(inputs + list(args))))
+            changed = self.changed_params(name)
+            write_atomic(fname, to_brep(shape))
+            write_atomic(self._record(name),
+                         json.dumps(self.params[name]).encode())
+            evict()
+            self.log.append((name, 'built', time.perf_counter() - start,
+                             changed))
+        # whether built or loaded, downstream nodes get the same bare
+        # shape, so a node never depends on tags left by an upstream node
+        self.values[name] = cq.Workplane("XY").newObject([shape])
+        return self.values[name]
+
+    def release(self):
+        # drop the intermediates kept in memory, keeping the log; nodes
+        # asked for again are read back from the cache
+        self.values.clear()
+
+    def report(self):
+        lines = []
+        for name, status, seconds, changed in self.log:
+            why = ''
+            if status == 'built' and changed:
+                why = ' (%s changed)' % ', '.join(changed)
+            lines.append('%-18s %-6s %6.2fs%s' % (name, status, seconds, why))
+        return '\n'.join(lines)
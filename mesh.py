@@ -0,0 +1,283 @@
+import argparse
+import io
+import numpy as np
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+
+import stlio
+
+# Indexed meshes.
+#
+# STL stores all three corners of every triangle, so each vertex of a
+# mesh is written out about six times.  weld() merges corners which are
+# within a tolerance of each other (by rounding them to a grid and sorting,
+# so it takes n log n time on the big Watchy meshes) into a vertex array
+# and an index array, which can then be written as OBJ, binary PLY or 3MF.
+# read() takes STL or 3MF, and volume() and area() measure what it reads.
+#
+#   python mesh.py Watchy.stl Armadillonium_Bottom.stl -f 3mf
+#
+# Only NumPy is needed here, so none of these wait for cadquery to load.
+
+WELD_TOL = 1e-4 # mm
+FORMATS = ['ply', 'obj', '3mf', 'stl']
+
+def weld(tris, tol=WELD_TOL):
+    # returns (vertices, faces); triangles which collapse when their
+    # corners are merged are dropped
+    corners = np.asarray(tris).reshape(-1, 3)
+    if tol > 0:
+        keys = np.floor(corners / tol + 0.5).astype(np.int64)
+    else:
+        keys = corners + 0.0 # exact, but with -0 == 0
+    keys = np.ascontiguousarray(keys)
+    keys = keys.view(np.dtype((np.void, keys.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True,
+                                  return_inverse=True)
+    faces = inverse.reshape(-1, 3).astype(np.int32)
+    ok = ((faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) &
+          (faces[:, 2] != faces[:, 0]))
+    return corners[first], faces[ok]
+
+def _rows(fmt, array):
+    buf = io.StringIO()
+    np.savetxt(buf, array, fmt=fmt)
+    return buf.getvalue()
+
+def write_obj(fname, vertices, faces):
+    with open(fname, 'w') as f:
+        f.write(_rows('v %.9g %.9g %.9g', vertices))
+        f.write(_rows('f %d %d %d', faces + 1))
+
+PLY_FACE = np.dtype([('n', 'u1'), ('v', '<i4', (3,))]) # packed, 13 bytes
+
+PLY_TYPES = {'u1': 'uchar', 'i4': 'int', 'f4': 'float', 'f8': 'double'}
+
+def write_ply(fname, vertices, faces, face_data=None):
+    # face_data is a record array of extra per-face properties, eg colours
+    # (fields red, green, blue) for viewers to show
+    extra = [] if face_data is None else [
+        (name, face_data.dtype[name].str.lstrip('<|'))
+        for name in face_data.dtype.names]
+    face_rows = np.zeros(len(faces), PLY_FACE.descr + [
+        (name, '<' + t) for name, t in extra])
+    face_rows['n'] = 3
+    face_rows['v'] = faces
+    for name, t in extra:
+        face_rows[name] = face_data[name]
+    with open(fname, 'wb') as f:
+        f.write(('ply\nformat binary_little_endian 1.0\n'
+                 'element vertex %d\n'
+                 'property float x\nproperty float y\nproperty float z\n'
+                 'element face %d\n'
+                 'property list uchar int vertex_indices\n'
+                 '%s'
+                 'end_header\n' % (len(vertices), len(faces), ''.join(
+                     'property %s %s\n' % (PLY_TYPES[t], name)
+                     for name, t in extra))).encode())
+        np.asarray(vertices, '<f4').tofile(f)
+        face_rows.tofile(f)
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+    '</Types>')
+RELS = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+    '</Relationships>')
+MODEL_NS = 'http://schemas.microsoft.com/3dmanufacturing/core/2015/02'
+
+def mesh_xml(vertices, faces):
+    return ''.join([
+        '<mesh><vertices>\n',
+        _rows('<vertex x="%.9g" y="%.9g" z="%.9g"/>', vertices),
+        '</vertices><triangles>\n',
+        _rows('<triangle v1="%d" v2="%d" v3="%d"/>', faces),
+        '</triangles></mesh>'])
+
+def write_3mf_model(fname, resources, build):
+    model = ''.join([
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<model unit="millimeter" xml:lang="en-US" xmlns="%s">\n' % MODEL_NS,
+        '<resources>\n', resources, '</resources>\n',
+        '<build>\n', build, '</build>\n',
+        '</model>\n'])
+    with zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml', CONTENT_TYPES)
+        z.writestr('_rels/.rels', RELS)
+        z.writestr('3D/3dmodel.model', model)
+
+def write_3mf(fname, vertices, faces):
+    write_3mf_model(
+        fname, '<object id="1" type="model">%s</object>\n'
+        % mesh_xml(vertices, faces), '<item objectid="1"/>\n')
+
+UNITS = { # 3MF model units, in mm
+    'micron': 1e-3, 'millimeter': 1.0, 'centimeter': 10.0, 'inch': 25.4,
+    'foot': 304.8, 'meter': 1000.0}
+
+def _transform(attr):
+    # 3MF "m00 m01 m02 m10 ... m32" as a 4x4 matrix, for row vectors
+    m = np.identity(4)
+    if attr:
+        m[:, :3] = np.array(attr.split(), np.float64).reshape(4, 3)
+    return m
+
+def read_3mf(fname, items=False):
+    # triangles of every item a 3MF file builds, placed by the transforms
+    # of the items and of the components they're made of, as (n, 3, 3);
+    # or with items, a list of those for each item
+    ns = {'m': MODEL_NS}
+    with zipfile.ZipFile(fname) as z:
+        rels = ET.fromstring(z.read('_rels/.rels'))
+        path = next((r.get('Target') for r in rels
+                     if r.get('Type', '').endswith('/3dmodel')),
+                    '/3D/3dmodel.model')
+        root = ET.fromstring(z.read(path.lstrip('/')))
+    scale = UNITS[root.get('unit', 'millimeter')]
+    objects = {o.get('id'): o
+               for o in root.iterfind('m:resources/m:object', ns)}
+
+    def place(id, m):
+        obj = objects[id]
+        tris = []
+        for mesh in obj.iterfind('m:mesh', ns):
+            vertices = np.array([
+                [float(v.get(a)) for a in 'xyz']
+                for v in mesh.iterfind('m:vertices/m:vertex', ns)])
+            faces = np.array([
+                [int(t.get(a)) for a in ('v1', 'v2', 'v3')]
+                for t in mesh.iterfind('m:triangles/m:triangle', ns)],
+                np.int64).reshape(-1, 3)
+            if len(faces):
+                tris.append((vertices @ m[:3, :3] + m[3, :3])[faces])
+        for c in obj.iterfind('m:components/m:component', ns):
+            tris += place(c.get('objectid'),
+                          _transform(c.get('transform')) @ m)
+        return tris
+
+    built = []
+    for item in root.iterfind('m:build/m:item', ns):
+        tris = place(item.get('objectid'), _transform(item.get('transform')))
+        built.append(np.concatenate(tris) * scale if tris
+                     else np.zeros((0, 3, 3)))
+    if items:
+        return built
+    if not built:
+        return np.zeros((0, 3, 3))
+    return np.concatenate(built)
+
+def read(fname):
+    # triangles of an STL or 3MF file, as (n, 3, 3)
+    ext = os.path.splitext(fname)[1].lower()
+    if ext == '.3mf':
+        return read_3mf(fname)
+    if ext == '.stl':
+        return stlio.read(fname)['vertices']
+    raise ValueError('only STL and 3MF meshes can be read')
+
+def read_objects(fname):
+    # read() split into the separate objects of a 3MF file, which an
+    # STL file has only one of
+    if os.path.splitext(fname)[1].lower() == '.3mf':
+        return read_3mf(fname, items=True)
+    return [read(fname)]
+
+def area(tris):
+    t = np.asarray(tris, np.float64)
+    return np.linalg.norm(np.cross(t[:, 1] - t[:, 0], t[:, 2] - t[:, 0]),
+                          axis=1).sum() / 2
+
+def volume(tris):
+    # enclosed by a closed, outward facing mesh: the sum of the tetrahedra
+    # each triangle makes with the origin
+    t = np.asarray(tris, np.float64)
+    return np.einsum('ij,ij->', t[:, 0], np.cross(t[:, 1], t[:, 2])) / 6
+
+def open_edges(faces):
+    # edges not shared by exactly two triangles; the volume of a mesh
+    # with any is only approximate
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]],
+                                    faces[:, [2, 0]]]), axis=1)
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+    return np.count_nonzero(counts != 2)
+
+def write(fname, vertices, faces):
+    ext = os.path.splitext(fname)[1].lower()
+    if ext == '.obj':
+        write_obj(fname, vertices, faces)
+    elif ext == '.ply':
+        write_ply(fname, vertices, faces)
+    elif ext == '.3mf':
+        write_3mf(fname, vertices, faces)
+    elif ext == '.stl':
+        stlio.write(fname, vertices, faces)
+    else:
+        raise ValueError('unknown mesh format: %s' % fname)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Weld the vertices of STL (or 3MF) meshes, and write '
+        'them as indexed meshes.')
+    parser.add_argument('meshes', nargs='+', metavar='mesh.stl')
+    parser.add_argument('-f', '--format', default='ply', choices=FORMATS,
+                        help='output format (default: ply)')
+    parser.add_argument('-o', '--outdir', default='build/mesh',
+                        help='where to write them (default: build/mesh)')
+    parser.add_argument('--tol', type=float, default=WELD_TOL,
+                        help='merge vertices closer than about this many mm '
+                        '(default: %g; 0 only merges identical ones)'
+                        % WELD_TOL)
+    args = parser.parse_args(argv)
+    os.makedirs(args.outdir, exist_ok=True)
+    for fname in args.meshes:
+        start = time.perf_counter()
+        try:
+            tris = read(fname)
+        except ValueError as e:
+            parser.error('%s: %s' % (fname, e))
+        vertices, faces = weld(tris, args.tol)
+        weld_time = time.perf_counter() - start
+        out = os.path.join(args.outdir, '%s.%s' % (
+            os.path.splitext(os.path.basename(fname))[0], args.format))
+        write(out, vertices, faces)
+        size, new_size = os.path.getsize(fname), os.path.getsize(out)
+        print('%-42s %7d -> %6d vertices %7d triangles (%d dropped)  '
+              '%8d -> %8d bytes (%.1fx)  %.2fs weld  %.2fs total' % (
+              fname, 3 * len(tris), len(vertices), len(faces),
+              len(tris) - len(faces), size, new_size, size / new_size,
+              weld_time, time.perf_counter() - start))
+
+def info_main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Print the size, area and volume of STL and 3MF meshes.')
+    parser.add_argument('meshes', nargs='+', metavar='mesh.stl|mesh.3mf')
+    args = parser.parse_args(argv)
+    for fname in args.meshes:
+        start = time.perf_counter()
+        try:
+            objects = read_objects(fname)
+        except ValueError as e:
+            parser.error('%s: %s' % (fname, e))
+        tris = np.concatenate(objects) if objects else np.zeros((0, 3, 3))
+        # welded one object at a time, so parts which touch in an
+        # assembly don't count as each other's open edges
+        gaps = sum(open_edges(weld(t)[1]) for t in objects)
+        size = tris.max(axis=(0, 1)) - tris.min(axis=(0, 1)) \
+            if len(tris) else np.zeros(3)
+        print('%-42s %7d triangles  %s mm  %10.2f mm^2 %10.2f mm^3%s  '
+              '%.2fs' % (
+              fname, len(tris), ' x '.join('%.2f' % x for x in size),
+              area(tris), volume(tris),
+              ' (%d open edges)' % gaps if gaps else '',
+              time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
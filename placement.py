@@ -0,0 +1,65 @@
+import cadquery as cq
+from math import radians
+from OCP.gp import gp_Ax1, gp_Trsf
+from OCP.TopLoc import TopLoc_Location
+
+from cache import as_shape
+
+# Placing parts by location.
+#
+# Workplane.rotate() and .translate() copy every face of a solid to its
+# new position.  A cq.Location instead only records where the same shape
+# goes: placing a part costs nothing however big it is, and copies of a
+# part placed in several spots (the switches in gotchi.py) still share
+# one shape.  assembly() collects the parts of a script into a
+# cq.Assembly, in which each shared shape is one STEP product referenced
+# from every place it's used; export3mf.py likewise tessellates and
+# stores it once.
+#
+#   sw = place(make_sw(), sw_orientation, translation(pos))
+
+def rotation(axis, angle, center=(0, 0, 0)):
+    # same as .rotate(center, center + axis, angle)
+    t = gp_Trsf()
+    t.SetRotation(gp_Ax1(cq.Vector(center).toPnt(), cq.Vector(axis).toDir()),
+                  radians(angle))
+    return cq.Location(t)
+
+def translation(v):
+    return cq.Location(cq.Vector(v))
+
+def chain(*locs):
+    # one location doing each of locs in turn, like a chain of
+    # .rotate() and .translate() calls
+    loc = cq.Location()
+    for l in locs:
+        loc = l * loc
+    return loc
+
+def unlocated(shape):
+    # shape back at its own origin; copies placed by location give the
+    # same (shared) shape
+    return cq.Shape.cast(shape.wrapped.Located(TopLoc_Location()))
+
+def place(wp, *locs):
+    # a Workplane of wp's shapes moved by each of locs in turn, sharing
+    # their geometry with the originals
+    loc = chain(*locs)
+    return wp.newObject([o.moved(loc) if isinstance(o, cq.Shape) else o
+                         for o in wp.objects])
+
+def assembly(name, parts, colors=None):
+    # cq.Assembly of parts, as [(name, object)]; each node holds its shape
+    # at its origin, and the location which puts it in place
+    assy = cq.Assembly(name=name)
+    for part, obj in parts:
+        shape = as_shape(obj)
+        color = (colors or {}).get(part)
+        assy.add(unlocated(shape), name=part, loc=shape.location(),
+                 color=None if color is None else cq.Color(color))
+    return assy
+
+def leaves(assy):
+    # (name, placed shape, colour) of every shape in an assembly
+    return [(name.rsplit('/', 1)[-1], shape.moved(loc), color)
+            for shape, name, loc, color in assy]
@@ -0,0 +1,47 @@
+import cadquery as cq
+import os
+
+import cache
+from cache import LazyModel, lazy_import_step, step_bounds
+
+# Preview mode, for fast interactive refreshes.
+#
+# With WATCHY_PREVIEW=1 in the environment (or `build.py --preview`) the
+# heavy reference models are replaced by their bounding boxes, and the
+# purely cosmetic details (fillets, end cap decoration, the clearance
+# shell around the magnetic connector) are skipped.  Leave it unset for
+# full fidelity, which is what should be exported.
+
+PREVIEW = os.environ.get('WATCHY_PREVIEW', '') not in ('', '0')
+
+# preview geometry must never be mistaken for the real thing
+cache.settings['preview'] = PREVIEW
+
+def _model_box(fileName):
+    bb = step_bounds(fileName)
+    return (cq.Workplane("XY")
+        .box(bb.xlen, bb.ylen, bb.zlen)
+        .translate(bb.center)
+    )
+
+def import_model(fileName):
+    # a reference model which is only displayed, never measured; either
+    # way nothing is loaded until it's used (see cache.LazyModel)
+    if not PREVIEW:
+        return lazy_import_step(fileName)
+    return LazyModel(lambda: _model_box(fileName))
+
+# Cosmetic details, which preview mode leaves out.  Each takes the
+# Workplane a chain has got to and returns one, so the chain can carry on:
+#
+#   body = detail_fillet(body.faces(">Z").edges(), 0.35).faces("<Z")...
+
+def detail_fillet(wp, radius):
+    if PREVIEW:
+        return wp.newObject([wp.findSolid()])
+    return wp.fillet(radius)
+
+def detail_cut(wp, tool):
+    if PREVIEW:
+        return wp.newObject([wp.findSolid()])
+    return wp.cut(tool)
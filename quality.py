@@ -0,0 +1,14 @@
+# Mesh quality presets, for tessellate.py and the --quality options of
+# the command line tools.  Kept on their own so that listing the names
+# doesn't import the CAD kernel.
+#
+#   python build.py -f stl,3mf --quality draft gotchi.py
+
+# name -> (deflection as a fraction of the feature size, smallest and
+# largest deflection in mm, angular deflection in degrees)
+QUALITY = {
+    'draft': (0.1, 0.05, 0.5, 30), # quick previews
+    'print': (0.02, 0.01, 0.05, 10), # SLS/FDM, which resolve ~0.1 mm
+    'machining': (0.005, 0.002, 0.01, 3), # CNC
+}
+DEFAULT_QUALITY = 'print'
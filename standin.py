@@ -0,0 +1,59 @@
+import argparse
+import os
+import time
+
+import cadquery as cq
+from OCP.BRepBuilderAPI import BRepBuilderAPI_Sewing
+from OCP.ShapeUpgrade import ShapeUpgrade_UnifySameDomain
+from OCP.StlAPI import StlAPI_Reader
+from OCP.TopoDS import TopoDS_Shape
+
+# Stand-in STEP models made from the shipped meshes.
+#
+# casemod.py and gotchi.py load Watchy_Battery.step and Watchy.step, which
+# aren't in the repo; only their meshes (Watchy_Battery.stl, Watchy.stl)
+# are.  This sews a mesh into solids, merging coplanar facets, and writes
+# them as STEP next to it, so the scripts and the build machinery can be
+# run and timed without the real models.
+#
+#   python standin.py Watchy.stl Watchy_Battery.stl
+#
+# The solids are faceted, so they're far slower to cut and select from
+# than the real models, and selectors written against the real ones may
+# find other edges (gotchi.py's pcb chamfer fails on the stand-in Watchy).
+# Use them to time and check the machinery, not to make parts.
+
+SEW_TOL = 1e-3 # mm
+
+def standin(fname):
+    # the solids of an STL mesh, as one compound
+    shape = TopoDS_Shape()
+    StlAPI_Reader().Read(shape, fname)
+    unify = ShapeUpgrade_UnifySameDomain(shape, True, True, True)
+    unify.Build()
+    sewing = BRepBuilderAPI_Sewing(SEW_TOL)
+    sewing.Add(unify.Shape())
+    sewing.Perform()
+    shells = cq.Shape.cast(sewing.SewedShape()).Shells()
+    return cq.Compound.makeCompound([cq.Solid.makeSolid(s) for s in shells])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write stand-in STEP models for the Watchy meshes.')
+    parser.add_argument('meshes', nargs='+', metavar='mesh.stl')
+    parser.add_argument('--force', action='store_true',
+                        help='replace STEP files which are already there')
+    args = parser.parse_args(argv)
+    for fname in args.meshes:
+        out = os.path.splitext(fname)[0] + '.step'
+        if os.path.exists(out) and not args.force:
+            print('%s is already there; --force to replace it' % out)
+            continue
+        start = time.perf_counter()
+        compound = standin(fname)
+        cq.exporters.export(cq.Workplane().add(compound), out)
+        print('%-24s %3d solids %6.1fs' % (
+            out, len(compound.Solids()), time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import numpy as np
+import os
+import re
+import time
+
+# STL reading and writing straight to and from NumPy arrays.
+#
+# Binary STL is memory-mapped as an array of records, so reading even the
+# big Watchy meshes costs nothing until the triangles are actually used,
+# and no Python object is ever made per triangle.  ASCII STL is parsed a
+# chunk of facets at a time.  Either way a mesh is a record array with
+# DTYPE, and mesh['vertices'] is an (n, 3, 3) view of its corners.
+#
+#   tris = read('Watchy.stl')['vertices']
+#   write('out.stl', vertices, faces)
+#
+# (This isn't called stl.py so it doesn't shadow numpy-stl.)
+
+DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attr', '<u2'),
+])
+HEADER_SIZE = 84 # 80 byte header, then the triangle count
+
+ASCII_CHUNK = 1 << 22 # bytes of ASCII STL parsed at a time
+
+def is_binary(fname):
+    # an ASCII file starts with "solid", but so do some binary ones; the
+    # size of a binary file is fixed by the count in its header
+    size = os.path.getsize(fname)
+    if size < HEADER_SIZE:
+        return False
+    with open(fname, 'rb') as f:
+        f.seek(80)
+        count = int(np.frombuffer(f.read(4), '<u4')[0])
+    return size == HEADER_SIZE + count * DTYPE.itemsize
+
+def read_binary(fname):
+    count = (os.path.getsize(fname) - HEADER_SIZE) // DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, DTYPE)
+    return np.memmap(fname, DTYPE, mode='r', offset=HEADER_SIZE,
+                     shape=(count,))
+
+_SOLID = re.compile(rb'^\s*(end)?solid[^\n]*', re.M)
+_KEYWORDS = [b'endfacet', b'facet', b'normal', b'endloop', b'outer', b'loop',
+             b'vertex']
+
+def _parse_facets(data):
+    # the numbers in some whole facets, 3 for the normal and 9 for the
+    # corners of each; the solid names are the only other text
+    data = _SOLID.sub(b' ', data)
+    for word in _KEYWORDS:
+        data = data.replace(word, b' ')
+    if not data.strip():
+        return np.zeros(0, DTYPE) # fromstring would give [-1]
+    try:
+        text = data.decode('ascii')
+    except UnicodeDecodeError:
+        raise ValueError('not an STL file (neither binary nor ASCII STL)')
+    numbers = np.fromstring(text, np.float32, sep=' ')
+    if len(numbers) % 12:
+        raise ValueError('malformed ASCII STL')
+    facets = np.zeros(len(numbers) // 12, DTYPE)
+    numbers = numbers.reshape(-1, 12)
+    facets['normal'] = numbers[:, :3]
+    facets['vertices'] = numbers[:, 3:].reshape(-1, 3, 3)
+    return facets
+
+def read_ascii(fname, chunk_size=ASCII_CHUNK):
+    chunks = []
+    rest = b''
+    with open(fname, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            data = rest + data
+            # only parse up to the end of the last complete facet
+            end = data.rfind(b'endfacet')
+            if end < 0:
+                rest = data
+                continue
+            end += len(b'endfacet')
+            chunks.append(_parse_facets(data[:end]))
+            rest = data[end:]
+    if rest.strip():
+        chunks.append(_parse_facets(rest))
+    return np.concatenate(chunks) if chunks else np.zeros(0, DTYPE)
+
+def read(fname):
+    if is_binary(fname):
+        return read_binary(fname)
+    return read_ascii(fname)
+
+def triangles(vertices, faces=None):
+    # (n, 3, 3) corners, from either a vertex and an index array or
+    # corners already
+    vertices = np.asarray(vertices)
+    if faces is None:
+        return vertices.reshape(-1, 3, 3)
+    return vertices[np.asarray(faces)]
+
+def normals(tris):
+    n = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    length = np.linalg.norm(n, axis=1, keepdims=True)
+    return np.divide(n, length, out=np.zeros_like(n), where=length > 0)
+
+def write(fname, vertices, faces=None, header=b''):
+    # binary STL, from vertex and index arrays (or just corners)
+    tris = triangles(vertices, faces)
+    mesh = np.zeros(len(tris), DTYPE)
+    mesh['vertices'] = tris
+    mesh['normal'] = normals(tris.astype(np.float64))
+    with open(fname, 'wb') as f:
+        f.write(header[:80].ljust(80, b' '))
+        f.write(np.array([len(mesh)], '<u4').tobytes())
+        mesh.tofile(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Print the size and extent of STL files, and how long '
+        'reading them takes.')
+    parser.add_argument('meshes', nargs='+', metavar='mesh.stl')
+    args = parser.parse_args(argv)
+    for fname in args.meshes:
+        start = time.perf_counter()
+        try:
+            tris = read(fname)['vertices']
+        except ValueError as e:
+            parser.error('%s: %s' % (fname, e))
+        lo = tris.min(axis=(0, 1))
+        hi = tris.max(axis=(0, 1))
+        print('%-45s %8d triangles %s  %.3fs  (%s to %s)' % (
+            fname, len(tris), 'binary' if is_binary(fname) else 'ascii ',
+            time.perf_counter() - start,
+            ' '.join('%.2f' % x for x in lo), ' '.join('%.2f' % x for x in hi)))
+
+if __name__ == '__main__':
+    main()
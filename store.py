@@ -0,0 +1,75 @@
+import hashlib
+import os
+
+# The files behind cache.py.
+#
+# Where cache entries live, how they're keyed by file contents, written
+# and evicted.  None of this needs cadquery, so the mesh tools (bvh.py's
+# index of an STL) keep their entries here too without waiting seconds
+# for OCCT to load; cache.py adds the B-rep side on top.
+#
+#   entry = cache_file('bvh', file_hash('Watchy.stl'), '.npz')
+
+CACHE_DIR = os.environ.get(
+    'WATCHY_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+CACHE_SIZE = int(os.environ.get('WATCHY_CACHE_MB', 512)) * 1024 * 1024
+
+_hashes = {} # abspath -> (mtime, size, digest)
+
+def file_hash(path):
+    # hashing a few MB is cheap, but don't do it more than once per process
+    # unless the file actually changed underneath us
+    st = os.stat(path)
+    path = os.path.abspath(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    if path in _hashes and _hashes[path][0] == stamp:
+        return _hashes[path][1]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    _hashes[path] = (stamp, h.hexdigest())
+    return _hashes[path][1]
+
+def cache_file(kind, key, ext='.bin'):
+    d = os.path.join(CACHE_DIR, kind)
+    os.makedirs(d, exist_ok=True)
+    return os.path.join(d, key + ext)
+
+def write_atomic(fname, data):
+    # several build processes may race to fill the same entry
+    tmp = '%s.%d.tmp' % (fname, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, fname)
+
+def read_entry(fname):
+    try:
+        with open(fname, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    os.utime(fname) # mark as recently used
+    return data
+
+def evict(limit=None):
+    limit = CACHE_SIZE if limit is None else limit
+    entries = []
+    for root, dirs, files in os.walk(CACHE_DIR):
+        for name in files:
+            fname = os.path.join(root, name)
+            try:
+                st = os.stat(fname)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fname))
+    total = sum(e[1] for e in entries)
+    for mtime, size, fname in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,186 @@
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+import types
+
+import build
+
+# Parameter sweeps over the dimensions at the top of a script.
+#
+# The script is run once as a plain module, which imports the STEP models
+# and measures the reference values every variant shares.  Each variant
+# is then built in a forked worker which inherits all of that, sets the
+# swept dimensions, and calls the part functions from the script's parts
+# table.  Results go in a CSV table, one row per variant.
+#
+# Every variant gets a worker of its own, even with -j 1, so nothing one
+# variant leaves behind (globals its part functions set, memo tables)
+# can affect the next.
+#
+#   python sweep.py casemod.py grill_style=1,2,3 \
+#       grill_strut_width=1:2:0.25 air_space=0.5,0.75 -j 4
+#
+# A parameter is either a comma separated list of values, or an
+# inclusive range start:stop:step.
+
+# script -> parts to build for each variant, the ones whose thinnest wall
+# is measured (with thickness.py, on the part's mesh), the one with the
+# grill (whose open area and thinnest wall are measured), and the dimensions
+# which can be swept; only the ones read by the part functions (rather
+# than at the top level of the script) can be changed after the script
+# has run
+SWEEPS = {
+    'casemod.py': {
+        'parts': ['top', 'bottom'],
+        'walls': ['top'],
+        'grill': 'top', # the part the grill is cut into
+        'params': ['grill_style', 'grill_strut_width', 'grill_space_width',
+                   'grill_thick', 'air_space', 'bump_xsize', 'bump_ysize'],
+    },
+}
+
+def parse_values(spec):
+    if ':' in spec:
+        start, stop, step = (float(x) for x in spec.split(':'))
+        n = int(round((stop - start) / step))
+        return [round(start + i * step, 6) for i in range(n + 1)]
+    values = []
+    for v in spec.split(','):
+        try:
+            values.append(int(v))
+        except ValueError:
+            values.append(float(v))
+    return values
+
+def script_globals(script, path):
+    # run_path hands back a copy of the script's globals; the functions
+    # it defined still see the real ones
+    for v in script.values():
+        if isinstance(v, types.FunctionType) and \
+           v.__code__.co_filename == path:
+            return v.__globals__
+    raise ValueError('%s defines no functions' % path)
+
+def grill_area(env):
+    # open area of the grill
+    grill = env['make_grill']()
+    height = env['air_space'] + env['grill_thick'] + 1
+    return sum(s.Volume() for s in grill.solids().vals()) / height
+
+def walls(shape):
+    # thickness.py's rays over the mesh of a built part: the centre and
+    # thickness of each triangle which is part of a wall
+    import tessellate
+    import thickness
+    vertices, faces = tessellate.tessellate(shape, WALL_QUALITY)
+    minimum = thickness.MATERIALS[thickness.DEFAULT_MATERIAL][0]
+    vertices, faces, t, wall, _ = thickness.analyze(vertices[faces], minimum)
+    return vertices[faces[wall]].mean(axis=1), t[wall]
+
+def min_wall(centers, t, box=None):
+    # thinnest of them, or of those inside box
+    if box is not None:
+        inside = ((centers >= (box.xmin, box.ymin, box.zmin)) &
+                  (centers <= (box.xmax, box.ymax, box.zmax))).all(axis=1)
+        t = t[inside]
+    return t.min() if len(t) else float('nan')
+
+def grill_box(env):
+    # where the grill is: the shell around the SCD40 pocket it's cut into
+    return env['simple_scd40'].val().BoundingBox().enlarge(
+        env['air_space'] + env['grill_thick'])
+
+WALL_QUALITY = 'print' # mesh the walls are measured on
+
+_script = None # (globals, config) of the script being swept
+
+def _build_variant(variant):
+    from cache import as_shape
+    env, config = _script
+    env.update(variant)
+    row = dict(variant)
+    start = time.perf_counter()
+    try:
+        shapes = {}
+        for name in config['parts']:
+            shapes[name] = as_shape(env['parts'][name]())
+            row['%s_volume' % name] = shapes[name].Volume()
+        row['seconds'] = time.perf_counter() - start
+        for name in config['walls']:
+            centers, t = walls(shapes[name])
+            row['%s_min_wall' % name] = min_wall(centers, t)
+            if name == config.get('grill') and 'make_grill' in env:
+                row['grill_area'] = grill_area(env)
+                row['grill_min_wall'] = min_wall(centers, t, grill_box(env))
+        row['error'] = ''
+    except Exception as e:
+        row['seconds'] = time.perf_counter() - start
+        row['error'] = '%s: %s' % (type(e).__name__, e)
+    return row
+
+def sweep(path, grid, jobs):
+    global _script
+    config = SWEEPS[os.path.basename(path)]
+    path = os.path.abspath(path)
+    script = build.load_script(path)
+    _script = (script_globals(script, path), config)
+    names = list(grid)
+    variants = [dict(zip(names, values))
+                for values in itertools.product(*grid.values())]
+    with build.script_dir(path):
+        # forked, so the workers share the imported models
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(min(jobs, len(variants)), maxtasksperchild=1) as pool:
+            rows = pool.map(_build_variant, variants, chunksize=1)
+    _script = None
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build every combination of some dimensions of a script.')
+    parser.add_argument('script', metavar='script.py')
+    parser.add_argument('params', nargs='+', metavar='name=values',
+                        help='a,b,c or start:stop:step')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='build variants in this many worker processes')
+    parser.add_argument('-o', '--output', default='build/sweep.csv',
+                        help='where to write results (default: build/sweep.csv)')
+    args = parser.parse_args(argv)
+    config = SWEEPS.get(os.path.basename(args.script))
+    if config is None:
+        parser.error("don't know what to sweep in %s" % args.script)
+    allowed = config['params']
+    grid = {}
+    for p in args.params:
+        name, sep, spec = p.partition('=')
+        if not sep:
+            parser.error('expected name=values: %s' % p)
+        if name not in allowed:
+            parser.error('%s can not be swept in %s (try one of %s)' % (
+                name, args.script, ', '.join(allowed)))
+        grid[name] = parse_values(spec)
+
+    start = time.perf_counter()
+    rows = sweep(args.script, grid, args.jobs)
+    columns = list(grid) + ['%s_volume' % p for p in config['parts']] + [
+        'grill_area', 'grill_min_wall'] + [
+        '%s_min_wall' % p for p in config['walls']] + ['seconds', 'error']
+    print(' '.join('%12s' % c[:12] for c in columns[:-1]))
+    for row in rows:
+        print(' '.join('%12s' % ('%.3f' % v if isinstance(v, float) else v)
+                       for v in (row.get(c, '') for c in columns[:-1])),
+              row['error'])
+    print('%d variants in %.2fs' % (len(rows), time.perf_counter() - start))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return 1 if any(row['error'] for row in rows) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
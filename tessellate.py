@@ -0,0 +1,130 @@
+import multiprocessing
+import numpy as np
+
+from OCP.BRep import BRep_Tool
+from OCP.BRepMesh import BRepMesh_IncrementalMesh
+from OCP.TopAbs import TopAbs_REVERSED
+from OCP.TopLoc import TopLoc_Location
+
+import mesh
+import stlio
+from cache import as_shape, copy_shape
+from quality import DEFAULT_QUALITY, QUALITY
+
+# Mesh export with named quality presets.
+#
+# Rather than one fixed tolerance for everything, the linear deflection
+# of each part is a fraction of its feature size (the length of its
+# shorter edges), clamped to a range that makes sense for the process:
+# a small switch gets a finer mesh than the case around it, and neither
+# gets a mesh finer than the printer or the mill can reproduce.
+#
+#   python build.py -f stl,3mf --quality draft gotchi.py
+#
+# With -j, the solids of all the parts are meshed in forked worker
+# processes (and BRepMesh meshes the faces of each solid in threads),
+# and the buffers are merged back into one mesh per part.  The presets
+# are in quality.py.
+
+FEATURE_PERCENTILE = 10 # of edge lengths
+
+def feature_size(shape):
+    lengths = [e.Length() for e in shape.Edges()]
+    if not lengths:
+        return shape.BoundingBox().DiagonalLength
+    return float(np.percentile(lengths, FEATURE_PERCENTILE))
+
+def deflection(shape, quality=DEFAULT_QUALITY):
+    # (linear, angular in radians) to mesh shape with
+    fraction, lo, hi, angle = QUALITY[quality]
+    return (min(max(fraction * feature_size(shape), lo), hi),
+            np.radians(angle))
+
+def face_arrays(face):
+    # vertices and triangles of an already meshed face, in place and
+    # wound to face outwards
+    loc = TopLoc_Location()
+    tri = BRep_Tool.Triangulation_s(face.wrapped, loc)
+    if tri is None:
+        return np.zeros((0, 3)), np.zeros((0, 3), np.int32)
+    nodes = tri.Node
+    vertices = np.array([(p.X(), p.Y(), p.Z()) for p in
+                         (nodes(i) for i in range(1, tri.NbNodes() + 1))])
+    if not loc.IsIdentity():
+        t = loc.Transformation()
+        m = np.array([[t.Value(r, c) for c in range(1, 5)]
+                      for r in range(1, 4)])
+        vertices = vertices @ m[:, :3].T + m[:, 3]
+    triangles = np.array([tri.Triangle(i).Get() for i in
+                          range(1, tri.NbTriangles() + 1)], np.int32) - 1
+    if face.wrapped.Orientation() == TopAbs_REVERSED:
+        triangles = triangles[:, ::-1]
+    return vertices, triangles.reshape(-1, 3)
+
+def merge(arrays):
+    # one vertex and triangle array from several, offsetting the indices
+    vertices, faces, offset = [], [], 0
+    for v, f in arrays:
+        vertices.append(v)
+        faces.append(f + offset)
+        offset += len(v)
+    if not vertices:
+        return np.zeros((0, 3)), np.zeros((0, 3), np.int32)
+    return np.concatenate(vertices), np.concatenate(faces)
+
+def mesh_shape(shape, linear, angular):
+    # the mesh is kept on the faces it's made for, so mesh a copy of the
+    # topology: the shape itself may be shared by other parts (placed
+    # copies, cached and memoized shapes), which exporting this one
+    # mustn't change.  The copy also starts without any mesh from before,
+    # which may be finer than asked for.
+    shape = copy_shape(shape)
+    BRepMesh_IncrementalMesh(shape.wrapped, linear, False, angular, True)
+    return merge(face_arrays(f) for f in shape.Faces())
+
+def tessellate(obj, quality=DEFAULT_QUALITY):
+    shape = as_shape(obj)
+    return mesh_shape(shape, *deflection(shape, quality))
+
+_tasks = None # (solid, linear, angular) to mesh, inherited by workers
+
+def _mesh_task(i):
+    return i, mesh_shape(*_tasks[i])
+
+def tessellate_many(objs, quality=DEFAULT_QUALITY, jobs=None):
+    # tessellate() for each of objs, a solid per task; solids of the same
+    # part share the deflection worked out for the whole part.  Meshing
+    # faces of one solid separately would give cracks along their edges.
+    global _tasks
+    tasks, owners = [], []
+    for n, obj in enumerate(objs):
+        shape = as_shape(obj)
+        linear, angular = deflection(shape, quality)
+        for solid in shape.Solids() or [shape]:
+            tasks.append((solid, linear, angular))
+            owners.append(n)
+    # biggest first, so one big solid doesn't hold everything up at the end
+    order = sorted(range(len(tasks)), key=lambda i: -len(tasks[i][0].Faces()))
+    results = {}
+    _tasks = tasks
+    try:
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(min(jobs or ctx.cpu_count(), len(tasks) or 1)) as pool:
+            for i, arrays in pool.imap_unordered(_mesh_task, order):
+                results[i] = arrays
+    finally:
+        _tasks = None
+    return [merge(results[i] for i in range(len(tasks)) if owners[i] == n)
+            for n in range(len(objs))]
+
+def export(obj, fname, quality=DEFAULT_QUALITY, arrays=None):
+    # STL or 3MF, from arrays if it's already been tessellated; returns the
+    # number of triangles written
+    vertices, faces = arrays or tessellate(obj, quality)
+    if fname.lower().endswith('.stl'):
+        stlio.write(fname, vertices.astype(np.float32), faces)
+    else:
+        # the faces are meshed separately, so weld their shared edges
+        vertices, faces = mesh.weld(vertices[faces])
+        mesh.write(fname, vertices, faces)
+    return len(faces)
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# the tests' cache entries go somewhere of their own, not in .cache
+os.environ.setdefault('WATCHY_CACHE_DIR',
+                      tempfile.mkdtemp(prefix='watchy-tests-'))
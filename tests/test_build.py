@@ -0,0 +1,52 @@
+import pytest
+
+cq = pytest.importorskip('cadquery')
+
+import build
+import mesh
+
+BOX = '''import cadquery as cq
+show_object(cq.Workplane().box(%g, %g, %g), name='cube')
+'''
+
+def run(tmp_path, size, *options):
+    script = tmp_path / 'box.py'
+    script.write_text(BOX % (size, size, size))
+    assert build.main([str(script), '-o', str(tmp_path / 'out')] +
+                      list(options)) == 0
+
+def test_skips_unchanged_exports(tmp_path):
+    run(tmp_path, 1, '-f', 'stl')
+    stl = tmp_path / 'out' / 'box' / 'cube.stl'
+    mtime = stl.stat().st_mtime_ns
+    run(tmp_path, 1, '-f', 'stl')
+    assert stl.stat().st_mtime_ns == mtime
+
+def test_rewrites_formats_left_out_when_a_part_changed(tmp_path):
+    # the stl isn't written while the box changes, but it's still stale
+    run(tmp_path, 1, '-f', 'stl')
+    run(tmp_path, 2, '-f', 'step')
+    run(tmp_path, 2, '-f', 'stl')
+    tris = mesh.read(str(tmp_path / 'out' / 'box' / 'cube.stl'))
+    assert mesh.volume(tris) == pytest.approx(8)
+
+def test_check_fails_on_a_change(tmp_path):
+    run(tmp_path, 1, '-f', 'stl')
+    run(tmp_path, 1, '-f', 'stl', '--check')
+    script = tmp_path / 'box.py'
+    script.write_text(BOX % (1, 1, 2))
+    assert build.main([str(script), '-o', str(tmp_path / 'out'),
+                       '-f', 'stl', '--check']) == 1
+
+def test_rewrites_assembly_when_a_part_changed_without_it(tmp_path):
+    run(tmp_path, 1, '-f', 'stl', '--assembly')
+    run(tmp_path, 2, '-f', 'stl')
+    run(tmp_path, 2, '-f', 'stl', '--assembly')
+    tris = mesh.read(str(tmp_path / 'out' / 'box' / 'box.3mf'))
+    assert mesh.volume(tris) == pytest.approx(8)
+
+def test_parallel_build_of_a_script_without_parts(tmp_path):
+    # falls back to running the script once, with its show_object()
+    run(tmp_path, 1, '-f', 'stl', '-j', '2')
+    tris = mesh.read(str(tmp_path / 'out' / 'box' / 'cube.stl'))
+    assert mesh.volume(tris) == pytest.approx(1)
@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ROOT
+import bvh
+import stlio
+
+BUTTON = os.path.join(ROOT, 'Armadillonium_Button.stl')
+
+@pytest.fixture(scope='module')
+def tris():
+    return stlio.read(BUTTON)['vertices'].astype(np.float64)
+
+@pytest.fixture(scope='module')
+def tree(tris):
+    return bvh.BVH(tris)
+
+@pytest.fixture(scope='module')
+def points(tris):
+    # around and inside the mesh, and some right on it
+    rng = np.random.default_rng(1)
+    lo, hi = tris.min(axis=(0, 1)), tris.max(axis=(0, 1))
+    pad = (hi - lo) / 4
+    return np.concatenate([rng.uniform(lo - pad, hi + pad, (300, 3)),
+                           tris[rng.integers(len(tris), size=20)].mean(1)])
+
+def pairs(points, tris):
+    # every (point, triangle) pair
+    return (np.repeat(points, len(tris), axis=0),
+            np.tile(tris, (len(points), 1, 1)))
+
+def winding_number(points, tris):
+    # sum of the solid angles of the triangles seen from each point, over
+    # 4 pi (Van Oosterom and Strackee): 1 inside a closed mesh, 0 outside
+    p, t = pairs(points, tris)
+    a, b, c = (t[:, i] - p for i in range(3))
+    la, lb, lc = (np.linalg.norm(v, axis=1) for v in (a, b, c))
+    det = np.einsum('ij,ij->i', a, np.cross(b, c))
+    div = (la * lb * lc + np.einsum('ij,ij->i', a, b) * lc +
+           np.einsum('ij,ij->i', b, c) * la + np.einsum('ij,ij->i', c, a) * lb)
+    angles = 2 * np.arctan2(det, div).reshape(len(points), -1)
+    return angles.sum(axis=1) / (4 * np.pi)
+
+def test_closest_on_triangles_beats_sampling(tris):
+    # no point of the triangle, sampled finely, is nearer than the answer
+    rng = np.random.default_rng(2)
+    t = tris[rng.integers(len(tris), size=50)]
+    p = t.mean(axis=1) + rng.normal(scale=2, size=(50, 3))
+    on = bvh.closest_on_triangles(p, t)
+    d = np.linalg.norm(p - on, axis=1)
+    u, v = np.meshgrid(np.linspace(0, 1, 41), np.linspace(0, 1, 41))
+    u, v = u[u + v <= 1], v[u + v <= 1]
+    samples = (t[:, None, 0] + u[:, None] * (t[:, None, 1] - t[:, None, 0]) +
+               v[:, None] * (t[:, None, 2] - t[:, None, 0]))
+    sampled = np.linalg.norm(samples - p[:, None], axis=2).min(axis=1)
+    assert (d <= sampled + 1e-9).all()
+
+def test_closest_matches_brute_force(tree, tris, points):
+    on, distance, tri = tree.closest(points)
+    p, t = pairs(points, tris)
+    brute = np.linalg.norm(p - bvh.closest_on_triangles(p, t), axis=1)
+    brute = brute.reshape(len(points), -1)
+    np.testing.assert_allclose(distance, brute.min(axis=1), atol=1e-9)
+    # tri is a nearest triangle of the original mesh, and on is on it
+    np.testing.assert_allclose(brute[np.arange(len(points)), tri], distance,
+                               atol=1e-9)
+    np.testing.assert_allclose(np.linalg.norm(points - on, axis=1), distance)
+
+def test_ray_cast_matches_brute_force(tree, tris, points):
+    directions = np.random.default_rng(3).normal(size=points.shape)
+    t, tri = tree.ray_cast(points, directions)
+    o, tt = pairs(points, tris)
+    d = np.repeat(directions, len(tris), axis=0)
+    brute = bvh.intersect(o, d, tt).reshape(len(points), -1).min(axis=1)
+    np.testing.assert_allclose(t, brute)
+    assert ((tri >= 0) == np.isfinite(brute)).all()
+
+def test_inside_matches_winding_number(tree, tris, points):
+    # leave out the points on the surface, where neither is defined
+    clear = tree.closest(points)[1] > 1e-6
+    assert clear.sum() >= 300
+    w = winding_number(points, tris)
+    assert (np.abs(w[clear] - np.round(w[clear])) < 1e-6).all()
+    np.testing.assert_array_equal(tree.inside(points)[clear], w[clear] > 0.5)
+
+def test_signed_distance(tree, points):
+    on, distance, tri = tree.closest(points)
+    signed = tree.signed_distance(points)
+    np.testing.assert_allclose(np.abs(signed), distance)
+    np.testing.assert_array_equal(signed < 0, tree.inside(points) &
+                                  (distance > 0))
+
+def test_small_leaves_and_saved_tree(tree, tris, points, tmp_path):
+    # the same answers however the tree is split, and after a round trip
+    # through a file
+    small = bvh.BVH(tris, leaf_size=1)
+    np.testing.assert_allclose(small.closest(points)[1],
+                               tree.closest(points)[1])
+    tree.save(str(tmp_path / 'tree.npz'))
+    loaded = bvh.BVH.load(str(tmp_path / 'tree.npz'))
+    np.testing.assert_array_equal(loaded.inside(points), tree.inside(points))
+    np.testing.assert_array_equal(loaded.closest(points)[2],
+                                  tree.closest(points)[2])
+
+def test_every_triangle_in_one_leaf(tree, tris):
+    # the leaves cover the mesh exactly once
+    leaves = tree.count > 0
+    covered = np.concatenate([
+        np.arange(f, f + c) for f, c in zip(tree.first[leaves],
+                                            tree.count[leaves])])
+    np.testing.assert_array_equal(np.sort(covered), np.arange(len(tris)))
+    np.testing.assert_array_equal(np.sort(tree.order), np.arange(len(tris)))
+    np.testing.assert_array_equal(tree.tris, tris[tree.order])
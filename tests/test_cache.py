@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from conftest import ROOT
+
+cq = pytest.importorskip('cadquery')
+
+import build
+from cache import as_shape, import_step
+from fingerprints import changes, fingerprint
+
+def test_shared_shapes_survive_a_build(monkeypatch):
+    # each run of casemod builds its top from the imported case model,
+    # which stays in cache.import_step's table; the second run must give
+    # the same top as the first
+    monkeypatch.chdir(ROOT)
+    path = os.path.join(ROOT, 'casemod.py')
+    first = fingerprint(as_shape(build.load_script(path)['make_case_top']()))
+    second = fingerprint(as_shape(build.load_script(path)['make_case_top']()))
+    assert changes(first, second) == []
+    for solid in import_step('Armadillonium_Model.step').findSolid().Solids():
+        assert solid.isValid()
+
+def test_cadquery_is_left_alone():
+    # importing the cache doesn't change how cadquery's booleans behave
+    assert cq.Shape.clean.__module__.startswith('cadquery')
+    assert cq.Shape._bool_op.__module__.startswith('cadquery')
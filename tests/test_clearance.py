@@ -0,0 +1,23 @@
+import pytest
+
+cq = pytest.importorskip('cadquery')
+
+import clearance
+
+def box(size, x=0):
+    return cq.Solid.makeBox(size, size, size,
+                            cq.Vector(x - size / 2, -size / 2, -size / 2))
+
+def test_overlap_of_nested_and_separate_solids():
+    # one solid of the part inside the other part, one clear of it
+    part = cq.Compound.makeCompound([box(1), box(1, 10)])
+    case = box(4)
+    assert clearance.overlap(part, case, 1.5, 1e-4) == pytest.approx(1)
+    assert clearance.overlap(case, part, 1.5, 1e-4) == pytest.approx(1)
+
+def test_overlap_of_touching_parts():
+    part = cq.Compound.makeCompound([box(2, 1), box(1, 10)])
+    assert clearance.overlap(part, box(2), 0, 1e-4) == pytest.approx(4)
+
+def test_no_overlap():
+    assert clearance.overlap(box(1), box(1, 3), 2, 1e-4) == 0
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+cq = pytest.importorskip('cadquery')
+
+import fingerprints
+
+def box(x=0):
+    return cq.Workplane().box(2, 2, 2).translate((x, 0, 0)).val()
+
+def test_same_shape_no_changes():
+    assert fingerprints.changes(fingerprints.fingerprint(box()),
+                                fingerprints.fingerprint(box())) == []
+
+def test_moved_shape():
+    found = fingerprints.changes(fingerprints.fingerprint(box()),
+                                 fingerprints.fingerprint(box(0.01)))
+    assert found == ['centre of mass moved 0.010 mm', 'vertices moved']
+
+def test_within_tolerance():
+    old = fingerprints.fingerprint(box())
+    new = fingerprints.fingerprint(box(fingerprints.LENGTH_TOL / 10))
+    assert fingerprints.changes(old, new) == []
+
+def test_mirrored_pinwheel():
+    # four notches turning one way or the other: the same mass properties,
+    # so only the vertices tell them apart
+    def pinwheel(turn):
+        shape = cq.Workplane().box(4, 4, 1)
+        for x, y in [(1.5, 0.5), (-0.5, 1.5), (-1.5, -0.5), (0.5, -1.5)]:
+            shape = shape.cut(cq.Workplane().box(1, 1, 1)
+                              .translate((turn * x, y, 0)))
+        return shape.val()
+    found = fingerprints.changes(fingerprints.fingerprint(pinwheel(1)),
+                                 fingerprints.fingerprint(pinwheel(-1)))
+    assert found == ['vertices moved']
+
+def test_changes_lists_everything():
+    old = fingerprints.fingerprint(box())
+    new = dict(old, volume=old['volume'] * 2, area=old['area'] + 1,
+               inertia=[[2 * x for x in row] for row in old['inertia']])
+    found = fingerprints.changes(old, new)
+    assert [f.split()[0] for f in found] == ['volume', 'area', 'inertia']
+
+def test_record_round_trip(tmp_path):
+    assert fingerprints.load(str(tmp_path)) == {'parts': {}, 'files': {}}
+    record = {'parts': {'cube': fingerprints.fingerprint(box())},
+              'files': {}}
+    fingerprints.save(str(tmp_path), record)
+    loaded = fingerprints.load(str(tmp_path))
+    assert fingerprints.changes(record['parts']['cube'],
+                                loaded['parts']['cube']) == []
+
+def test_fresh(tmp_path):
+    fname = tmp_path / 'cube.stl'
+    fname.write_bytes(b'one')
+    record = {'files': {'cube.stl': fingerprints.stamp(str(fname),
+                                                       ['stl', 0.1])}}
+    assert fingerprints.fresh(record, str(fname), ['stl', 0.1])
+    # written with other settings
+    assert not fingerprints.fresh(record, str(fname), ['stl', 0.05])
+    # never recorded
+    assert not fingerprints.fresh(record, str(tmp_path / 'other.stl'),
+                                  ['stl', 0.1])
+    # replaced by hand
+    fname.write_bytes(b'other')
+    assert not fingerprints.fresh(record, str(fname), ['stl', 0.1])
+    # deleted
+    os.remove(str(fname))
+    assert not fingerprints.fresh(record, str(fname), ['stl', 0.1])
@@ -0,0 +1,27 @@
+import pytest
+
+cq = pytest.importorskip('cadquery')
+
+from graph import Graph
+
+plate = cq.Workplane().box(4, 4, 1)
+size = 2
+
+def make_post():
+    return cq.Workplane().box(1, 1, size)
+
+def make_plate_with_post():
+    # reads a shape which isn't a node, so would go stale when it changed
+    return plate.union(make_post())
+
+def test_key_covers_dimensions():
+    graph = Graph('test')
+    graph.add('post', make_post)
+    graph.key('post')
+    assert graph.params['post']['size'] == '2'
+
+def test_unkeyed_shape_is_an_error():
+    graph = Graph('test')
+    graph.add('plate', make_plate_with_post)
+    with pytest.raises(ValueError, match='plate'):
+        graph.key('plate')
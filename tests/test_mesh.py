@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ROOT
+import mesh
+import stlio
+
+BUTTON = os.path.join(ROOT, 'Armadillonium_Button.stl')
+
+def cube(size=1):
+    # a closed, outward facing cube as (vertices, faces)
+    vertices = np.array([[x, y, z] for x in (0, size) for y in (0, size)
+                         for z in (0, size)], np.float64)
+    faces = np.array([
+        [0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5], [0, 4, 5], [0, 5, 1],
+        [2, 3, 7], [2, 7, 6], [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]])
+    return vertices, faces
+
+def test_weld_counts():
+    # a closed mesh with no handles: V - E + F == 2, and every edge is
+    # shared by two triangles
+    vertices, faces = mesh.weld(stlio.read(BUTTON)['vertices'])
+    assert (len(vertices), len(faces)) == (716, 1428)
+    assert mesh.open_edges(faces) == 0
+    assert len(vertices) - len(faces) * 3 // 2 + len(faces) == 2
+
+def test_weld_drops_collapsed_triangles():
+    tris = np.array([[[0, 0, 0], [1, 0, 0], [0, 1, 0]],
+                     [[0, 0, 0], [1, 0, 0], [1, mesh.WELD_TOL / 4, 0]]])
+    vertices, faces = mesh.weld(tris)
+    assert (len(vertices), len(faces)) == (3, 1)
+
+def test_cube_volume_and_area():
+    vertices, faces = cube(2)
+    assert mesh.volume(vertices[faces]) == pytest.approx(8)
+    assert mesh.area(vertices[faces]) == pytest.approx(24)
+    assert mesh.open_edges(faces) == 0
+
+def test_stl_round_trip(tmp_path):
+    vertices, faces = cube(2)
+    fname = str(tmp_path / 'cube.stl')
+    stlio.write(fname, vertices, faces)
+    data = stlio.read(fname)
+    np.testing.assert_array_equal(data['vertices'], vertices[faces])
+    np.testing.assert_allclose(data['normal'],
+                               stlio.normals(vertices[faces]))
+
+def test_3mf_round_trip(tmp_path):
+    vertices, faces = mesh.weld(stlio.read(BUTTON)['vertices'])
+    fname = str(tmp_path / 'button.3mf')
+    mesh.write_3mf(fname, vertices, faces)
+    np.testing.assert_allclose(mesh.read(fname), vertices[faces],
+                               rtol=1e-6, atol=1e-6)
+
+def test_3mf_transforms(tmp_path):
+    # an item scaled by its transform, made of a component moved by its own
+    vertices, faces = cube(1)
+    fname = str(tmp_path / 'moved.3mf')
+    mesh.write_3mf_model(
+        fname, '<object id="1" type="model">%s</object>\n'
+        '<object id="2" type="model"><components>'
+        '<component objectid="1" transform="1 0 0 0 1 0 0 0 1 5 0 0"/>'
+        '</components></object>\n' % mesh.mesh_xml(vertices, faces),
+        '<item objectid="2" transform="2 0 0 0 2 0 0 0 2 0 0 0"/>\n')
+    tris = mesh.read_3mf(fname)
+    assert mesh.volume(tris) == pytest.approx(8)
+    assert tris[..., 0].min() == pytest.approx(10)
+
+def test_read_rejects_other_formats(tmp_path):
+    vertices, faces = cube(1)
+    fname = str(tmp_path / 'cube.ply')
+    mesh.write_ply(fname, vertices, faces)
+    with pytest.raises(ValueError, match='only STL and 3MF'):
+        mesh.read(fname)
+    # not binary STL, and not ASCII either
+    stl = tmp_path / 'cube.stl'
+    stl.write_bytes(open(fname, 'rb').read())
+    with pytest.raises(ValueError, match='not an STL file'):
+        mesh.read(str(stl))
+
+def test_info_open_edges_per_object(tmp_path, capsys):
+    # two closed cubes sharing a face: welded together, the edges of that
+    # face have four triangles each
+    vertices, faces = cube(1)
+    fname = str(tmp_path / 'assembly.3mf')
+    mesh.write_3mf_model(
+        fname, '<object id="1" type="model">%s</object>\n'
+        % mesh.mesh_xml(vertices, faces),
+        '<item objectid="1"/>\n'
+        '<item objectid="1" transform="1 0 0 0 1 0 0 0 1 1 0 0"/>\n')
+    assert [len(t) for t in mesh.read_3mf(fname, items=True)] == [12, 12]
+    assert mesh.open_edges(mesh.weld(mesh.read(fname))[1]) > 0
+    mesh.info_main([fname])
+    out = capsys.readouterr().out
+    assert '24 triangles' in out and 'open edges' not in out
@@ -0,0 +1,194 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+import mesh
+import stlio
+from bvh import BVH
+from quality import DEFAULT_QUALITY, QUALITY
+
+# Wall thickness check for printing and machining.
+#
+# From the centre of every triangle of a part's mesh a ray is cast
+# inwards, against the face's normal, and the distance to where it comes
+# out of the part again is that triangle's wall thickness.  The rays are
+# all traced together through a BVH of the mesh (see bvh.py).  Triangles
+# thinner than the material allows are grouped into connected regions,
+# which are listed from thinnest; the whole map goes to a PLY file with
+# the thickness of each face, coloured red (too thin) through yellow to
+# green (at least twice the minimum).
+#
+# Only the far side of an actual wall counts: a ray which comes out
+# through a face at more than WALL_ANGLE to its own has crossed the
+# corner between two sides of the part, or some overlap in the mesh,
+# and isn't flagged however short it is.  Nor are regions smaller than
+# MIN_AREA, which are usually a couple of slivers along a fillet.
+#
+#   python thickness.py -m pa12 casemod.py
+#   python thickness.py -m al6061 build/casemod/bottom.stl
+#
+# A script is built and tessellated first (only the parts listed in
+# PARTS below, if it's there); STL and 3MF files are checked as they are,
+# without loading cadquery at all.
+
+# material -> (minimum wall in mm, what it is)
+MATERIALS = {
+    'pa12': (0.8, 'SLS nylon PA12'),
+    'al6061': (0.8, 'CNC aluminium 6061'),
+}
+DEFAULT_MATERIAL = 'pa12'
+
+# script -> the parts which actually get made; the rest are bought
+PARTS = {
+    'casemod.py': ['top', 'bottom', 'buttons'],
+    'gotchi.py': ['case2', 'lugs', 'top_plate'],
+}
+
+RAY_OFFSET = 1e-3 # mm; start rays this far inside, so they miss their face
+WALL_ANGLE = 45 # degrees
+MIN_AREA = 0.05 # mm^2
+TOL = 0.01 # mm; a wall of exactly the minimum passes
+SHOW_REGIONS = 10 # per part
+
+def regions(faces, mask):
+    # label of the connected group (sharing a vertex) of each face in mask,
+    # or -1; labels are numbered from 0
+    labels = np.full(len(faces), -1)
+    idx = np.nonzero(mask)[0]
+    if not len(idx):
+        return labels
+    f = faces[idx]
+    # every vertex ends up pointing at the lowest vertex of its group
+    parent = np.arange(faces.max() + 1)
+    while True:
+        new = parent.copy()
+        np.minimum.at(new, f.ravel(), np.repeat(parent[f].min(axis=1), 3))
+        new = new[new]
+        if np.array_equal(new, parent):
+            break
+        parent = new
+    labels[idx] = np.unique(parent[f[:, 0]], return_inverse=True)[1]
+    return labels
+
+def analyze(tris, minimum, min_area=MIN_AREA):
+    # returns the welded mesh, the thickness of each of its faces (inf for
+    # rays which never come out again: the mesh isn't closed), which of
+    # those are walls, and the thin regions as (faces, area, thinnest,
+    # where) from thinnest
+    vertices, faces = mesh.weld(tris)
+    tris = vertices[faces].astype(np.float64)
+    normals = stlio.normals(tris)
+    centers = tris.mean(axis=1)
+    t, hit = BVH(tris).ray_cast(centers - RAY_OFFSET * normals, -normals)
+    thickness = t + RAY_OFFSET
+    wall = np.einsum('ij,ij->i', normals, normals[hit]) < \
+        -np.cos(np.radians(WALL_ANGLE))
+    wall &= hit >= 0
+    labels = regions(faces, (thickness < minimum - TOL) & wall)
+    areas = np.linalg.norm(np.cross(tris[:, 1] - tris[:, 0],
+                                    tris[:, 2] - tris[:, 0]), axis=1) / 2
+    found = []
+    for label in range(labels.max() + 1):
+        idx = np.nonzero(labels == label)[0]
+        if areas[idx].sum() < min_area:
+            continue
+        thinnest = idx[np.argmin(thickness[idx])]
+        found.append((len(idx), areas[idx].sum(), thickness[thinnest],
+                      centers[thinnest]))
+    found.sort(key=lambda r: r[2])
+    return vertices, faces, thickness, wall, found
+
+def colors(thickness, minimum):
+    # red below minimum, then yellow to green at twice it; grey for holes
+    c = np.zeros((len(thickness), 3))
+    x = np.clip((thickness - minimum) / minimum, 0, 1)
+    c[:, 0] = np.where(x < 0.5, 1, 2 - 2 * x)
+    c[:, 1] = np.where(x < 0.5, 2 * x, 1)
+    c[thickness < minimum] = (1, 0, 0)
+    c[~np.isfinite(thickness)] = (0.5, 0.5, 0.5)
+    return np.round(255 * c).astype(np.uint8)
+
+def write_map(fname, vertices, faces, thickness, minimum):
+    data = np.zeros(len(faces), [('red', 'u1'), ('green', 'u1'),
+                                 ('blue', 'u1'), ('thickness', '<f4')])
+    rgb = colors(thickness, minimum)
+    data['red'], data['green'], data['blue'] = rgb.T
+    data['thickness'] = np.where(np.isfinite(thickness), thickness, -1)
+    mesh.write_ply(fname, vertices, faces, data)
+
+def script_meshes(path, quality):
+    # (name, triangles) of the parts a script shows
+    import build
+    import tessellate
+    wanted = PARTS.get(os.path.basename(path))
+    for name, obj, seconds in build.run_script(path):
+        if wanted is None or name in wanted:
+            vertices, faces = tessellate.tessellate(obj, quality)
+            yield name, vertices[faces]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Find walls which are too thin to make.')
+    parser.add_argument('inputs', nargs='+',
+                        metavar='script.py|mesh.stl|mesh.3mf')
+    parser.add_argument('-m', '--material', default=DEFAULT_MATERIAL,
+                        choices=sorted(MATERIALS),
+                        help='sets the minimum wall (default: %s)'
+                        % DEFAULT_MATERIAL)
+    parser.add_argument('--min', type=float,
+                        help='minimum wall in mm, instead of the material\'s')
+    parser.add_argument('--min-area', type=float, default=MIN_AREA,
+                        help='ignore thin regions smaller than this many '
+                        'mm^2 (default: %g)' % MIN_AREA)
+    parser.add_argument('-q', '--quality', default=DEFAULT_QUALITY,
+                        choices=list(QUALITY),
+                        help='mesh quality for scripts (default: %s)'
+                        % DEFAULT_QUALITY)
+    parser.add_argument('-o', '--outdir', default='build/thickness',
+                        help='where to write the thickness maps '
+                        '(default: build/thickness)')
+    args = parser.parse_args(argv)
+    minimum, material = MATERIALS[args.material]
+    if args.min is not None:
+        minimum = args.min
+    print('minimum wall %.2f mm (%s)' % (minimum, material))
+    os.makedirs(args.outdir, exist_ok=True)
+    failed = False
+    for path in args.inputs:
+        prefix = os.path.splitext(os.path.basename(path))[0]
+        if path.endswith('.py'):
+            parts = script_meshes(path, args.quality)
+        else:
+            parts = [(prefix, mesh.read(path))]
+            prefix = None
+        for name, tris in parts:
+            start = time.perf_counter()
+            vertices, faces, thickness, wall, found = analyze(
+                tris, minimum, args.min_area)
+            seconds = time.perf_counter() - start
+            label = name if prefix is None else '%s/%s' % (prefix, name)
+            write_map(os.path.join(args.outdir, label.replace('/', '_') +
+                                   '.ply'), vertices, faces, thickness,
+                      minimum)
+            escaped = np.count_nonzero(~np.isfinite(thickness))
+            print('%-24s %7d triangles %6.2fs  thinnest wall %s  %d thin '
+                  'region%s%s' % (
+                  label, len(faces), seconds,
+                  '%.2f mm' % thickness[wall].min() if wall.any() else '-',
+                  len(found), '' if len(found) == 1 else 's',
+                  '  (%d rays escaped: not closed?)' % escaped
+                  if escaped else ''))
+            for count, area, thinnest, where in found[:SHOW_REGIONS]:
+                print('    %5.2f mm  %8.2f mm^2  %5d triangles  at %s' % (
+                    thinnest, area, count,
+                    ' '.join('%.2f' % x for x in where)))
+            if len(found) > SHOW_REGIONS:
+                print('    ... and %d more' % (len(found) - SHOW_REGIONS))
+            failed = failed or bool(found)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import time
+START = time.perf_counter() # before anything else is imported
+
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+# One command for all the tools, which starts as fast as each one can.
+#
+# Importing cadquery (and OCCT under it) takes seconds before any work is
+# done, which is most of the time taken to look at an STL.  So nothing
+# here imports it: each subcommand imports only its own module, and the
+# mesh tools (mesh.py, stlio.py, bvh.py, thickness.py on meshes) are
+# plain NumPy, with their cache entries kept by store.py rather than
+# cache.py.  Subcommands which build B-reps load cadquery when they start
+# to, as before; thickness.py only does for scripts.
+#
+#   python tools.py info Watchy.stl Armadillonium_Bottom-4.3mf
+#   python tools.py mesh Armadillonium_Top.stl -f 3mf
+#   python tools.py build gotchi.py -f stl
+#   python tools.py startup            # how long each one takes to start
+#
+# `startup` runs each subcommand's start in a fresh interpreter, up to
+# where it would begin work (with cadquery imported, for those which need
+# it), and reports the time and whether the CAD kernel was loaded.
+
+# subcommand -> (module, function, needs cadquery, what it does)
+COMMANDS = {
+    'info': ('mesh', 'info_main', False,
+             'size, area and volume of STL and 3MF meshes'),
+    'stl': ('stlio', 'main', False, 'read STL files, and time it'),
+    'mesh': ('mesh', 'main', False,
+             'weld meshes and convert them to PLY, OBJ, 3MF or STL'),
+    'bvh': ('bvh', 'main', False, 'index meshes, and time queries'),
+    'thickness': ('thickness', 'main', False,
+                  'find walls too thin to make (scripts need cadquery)'),
+    'build': ('build', 'main', True, 'build and export the case scripts'),
+    'watch': ('watch', 'main', True, 'rebuild the scripts when saved'),
+    'clearance': ('clearance', 'main', True,
+                  'check the gaps between parts'),
+    'sweep': ('sweep', 'main', True, 'build a script over ranges of sizes'),
+    'bench': ('bench', 'main', False,
+              'benchmark regeneration (builds in subprocesses)'),
+    'standin': ('standin', 'main', True,
+                'make stand-in STEP models from the Watchy meshes'),
+}
+
+CAD_MODULES = ('cadquery', 'OCP')
+
+def startup_child(command):
+    # runs in the measuring subprocess; report on the last line of stdout
+    module, function, cad, _ = COMMANDS[command]
+    getattr(importlib.import_module(module), function)
+    if cad:
+        import cadquery
+    print(json.dumps({
+        'seconds': time.perf_counter() - START,
+        'modules': len(sys.modules),
+        'cad': any(m in sys.modules for m in CAD_MODULES),
+    }))
+
+def startup(commands, reps):
+    # best of reps, so the first run's cold disk cache doesn't count
+    print('%-10s %8s %8s %8s  %s' % (
+        'command', 'process', 'imports', 'modules', 'cadquery'))
+    for command in commands:
+        runs = []
+        for i in range(reps):
+            start = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__),
+                 '--startup-child', command],
+                check=True, stdout=subprocess.PIPE, text=True).stdout
+            wall = time.perf_counter() - start
+            runs.append((wall, json.loads(out.strip().splitlines()[-1])))
+        wall, child = min(runs, key=lambda r: r[0])
+        print('%-10s %7.3fs %7.3fs %8d  %s' % (
+            command, wall, child['seconds'], child['modules'],
+            'loaded' if child['cad'] else '-'))
+
+def usage():
+    lines = ['usage: tools.py command [args...]  (command -h for its options)',
+             '', 'commands:']
+    for command, (module, function, cad, about) in COMMANDS.items():
+        lines.append('  %-10s %s' % (command, about))
+    lines.append('  %-10s %s' % (
+        'startup', 'time how long each command takes to start; '
+        '[-n reps] [command...]'))
+    return '\n'.join(lines)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0 if argv else 2
+    command, args = argv[0], argv[1:]
+    if command == '--startup-child':
+        return startup_child(args[0])
+    if command == 'startup':
+        reps = 3
+        if args[:1] == ['-n']:
+            reps, args = int(args[1]), args[2:]
+        unknown = [c for c in args if c not in COMMANDS]
+        if unknown:
+            print('unknown command: %s' % ' '.join(unknown), file=sys.stderr)
+            return 2
+        return startup(args or list(COMMANDS), reps)
+    if command not in COMMANDS:
+        print('unknown command: %s\n\n%s' % (command, usage()),
+              file=sys.stderr)
+        return 2
+    module, function, cad, _ = COMMANDS[command]
+    return getattr(importlib.import_module(module), function)(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import argparse
+import ast
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import build
+
+# Warm rebuilds while editing.
+#
+# Every run of build.py starts by importing cadquery and OCCT and loading
+# the reference STEP models, before any geometry changes.  watch.py does
+# that once and keeps it: it builds the scripts, then watches them and the
+# helper modules they import (watchy_sizes.py, bat.py, ...), and when one
+# is saved rebuilds just the scripts which depend on it and rewrites the
+# exports of the parts which changed (see fingerprints.py).  Viewers which
+# reload files as they change (f3d --watch, the slicers' reload) then show
+# the new parts; exports are renamed into place (see build.export), so
+# they never load a half written file.
+#
+#   python watch.py gotchi.py casemod.py -f stl --preview
+#
+# Each build runs in a forked child: it inherits the imports and the
+# parsed models, and nothing one build leaves behind can affect the next.
+# The child imports the scripts' own modules afresh, so it always sees
+# what was saved.  Within the script, the Graph and @memoize caches leave
+# only the geometry which depends on the change to be rebuilt.  A change
+# to the build machinery itself (build.py, cache.py, ...) restarts the
+# watcher.
+
+POLL = 0.25 # seconds between looks at the files
+SETTLE = 0.1 # seconds the files must be left alone before building
+
+def local_imports(path, found=None):
+    # path and the modules next to it which it imports, and so on
+    if found is None:
+        found = set()
+    path = os.path.abspath(path)
+    if path in found or not os.path.exists(path):
+        return found
+    found.add(path)
+    with open(path) as f:
+        source = f.read()
+    try:
+        tree = ast.parse(source, path)
+    except SyntaxError:
+        return found # it'll be read again once it's fixed
+    d = os.path.dirname(path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and \
+                not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            local_imports(os.path.join(d, name.split('.')[0] + '.py'), found)
+    return found
+
+def stamps(paths):
+    stamps = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps[path] = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamps[path] = None # being replaced by an editor
+    return stamps
+
+def loaded_here():
+    # the modules next to this one which the watcher itself runs
+    d = os.path.dirname(os.path.abspath(__file__))
+    return {os.path.abspath(m.__file__) for m in list(sys.modules.values())
+            if getattr(m, '__file__', None) and
+            os.path.dirname(os.path.abspath(m.__file__)) == d}
+
+def step_files(paths):
+    # the STEP files named in the scripts' sources
+    found = set()
+    for path in paths:
+        d = os.path.dirname(path)
+        with open(path) as f:
+            source = f.read()
+        for name in re.findall(r'''['"]([\w./-]+\.step)['"]''', source):
+            if os.path.exists(os.path.join(d, name)):
+                found.add(os.path.join(d, name))
+    return sorted(found)
+
+def preload(paths):
+    # parse the reference models into cache.import_step's table, which
+    # every child inherits
+    import cache
+    for fname in step_files(paths):
+        start = time.perf_counter()
+        cache.import_step(fname)
+        print('loaded %s in %.2fs' % (os.path.basename(fname),
+                                      time.perf_counter() - start))
+
+def _build(script, args):
+    build.build_script(script, args)
+
+def rebuild(script, args):
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context('fork')
+    child = ctx.Process(target=_build, args=(script, args))
+    child.start()
+    child.join()
+    print('%s %s in %.2fs' % (
+        os.path.basename(script),
+        'rebuilt' if child.exitcode == 0 else 'FAILED',
+        time.perf_counter() - start))
+    sys.stdout.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Rebuild the case scripts whenever they are saved.')
+    parser.add_argument('scripts', nargs='+', metavar='script.py')
+    build.add_options(parser)
+    parser.add_argument('--no-preload', action='store_true',
+                        help='don\'t load the STEP models the scripts name '
+                        'up front; they are loaded by each build instead')
+    args = parser.parse_args(argv)
+    build.check_options(parser, args)
+    scripts = [os.path.abspath(s) for s in args.scripts]
+    args.outdir = os.path.abspath(args.outdir)
+
+    start = time.perf_counter()
+    # the slow imports, done once for all the builds
+    import cadquery
+    import tessellate
+    if args.assembly:
+        import export3mf
+    if not (args.no_preload or args.preview):
+        # (previews only read the models' bounding boxes, which are cached)
+        preload(set().union(*(local_imports(s) for s in scripts)))
+    print('warm in %.2fs' % (time.perf_counter() - start))
+    machinery = loaded_here()
+
+    deps = {s: local_imports(s) for s in scripts}
+    seen = stamps(set().union(*deps.values()) | machinery)
+    for script in scripts:
+        rebuild(script, args)
+    print('watching %s' % ', '.join(os.path.basename(s) for s in scripts))
+    while True:
+        time.sleep(POLL)
+        now = stamps(seen)
+        changed = {path for path in now if now[path] != seen[path]}
+        if not changed:
+            continue
+        # let the editor finish saving
+        while True:
+            time.sleep(SETTLE)
+            later = stamps(seen)
+            if later == now:
+                break
+            now = later
+        seen = now
+        print('changed: %s' % ', '.join(
+            sorted(os.path.basename(p) for p in changed)))
+        if changed & machinery:
+            print('restarting')
+            sys.stdout.flush()
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+        for script in scripts:
+            if changed & deps[script]:
+                rebuild(script, args)
+                # the script may import something new now
+                deps[script] = local_imports(script)
+                seen.update(stamps(deps[script] - set(seen)))
+        print('watching')
+
+if __name__ == '__main__':
+    main()